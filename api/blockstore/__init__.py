@@ -0,0 +1,80 @@
+import atexit
+from django.conf import settings
+from .flatfile import FlatFileStore, CorruptRecord, RECORD_HEADER, DEFAULT_SEGMENT_SIZE, DEFAULT_FSYNC_EVERY
+from .archive import BlockArchive, DEFAULT_CHUNK_SIZE
+from .encoding import encode_body, decode_body, body_size, is_encoded_body, COMPRESSIONS, FORMAT_VERSION
+from .chainfile import ChainFileReader, ChainFileError, chain_preamble, block_record, chain_trailer, CHAIN_MAGIC, CHAIN_FORMAT_VERSION
+
+_stores = {}
+_archives = {}
+
+def flat_file_bodies() -> bool:
+    """Whether new block bodies are written to the flat-file store (``BLOCK_STORE = "flatfile"``)."""
+    return getattr(settings, 'BLOCK_STORE', 'database') == 'flatfile'
+
+def binary_bodies() -> bool:
+    """Whether new block bodies are written in the binary encoding (``BLOCK_ENCODING = "binary"``)."""
+    return getattr(settings, 'BLOCK_ENCODING', 'json') == 'binary'
+
+def body_compression() -> str:
+    """Compression applied to binary bodies (``BLOCK_COMPRESSION``), ``"auto"`` picking the smallest per block."""
+    return getattr(settings, 'BLOCK_COMPRESSION', 'auto')
+
+def get_block_store() -> FlatFileStore:
+    """The flat-file store at ``BLOCK_STORE_PATH``, opened and recovered once per process."""
+    path = str(settings.BLOCK_STORE_PATH)
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = FlatFileStore(
+            path,
+            segment_size=getattr(settings, 'BLOCK_STORE_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE),
+            fsync_every=getattr(settings, 'BLOCK_STORE_FSYNC_EVERY', DEFAULT_FSYNC_EVERY),
+        )
+        atexit.register(store.sync)
+    return store
+
+def get_block_archive() -> BlockArchive:
+    """The archive of pruned block bodies at ``BLOCK_ARCHIVE_PATH``, one per process."""
+    path = str(settings.BLOCK_ARCHIVE_PATH)
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = BlockArchive(path)
+    return archive
+
+def archive_chunk_size() -> int:
+    return getattr(settings, 'BLOCK_ARCHIVE_CHUNK', DEFAULT_CHUNK_SIZE)
+
+def sync_block_store():
+    """Flush the batch of bodies written so far, a no-op while bodies stay in the database."""
+    if flat_file_bodies():
+        get_block_store().sync()
+
+__all__ = [
+    "FlatFileStore",
+    "BlockArchive",
+    "CorruptRecord",
+    "RECORD_HEADER",
+    "DEFAULT_SEGMENT_SIZE",
+    "DEFAULT_FSYNC_EVERY",
+    "DEFAULT_CHUNK_SIZE",
+    "encode_body",
+    "decode_body",
+    "body_size",
+    "is_encoded_body",
+    "COMPRESSIONS",
+    "FORMAT_VERSION",
+    "ChainFileReader",
+    "ChainFileError",
+    "chain_preamble",
+    "block_record",
+    "chain_trailer",
+    "CHAIN_MAGIC",
+    "CHAIN_FORMAT_VERSION",
+    "flat_file_bodies",
+    "binary_bodies",
+    "body_compression",
+    "get_block_store",
+    "get_block_archive",
+    "archive_chunk_size",
+    "sync_block_store",
+]
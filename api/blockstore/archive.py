@@ -0,0 +1,122 @@
+import lzma, os, zlib
+from collections import OrderedDict
+from .flatfile import RECORD_HEADER, CorruptRecord
+
+ARCHIVE_NAME = "{:010d}.xz"
+# Later writes of a chunk are numbered, the unnumbered name is the first one of older archives.
+GENERATION_NAME = "{:010d}.{}.xz"
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CACHED_CHUNKS = 8
+
+class BlockArchive:
+    """
+    Cold storage for the bodies of pruned blocks.
+
+    Every chunk of ``chunk_size`` consecutive heights of a chain is one
+    xz-compressed file, named after its first height, holding the bodies as
+    the flat-file store frames them: length and CRC-32, then the body.
+    Blocks keep the chunk, the generation of its file and their offset in
+    the decompressed stream.
+
+    Rewriting a chunk never touches the file blocks point at: it goes to a
+    new generation, and the old one is only removed once the database
+    points at the new one, so a transaction that rolls back leaves readers
+    the file its rows still name.
+
+    A read decompresses the whole chunk, and the last ``cached_chunks`` are
+    kept in memory, so walking an archived stretch of the chain decompresses
+    each file once.
+    """
+
+    def __init__(self, path: str, cached_chunks: int = DEFAULT_CACHED_CHUNKS):
+        self.path = str(path)
+        self.cached_chunks = max(cached_chunks, 1)
+        self._cache = OrderedDict()
+
+    def chunk_path(self, blockchain_id, chunk: int, generation: int | None = None) -> str:
+        name = ARCHIVE_NAME.format(chunk) if generation is None else GENERATION_NAME.format(chunk, generation)
+        return os.path.join(self.path, str(blockchain_id), name)
+
+    def generations(self, blockchain_id, chunk: int) -> list[int | None]:
+        """Generations of a chunk's file on disk, None for the unnumbered one."""
+        directory = os.path.join(self.path, str(blockchain_id))
+        if not os.path.isdir(directory):
+            return []
+        prefix, found = ARCHIVE_NAME.format(chunk)[:-2], []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(".xz"):
+                generation = name[len(prefix):-3]
+                if not generation:
+                    found.append(None)
+                elif generation.isdigit():
+                    found.append(int(generation))
+        return found
+
+    def write(self, blockchain_id, chunk: int, bodies: list[bytes]) -> tuple[int, list[int]]:
+        """
+        Write the bodies of a chunk to a new generation of its archive file.
+
+        Returns:
+            tuple: The generation written and the offset of every body in the decompressed chunk, in order.
+        """
+        stream, offsets = bytearray(), []
+        for body in bodies:
+            offsets.append(len(stream))
+            stream += RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+        os.makedirs(os.path.join(self.path, str(blockchain_id)), exist_ok=True)
+        generation = max((g for g in self.generations(blockchain_id, chunk) if g is not None), default=0) + 1
+        while True:
+            # No row names the new generation before the caller commits, so it can be written in place.
+            try:
+                file = open(self.chunk_path(blockchain_id, chunk, generation), 'xb')
+            except FileExistsError:
+                generation += 1
+                continue
+            with file:
+                file.write(lzma.compress(bytes(stream), preset=6))
+                file.flush()
+                os.fsync(file.fileno())
+            return generation, offsets
+
+    def read(self, blockchain_id, chunk: int, offset: int, generation: int | None = None) -> memoryview:
+        """The body stored at ``offset`` of a chunk."""
+        data = self._load(self.chunk_path(blockchain_id, chunk, generation))
+        if offset + RECORD_HEADER.size > len(data):
+            raise CorruptRecord(f"Archive chunk {chunk} ends before {offset}.")
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        body = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            raise CorruptRecord(f"Record at {chunk}:{offset} of the archive does not match its checksum.")
+        return body
+
+    def remove(self, blockchain_id, chunk: int, generation: int | None = None):
+        path = self.chunk_path(blockchain_id, chunk, generation)
+        self._cache.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def size(self, blockchain_id) -> int:
+        """Bytes the archive files of a chain take on disk."""
+        directory = os.path.join(self.path, str(blockchain_id))
+        if not os.path.isdir(directory):
+            return 0
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".xz"))
+
+    def _load(self, path: str) -> memoryview:
+        data = self._cache.get(path)
+        if data is not None:
+            self._cache.move_to_end(path)
+            return data
+        try:
+            with open(path, 'rb') as file:
+                data = memoryview(lzma.decompress(file.read()))
+        except FileNotFoundError:
+            raise CorruptRecord(f"Archive file {path} is missing.")
+        except lzma.LZMAError as e:
+            raise CorruptRecord(f"Archive file {path} is damaged: {e}")
+        self._cache[path] = data
+        if len(self._cache) > self.cached_chunks:
+            self._cache.popitem(last=False)
+        return data
@@ -0,0 +1,91 @@
+"""
+Length-prefixed binary chain files, for backups and bootstrapping nodes.
+
+A file is ``CHAIN_MAGIC``, the format version and a length-prefixed JSON
+object with the chain's parameters, then one record per block in height
+order: its length, the raw 80-byte header, the authority seal as two short
+length-prefixed strings, and the body exactly as it is stored (encoded
+bytes or JSON text). An empty record ends the blocks and is followed by the
+block count and the tip hash, so a truncated file is told apart from a
+short chain.
+"""
+import json, struct
+
+CHAIN_MAGIC = b"BRPCHAIN"
+CHAIN_FORMAT_VERSION = 1
+HEADER_SIZE = 80
+_LENGTH = struct.Struct('<I')
+_SHORT = struct.Struct('<H')
+_TRAILER = struct.Struct('<Q32s')
+
+class ChainFileError(ValueError):
+    """Raised when a stream is not a complete chain file."""
+
+def chain_preamble(params: dict) -> bytes:
+    """The start of a chain file: magic, version and the chain parameters."""
+    encoded = json.dumps(params, sort_keys=True, separators=(",", ":")).encode('utf-8')
+    return CHAIN_MAGIC + bytes((CHAIN_FORMAT_VERSION,)) + _LENGTH.pack(len(encoded)) + encoded
+
+def block_record(header: bytes, body: bytes, signer: str | None = None, signature: str | None = None) -> bytes:
+    """One block of a chain file."""
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Header must be {HEADER_SIZE} bytes, got {len(header)}.")
+    signer, signature = (signer or '').encode('utf-8'), (signature or '').encode('utf-8')
+    record = b"".join((header, _SHORT.pack(len(signer)), signer, _SHORT.pack(len(signature)), signature, body))
+    return _LENGTH.pack(len(record)) + record
+
+def chain_trailer(count: int, tip_hash: str | None) -> bytes:
+    """The end of a chain file, after the last block record."""
+    return _LENGTH.pack(0) + _TRAILER.pack(count, bytes.fromhex(tip_hash) if tip_hash else bytes(32))
+
+class ChainFileReader:
+    """
+    Reads a chain file from any object with ``read(size)``, a file or an HTTP body, one record at a time.
+
+    ``params`` is available once the reader is created; iterating yields
+    ``(header, signer, signature, body)`` and checks the trailer at the end.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        if self._read(len(CHAIN_MAGIC)) != CHAIN_MAGIC:
+            raise ChainFileError("Not a chain file.")
+        version = self._read(1)[0]
+        if version != CHAIN_FORMAT_VERSION:
+            raise ChainFileError(f"Unsupported chain file version {version}.")
+        (length,) = _LENGTH.unpack(self._read(_LENGTH.size))
+        self.params = json.loads(self._read(length))
+        self.count = 0
+        self.tip_hash = None
+
+    def __iter__(self):
+        while True:
+            (length,) = _LENGTH.unpack(self._read(_LENGTH.size))
+            if length == 0:
+                break
+            record = memoryview(self._read(length))
+            header = bytes(record[:HEADER_SIZE])
+            position = HEADER_SIZE
+            strings = []
+            for _ in range(2):
+                (size,) = _SHORT.unpack_from(record, position)
+                strings.append(str(record[position + _SHORT.size:position + _SHORT.size + size], 'utf-8') or None)
+                position += _SHORT.size + size
+            if position > length:
+                raise ChainFileError(f"Block record {self.count} is truncated.")
+            self.count += 1
+            yield header, strings[0], strings[1], bytes(record[position:])
+        count, tip_hash = _TRAILER.unpack(self._read(_TRAILER.size))
+        if count != self.count:
+            raise ChainFileError(f"The file ends after {self.count} blocks but declares {count}.")
+        self.tip_hash = tip_hash.hex() if count else None
+
+    def _read(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        # Sockets may return less than asked for, so short reads are completed.
+        while len(data) < size:
+            more = self.stream.read(size - len(data))
+            if not more:
+                raise ChainFileError("The chain file is truncated.")
+            data += more
+        return data
@@ -0,0 +1,242 @@
+"""
+Canonical binary encoding of block bodies.
+
+An encoded body is ``MAGIC``, the format version, the compression used for
+this block and the (possibly compressed) payload. Journals that follow the
+shape ``Block.journal_payload`` or ``Blockchain.delta_payload`` produce are
+written field by field, with txids, Merkle Roots and block hashes as raw
+32-byte values and UUID journal ids as 16 bytes; anything else, such as the genesis message, falls back to compact
+sorted JSON inside the same envelope. The same body always encodes to the
+same bytes for a given compression.
+"""
+import json, lzma, uuid, zlib
+
+MAGIC = b"\x00BB"
+FORMAT_VERSION = 1
+COMPRESSIONS = {"none": 0, "zlib": 1, "lzma": 2}
+# Raw LZMA2 without the .xz container, whose headers alone outweigh a small body, and a dictionary sized for one block.
+_LZMA_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 6, "dict_size": 1 << 20}]
+
+_KIND_JOURNAL, _KIND_PACKED, _KIND_JSON = 0, 1, 2
+_ACTIONS = ("modify", "delete")
+_JOURNAL_KEYS = ("action", "journal_id", "company", "period", "balance")
+_DELTA_KEYS = ("base", "depth", "size", "changes", "merkle_root")
+_FLAG_DELETE, _FLAG_UUID, _FLAG_ROOT, _FLAG_DELTA = 1, 2, 4, 8
+
+def is_encoded_body(raw: bytes | memoryview) -> bool:
+    """Whether stored bytes are an encoded body rather than legacy JSON text."""
+    return bytes(raw[:len(MAGIC)]) == MAGIC
+
+def encode_body(payload: dict, compression: str = "none") -> bytes:
+    """
+    Encode a block body.
+
+    Args:
+        payload (dict): The body, as ``Block.get_general_journal`` returns it.
+        compression (str): ``"none"``, ``"zlib"``, ``"lzma"``, or ``"auto"`` for whichever is smallest for this body.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    plain = _encode_payload(payload)
+    if compression == "auto":
+        return min((_envelope(plain, name) for name in COMPRESSIONS), key=len)
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown body compression {compression!r}.")
+    return _envelope(plain, compression)
+
+def decode_body(raw: bytes | memoryview) -> dict:
+    """Decode a body written by ``encode_body``."""
+    reader = _Reader(_plain(raw))
+    kind = reader.byte()
+    if kind == _KIND_JOURNAL:
+        return reader.journal()
+    if kind == _KIND_PACKED:
+        return {"journals": [reader.journal() for _ in range(reader.varint())]}
+    if kind == _KIND_JSON:
+        return json.loads(reader.string())
+    raise ValueError(f"Unknown block body kind {kind}.")
+
+def body_size(raw: bytes | memoryview) -> int:
+    """Length of an encoded body without its compression, what ``encode_body(payload)`` returns."""
+    raw = memoryview(raw)
+    if raw[len(MAGIC) + 1:len(MAGIC) + 2] == bytes((COMPRESSIONS["none"],)):
+        return len(raw)
+    return len(MAGIC) + 2 + len(_plain(raw))
+
+def _plain(raw: bytes | memoryview) -> memoryview:
+    """The payload bytes of an encoded body, decompressed."""
+    raw = memoryview(raw)
+    if not is_encoded_body(raw):
+        raise ValueError("Not an encoded block body.")
+    version, compression = raw[len(MAGIC)], raw[len(MAGIC) + 1]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported block body version {version}.")
+    data = raw[len(MAGIC) + 2:]
+    if compression == COMPRESSIONS["zlib"]:
+        data = memoryview(zlib.decompress(data))
+    elif compression == COMPRESSIONS["lzma"]:
+        data = memoryview(lzma.decompress(data, lzma.FORMAT_RAW, filters=_LZMA_FILTERS))
+    elif compression != COMPRESSIONS["none"]:
+        raise ValueError(f"Unknown block body compression {compression}.")
+    return data
+
+def _envelope(plain: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        plain = zlib.compress(plain, 9)
+    elif compression == "lzma":
+        plain = lzma.compress(plain, lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    return MAGIC + bytes((FORMAT_VERSION, COMPRESSIONS[compression])) + plain
+
+def _encode_payload(payload: dict) -> bytes:
+    out = bytearray()
+    if _is_journal(payload):
+        out.append(_KIND_JOURNAL)
+        _write_journal(out, payload)
+    elif list(payload) == ["journals"] and isinstance(payload["journals"], list) and all(map(_is_journal, payload["journals"])):
+        out.append(_KIND_PACKED)
+        _write_varint(out, len(payload["journals"]))
+        for journal in payload["journals"]:
+            _write_journal(out, journal)
+    else:
+        out.append(_KIND_JSON)
+        _write_string(out, json.dumps(payload, sort_keys=True, separators=(",", ":")))
+    return bytes(out)
+
+def _is_hash(value) -> bool:
+    try:
+        return isinstance(value, str) and len(value) == 64 and bytes.fromhex(value).hex() == value
+    except ValueError:
+        return False
+
+def _is_uuid(value: str) -> bool:
+    # Only the canonical lowercase form reads back identically.
+    if len(value) != 36 or value[8] != "-" or value[13] != "-" or value[18] != "-" or value[23] != "-":
+        return False
+    try:
+        return str(uuid.UUID(value)) == value
+    except ValueError:
+        return False
+
+def _is_journal(payload) -> bool:
+    """Whether a journal can be written field by field and read back exactly as it is."""
+    if not isinstance(payload, dict):
+        return False
+    keys = tuple(payload)
+    if keys[:len(_JOURNAL_KEYS)] != _JOURNAL_KEYS or not (
+        payload["action"] in _ACTIONS and all(isinstance(payload[key], str) for key in _JOURNAL_KEYS[1:])
+    ):
+        return False
+    rest = keys[len(_JOURNAL_KEYS):]
+    if rest == _DELTA_KEYS:
+        return (
+            _is_hash(payload["base"]) and _is_count(payload["depth"]) and _is_count(payload["size"])
+            and isinstance(payload["changes"], list)
+            and all(
+                isinstance(change, list) and len(change) == 2 and _is_count(change[0]) and _is_hash(change[1])
+                for change in payload["changes"]
+            )
+            and _is_hash(payload["merkle_root"])
+        )
+    return (
+        rest in (("transactions",), ("transactions", "merkle_root"))
+        and isinstance(payload["transactions"], list) and all(map(_is_hash, payload["transactions"]))
+        and ("merkle_root" not in payload or _is_hash(payload["merkle_root"]))
+    )
+
+def _is_count(value) -> bool:
+    return type(value) is int and value >= 0
+
+def _write_journal(out: bytearray, journal: dict):
+    is_uuid = _is_uuid(journal["journal_id"])
+    flags = (
+        (_FLAG_DELETE if journal["action"] == "delete" else 0)
+        | (_FLAG_UUID if is_uuid else 0)
+        | (_FLAG_ROOT if "merkle_root" in journal else 0)
+        | (_FLAG_DELTA if "base" in journal else 0)
+    )
+    out.append(flags)
+    if is_uuid:
+        out += uuid.UUID(journal["journal_id"]).bytes
+    else:
+        _write_string(out, journal["journal_id"])
+    for key in ("company", "period", "balance"):
+        _write_string(out, journal[key])
+    if "base" in journal:
+        out += bytes.fromhex(journal["base"])
+        for key in ("depth", "size"):
+            _write_varint(out, journal[key])
+        _write_varint(out, len(journal["changes"]))
+        for index, txid in journal["changes"]:
+            _write_varint(out, index)
+            out += bytes.fromhex(txid)
+    else:
+        _write_varint(out, len(journal["transactions"]))
+        out += bytes.fromhex("".join(journal["transactions"]))
+    if "merkle_root" in journal:
+        out += bytes.fromhex(journal["merkle_root"])
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _write_string(out: bytearray, value: str):
+    data = value.encode('utf-8')
+    _write_varint(out, len(data))
+    out += data
+
+class _Reader:
+    def __init__(self, data: memoryview):
+        self.data = data
+        self.position = 0
+
+    def take(self, size: int) -> memoryview:
+        end = self.position + size
+        if end > len(self.data):
+            raise ValueError("Truncated block body.")
+        chunk = self.data[self.position:end]
+        self.position = end
+        return chunk
+
+    def byte(self) -> int:
+        if self.position >= len(self.data):
+            raise ValueError("Truncated block body.")
+        self.position += 1
+        return self.data[self.position - 1]
+
+    def varint(self) -> int:
+        value = shift = 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def string(self) -> str:
+        return str(self.take(self.varint()), 'utf-8')
+
+    def journal(self) -> dict:
+        flags = self.byte()
+        journal = {"action": _ACTIONS[1] if flags & _FLAG_DELETE else _ACTIONS[0]}
+        if flags & _FLAG_UUID:
+            # Formatted by hand, constructing a uuid.UUID costs more than the rest of the journal.
+            h = self.take(16).hex()
+            journal["journal_id"] = f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+        else:
+            journal["journal_id"] = self.string()
+        for key in ("company", "period", "balance"):
+            journal[key] = self.string()
+        if flags & _FLAG_DELTA:
+            journal["base"] = self.take(32).hex()
+            journal["depth"] = self.varint()
+            journal["size"] = self.varint()
+            journal["changes"] = [[self.varint(), self.take(32).hex()] for _ in range(self.varint())]
+        else:
+            txids = self.take(32 * self.varint()).hex()
+            journal["transactions"] = [txids[i:i + 64] for i in range(0, len(txids), 64)]
+        if flags & _FLAG_ROOT:
+            journal["merkle_root"] = self.take(32).hex()
+        return journal
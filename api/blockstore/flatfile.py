@@ -0,0 +1,210 @@
+import fcntl, mmap, os, struct, zlib
+from contextlib import contextmanager
+
+# Every record is the body's length and CRC-32, then the body itself.
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_NAME = "blk{:05d}.dat"
+CHECKPOINT_NAME = "checkpoint"
+LOCK_NAME = "lock"
+DEFAULT_SEGMENT_SIZE = 128 * 1024 * 1024
+DEFAULT_FSYNC_EVERY = 64
+
+class CorruptRecord(ValueError):
+    """Raised when a location does not hold a complete record."""
+
+class FlatFileStore:
+    """
+    Block bodies in append-only, numbered segment files.
+
+    ``append`` returns the ``(segment, offset)`` of a body, which the caller
+    keeps as its index entry; ``read`` maps the segment and hands back a
+    memoryview slice of it, so nothing is copied until the caller decodes.
+    Appends from several processes are serialized with an advisory lock on
+    the directory, and a segment is closed once the next record would take
+    it past ``segment_size``.
+
+    Writes are fsynced every ``fsync_every`` records, or when ``sync`` is
+    called. The checkpoint file remembers how far the segments are known to
+    be durable, and opening the store scans only the records written after
+    it, cutting off a torn record left by a crash.
+    """
+
+    def __init__(self, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE, fsync_every: int = DEFAULT_FSYNC_EVERY):
+        self.path = str(path)
+        self.segment_size = segment_size
+        self.fsync_every = max(fsync_every, 1)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.path, LOCK_NAME), 'a+b')
+        self._maps = {}
+        self._segment = None
+        self._file = None
+        self._unsynced = 0
+        self.recovered = self.recover()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, SEGMENT_NAME.format(segment))
+
+    def segments(self) -> list[int]:
+        """Numbers of the segment files on disk, in order."""
+        return sorted(
+            int(name[3:-4]) for name in os.listdir(self.path)
+            if name.startswith("blk") and name.endswith(".dat") and name[3:-4].isdigit()
+        )
+
+    def append(self, body: bytes) -> tuple[int, int]:
+        """
+        Write a body at the end of the active segment.
+
+        Returns:
+            tuple: ``(segment, offset)`` of the record.
+        """
+        record = RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+        with self._locked():
+            offset = self._open_active(len(record))
+            self._file.write(record)
+            self._file.flush()
+            segment = self._segment
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+        return segment, offset
+
+    def read(self, segment: int, offset: int, verify: bool = False) -> memoryview:
+        """
+        The body stored at a location, as a slice of the mapped segment.
+
+        Args:
+            segment (int): Segment number returned by ``append``.
+            offset (int): Record offset returned by ``append``.
+            verify (bool): Also check the body against its CRC-32.
+        """
+        start = offset + RECORD_HEADER.size
+        view = self._map(segment, start)
+        length, crc = RECORD_HEADER.unpack_from(view, offset)
+        view = self._map(segment, start + length)
+        body = view[start:start + length]
+        if verify and zlib.crc32(body) != crc:
+            raise CorruptRecord(f"Record at {segment}:{offset} does not match its checksum.")
+        return body
+
+    def scan(self, segment: int, offset: int = 0):
+        """
+        Walk the records of a segment from ``offset``.
+
+        Yields:
+            tuple: ``(offset, body)`` of every complete, intact record; the walk stops at the first one that is not.
+        """
+        with open(self.segment_path(segment), 'rb') as file:
+            file.seek(offset)
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc = RECORD_HEADER.unpack(header)
+                body = file.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    return
+                yield offset, body
+                offset += RECORD_HEADER.size + length
+
+    def sync(self):
+        """Make every appended record durable now rather than at the next batch."""
+        with self._locked():
+            self._sync()
+
+    def recover(self) -> int:
+        """
+        Cut each segment written since the last checkpoint back to its last intact record.
+
+        Returns:
+            int: Bytes removed from torn or corrupt tails.
+        """
+        removed = 0
+        with self._locked():
+            checkpoint_segment, checkpoint_offset = self._read_checkpoint()
+            for segment in self.segments():
+                if segment < checkpoint_segment:
+                    continue
+                end = checkpoint_offset if segment == checkpoint_segment else 0
+                for offset, body in self.scan(segment, end):
+                    end = offset + RECORD_HEADER.size + len(body)
+                size = os.path.getsize(self.segment_path(segment))
+                if size > end:
+                    with open(self.segment_path(segment), 'r+b') as file:
+                        file.truncate(end)
+                        os.fsync(file.fileno())
+                    self._maps.pop(segment, None)
+                    removed += size - end
+            segments = self.segments()
+            if segments:
+                last = segments[-1]
+                self._write_checkpoint(last, os.path.getsize(self.segment_path(last)))
+        return removed
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open_active(self, record_size: int) -> int:
+        """Point ``_file`` at the segment the next record goes to, rotating when it is full, and return its end."""
+        if self._file is None:
+            segments = self.segments()
+            self._open_segment(segments[-1] if segments else 0)
+        while True:
+            # Another process may have rotated already, so the size is read again under the lock.
+            size = os.fstat(self._file.fileno()).st_size
+            if size == 0 or size + record_size <= self.segment_size:
+                return size
+            self._sync()
+            self._open_segment(self._segment + 1)
+
+    def _open_segment(self, segment: int):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.segment_path(segment), 'ab')
+        self._segment = segment
+
+    def _sync(self):
+        if self._file is None or not self._unsynced:
+            return
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._write_checkpoint(self._segment, os.fstat(self._file.fileno()).st_size)
+
+    def _read_checkpoint(self) -> tuple[int, int]:
+        try:
+            with open(os.path.join(self.path, CHECKPOINT_NAME), 'rb') as file:
+                return struct.unpack('<IQ', file.read(12))
+        except (FileNotFoundError, struct.error):
+            return 0, 0
+
+    def _write_checkpoint(self, segment: int, offset: int):
+        current = self._read_checkpoint()
+        if (segment, offset) <= current:
+            return
+        temporary = os.path.join(self.path, CHECKPOINT_NAME + ".tmp")
+        with open(temporary, 'wb') as file:
+            file.write(struct.pack('<IQ', segment, offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, os.path.join(self.path, CHECKPOINT_NAME))
+
+    def _map(self, segment: int, end: int) -> memoryview:
+        """A view of the segment covering at least ``end`` bytes, remapped once the file has grown past the old map."""
+        view = self._maps.get(segment)
+        if view is None or len(view) < end:
+            try:
+                with open(self.segment_path(segment), 'rb') as file:
+                    size = os.fstat(file.fileno()).st_size
+                    if size < end:
+                        raise CorruptRecord(f"Segment {segment} ends at {size}, before {end}.")
+                    # Earlier maps stay alive for as long as slices of them are held.
+                    view = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            except FileNotFoundError:
+                raise CorruptRecord(f"Segment {segment} is missing.")
+            self._maps[segment] = view
+        return view
@@ -0,0 +1,132 @@
+"""
+Headers-only verification of transaction inclusion proofs.
+
+The module only uses the standard library, so an auditor can copy it out of
+the project and check the responses of the ``merkle-proof/`` and ``headers/``
+endpoints without the application or its database: 80-byte headers and a
+log-size Merkle branch are enough to confirm a transaction.
+"""
+import hashlib, struct
+from dataclasses import dataclass
+
+HEADER_SIZE = 80
+
+class VerificationError(ValueError):
+    """Raised when a header chain or Merkle branch does not check out."""
+
+def double_sha256(data: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def bits_to_target(bits: str) -> int:
+    """Expand the compact bits representation into the full target, the one decoding the whole project uses."""
+    exponent = int(bits[:2], 16)
+    coefficient = int(bits[2:], 16)
+    if exponent <= 3:
+        return coefficient >> (8 * (3 - exponent))
+    return coefficient << (8 * (exponent - 3))
+
+@dataclass(frozen=True)
+class Header:
+    bits: str
+    timestamp: int
+    merkle_root: str
+    previous_hash: str
+    version: str
+    nonce: int
+    block_hash: str
+
+    @classmethod
+    def parse(cls, raw: bytes | str) -> "Header":
+        """
+        Decode a serialized header.
+
+        The layout is bits, big-endian timestamp, Merkle Root, previous hash and
+        version, all in natural byte order, followed by the little-endian nonce.
+        """
+        if isinstance(raw, str):
+            raw = bytes.fromhex(raw)
+        if len(raw) != HEADER_SIZE:
+            raise VerificationError(f"Header must be {HEADER_SIZE} bytes, got {len(raw)}.")
+        return cls(
+            bits=raw[0:4].hex(),
+            timestamp=struct.unpack('>I', raw[4:8])[0],
+            merkle_root=raw[8:40].hex(),
+            previous_hash=raw[40:72].hex(),
+            version=raw[72:76].hex(),
+            nonce=struct.unpack('<I', raw[76:80])[0],
+            block_hash=double_sha256(raw).hex(),
+        )
+
+    @property
+    def target(self) -> int:
+        return bits_to_target(self.bits)
+
+    def meets_target(self) -> bool:
+        return int(self.block_hash, 16) < self.target
+
+def verify_merkle_branch(txid: str, branch: list[dict], merkle_root: str) -> bool:
+    """Fold a branch of ``{"hash", "side"}`` steps onto a txid and compare with the Merkle Root."""
+    node = bytes.fromhex(txid)
+    for step in branch:
+        sibling = bytes.fromhex(step["hash"])
+        if step["side"] == "left":
+            node = double_sha256(sibling + node)
+        elif step["side"] == "right":
+            node = double_sha256(node + sibling)
+        else:
+            raise VerificationError(f"Unknown branch side {step['side']!r}.")
+    return node.hex() == merkle_root
+
+def verify_header_chain(headers: list[bytes | str], check_work: bool = True, trusted_tip: str | None = None) -> list[Header]:
+    """
+    Parse consecutive headers and check that each one links to the one before it.
+
+    Args:
+        headers (list): Serialized headers in height order, as bytes or hex.
+        check_work (bool): Also require every hash to be below its target (proof-of-work chains).
+        trusted_tip (str): Block hash the last header must have, e.g. a tip obtained from another node.
+
+    Returns:
+        list[Header]: The parsed headers.
+    """
+    parsed = []
+    for offset, raw in enumerate(headers):
+        header = Header.parse(raw)
+        if parsed and header.previous_hash != parsed[-1].block_hash:
+            raise VerificationError(f"Header {offset} does not link to the header before it.")
+        if check_work and not header.meets_target():
+            raise VerificationError(f"Header {offset} does not meet its proof-of-work target.")
+        parsed.append(header)
+    if not parsed:
+        raise VerificationError("No headers to verify.")
+    if trusted_tip is not None and parsed[-1].block_hash != trusted_tip:
+        raise VerificationError("The header chain does not end at the trusted tip.")
+    return parsed
+
+def verify_inclusion(proof: dict, check_work: bool | None = None, trusted_tip: str | None = None) -> Header:
+    """
+    Check a ``merkle-proof/`` response.
+
+    Proof-of-authority chains carry no work in their headers, so for them the
+    check is only as strong as ``trusted_tip``. A proof carries at most one
+    page of headers; when its ``tip_height`` is below ``chain_tip_height``,
+    extend ``proof["headers"]`` from ``headers/`` starting at ``tip_height + 1``
+    before checking it against a trusted tip.
+
+    Args:
+        proof (dict): The endpoint response.
+        check_work (bool): Check proof-of-work, by default only on ``pow`` chains.
+        trusted_tip (str): Block hash the header chain must end at.
+
+    Returns:
+        Header: The header of the block that commits the transaction.
+    """
+    if check_work is None:
+        check_work = proof.get("consensus", "pow") == "pow"
+    headers = verify_header_chain(proof["headers"], check_work, trusted_tip)
+    block = headers[0]
+    if block.block_hash != proof["block_hash"]:
+        raise VerificationError("The first header is not the block named by the proof.")
+    if not verify_merkle_branch(proof["txid"], proof["branch"], block.merkle_root):
+        raise VerificationError("The Merkle branch does not lead to the block's Merkle Root.")
+    return block
@@ -0,0 +1,71 @@
+import random, time, uuid
+from datetime import date
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.test.utils import override_settings
+from django.utils import timezone
+from api.models import Account, GeneralJournal, Transaction, TransactionLine
+
+class Command(BaseCommand):
+    help = "Compare aggregation, report and line save speed of amounts stored as decimals and as integer minor units."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=20_000, help="Transactions in the benchmark journal.")
+        parser.add_argument("--lines", type=int, default=10, help="Lines per transaction.")
+        parser.add_argument("--accounts", type=int, default=50)
+        parser.add_argument("--saves", type=int, default=2_000, help="Line saves to time.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs of each query, the fastest is reported.")
+
+    def handle(self, *args, **options):
+        for storage in ("decimal", "minor"):
+            # Everything is written in a transaction that is rolled back, so the database is left as it was.
+            with override_settings(AMOUNT_STORAGE=storage), transaction.atomic():
+                self.run(storage, options)
+                transaction.set_rollback(True)
+
+    def run(self, storage: str, options: dict):
+        rng = random.Random(1)
+        accounts = Account.objects.bulk_create([
+            Account(ref=f"b{index}", name=f"bench {uuid.uuid4().hex[:8]}") for index in range(options["accounts"])
+        ])
+        journal = GeneralJournal.objects.create(company="bench", period=date(2024, 1, 1), balance=0)
+        transactions = Transaction.objects.bulk_create([
+            Transaction(journal=journal, date=timezone.now(), description="bench", txid=uuid.uuid4().hex * 2, amount_scale=journal.amount_scale)
+            for _ in range(options["transactions"])
+        ], batch_size=2000)
+        lines = [
+            TransactionLine(
+                transaction=tx, account=rng.choice(accounts), is_debit=index % 2 == 0,
+                value=Decimal(rng.randrange(1, 10_000_000)).scaleb(-2), amount_scale=journal.amount_scale,
+            )
+            for tx in transactions for index in range(options["lines"])
+        ]
+        TransactionLine.objects.bulk_create(lines, batch_size=5000)
+        column = "value_minor" if storage == "minor" else "value"
+
+        aggregate = self.fastest(options["repeat"], lambda: list(TransactionLine.objects.filter(
+            transaction__journal=journal,
+        ).values_list("transaction").annotate(total=Sum(column))))
+        report = self.fastest(options["repeat"], journal.account_totals)
+
+        t_0 = time.perf_counter()
+        for line in lines[:options["saves"]]:
+            line.value += 1
+            line.save()
+        saves = time.perf_counter() - t_0
+
+        self.stdout.write(
+            f"{storage}: {len(lines):,} lines, per-transaction sums {len(lines) / aggregate:,.0f} lines/s, "
+            f"account report {report * 1000:,.1f} ms, line saves {options['saves'] / saves:,.0f}/s"
+        )
+
+    @staticmethod
+    def fastest(repeat: int, query) -> float:
+        timings = []
+        for _ in range(repeat):
+            t_0 = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - t_0)
+        return min(timings)
@@ -0,0 +1,50 @@
+import json, os, time, uuid
+from django.core.management.base import BaseCommand
+from api.blockstore import COMPRESSIONS, decode_body, encode_body
+
+class Command(BaseCommand):
+    help = "Compare the size and decode time of block bodies as indented JSON and in the binary encoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, default=2_000, help="Bodies to encode.")
+        parser.add_argument("--journals", type=int, default=1, help="Journals per body, more than one packs them.")
+        parser.add_argument("--txids", type=int, default=50, help="Transactions per journal.")
+
+    def handle(self, *args, **options):
+        payloads = [self.payload(options["journals"], options["txids"]) for _ in range(options["blocks"])]
+
+        t_0 = time.perf_counter()
+        texts = [json.dumps(payload, indent=4) for payload in payloads]
+        encoded = time.perf_counter() - t_0
+        t_0 = time.perf_counter()
+        for text in texts:
+            json.loads(text)
+        self.report("json", sum(map(len, texts)), len(texts), encoded, time.perf_counter() - t_0)
+
+        for compression in (*COMPRESSIONS, "auto"):
+            t_0 = time.perf_counter()
+            bodies = [encode_body(payload, compression) for payload in payloads]
+            encoded = time.perf_counter() - t_0
+            t_0 = time.perf_counter()
+            for body in bodies:
+                decode_body(body)
+            self.report(f"binary/{compression}", sum(map(len, bodies)), len(bodies), encoded, time.perf_counter() - t_0)
+
+    def report(self, name: str, size: int, count: int, encoded: float, decoded: float):
+        self.stdout.write(
+            f"{name}: {size / count:,.0f} bytes per block, "
+            f"encode {count / encoded:,.0f} blocks/s, decode {count / decoded:,.0f} blocks/s"
+        )
+
+    @staticmethod
+    def payload(journals: int, txids: int) -> dict:
+        payloads = [{
+            "action": "modify",
+            "journal_id": str(uuid.uuid4()),
+            "company": "bench",
+            "period": "2024-01-01",
+            "balance": "0.00",
+            "transactions": [os.urandom(32).hex() for _ in range(txids)],
+            "merkle_root": os.urandom(32).hex(),
+        } for _ in range(journals)]
+        return payloads[0] if journals == 1 else {"journals": payloads}
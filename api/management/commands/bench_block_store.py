@@ -0,0 +1,71 @@
+import json, os, shutil, tempfile, time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from api.blockstore import get_block_store, sync_block_store
+from api.models import Block, BlockHeader, Blockchain
+
+class Command(BaseCommand):
+    help = "Compare writing and sequentially reading block bodies through the ORM and through the flat-file store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, default=5_000, help="Blocks per chain.")
+        parser.add_argument("--txids", type=int, default=50, help="Transactions per block body.")
+        parser.add_argument("--fsync-every", type=int, default=64, help="Bodies between fsyncs in the flat-file store.")
+
+    def handle(self, *args, **options):
+        bodies = [self.body(height, options["txids"]) for height in range(options["blocks"])]
+        self.stdout.write(f"{len(bodies)} bodies, {sum(map(len, bodies)) / 1e6:.1f} MB")
+        directory = tempfile.mkdtemp(prefix="bench-block-store-")
+        try:
+            # Everything is rolled back and the segment files are removed, the benchmark leaves nothing behind.
+            with transaction.atomic():
+                self.run("orm", bodies, BLOCK_STORE="database")
+                self.run(
+                    "flatfile", bodies, BLOCK_STORE="flatfile", BLOCK_STORE_PATH=directory,
+                    BLOCK_STORE_FSYNC_EVERY=options["fsync_every"],
+                )
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, name: str, bodies: list[str], **storage):
+        with override_settings(**storage):
+            blockchain = Blockchain.objects.create()
+            headers = BlockHeader.objects.bulk_create(
+                [BlockHeader(block_hash=os.urandom(32).hex(), timestamp=height) for height in range(len(bodies))], batch_size=1000
+            )
+            t_0 = time.perf_counter()
+            Block.objects.bulk_create([
+                Block(id=f"{blockchain.id}-{header.block_hash}", blockchain=blockchain, height=height, header=header, data=body, size=len(body))
+                for height, (header, body) in enumerate(zip(headers, bodies))
+            ], batch_size=1000)
+            sync_block_store()
+            self.report(name, "write", len(bodies), time.perf_counter() - t_0)
+
+            t_0 = time.perf_counter()
+            size = sum(len(data) for _, data in blockchain.iter_chain(("height", "data")))
+            self.report(name, "sequential read", len(bodies), time.perf_counter() - t_0, size)
+
+            if name == "flatfile":
+                # The store alone: index entries from the database, bodies as mmap slices without decoding.
+                store = get_block_store()
+                t_0 = time.perf_counter()
+                size = sum(len(store.read(segment, offset)) for segment, offset in blockchain.iter_chain(("body_segment", "body_offset")))
+                self.report(name, "mmap slices", len(bodies), time.perf_counter() - t_0, size)
+
+    def report(self, name: str, operation: str, count: int, elapsed: float, size: int | None = None):
+        rate = f", {size / elapsed / 1e6:,.0f} MB/s" if size else ""
+        self.stdout.write(f"{name} {operation}: {elapsed:.2f}s, {count / elapsed:,.0f} blocks/s{rate}")
+
+    @staticmethod
+    def body(height: int, txids: int) -> str:
+        return json.dumps({
+            "action": "modify",
+            "journal_id": f"bench-{height}",
+            "company": "bench",
+            "period": "2024-01-01",
+            "balance": "0.00",
+            "transactions": [os.urandom(32).hex() for _ in range(txids)],
+            "merkle_root": os.urandom(32).hex(),
+        }, indent=4)
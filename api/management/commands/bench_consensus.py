@@ -0,0 +1,51 @@
+import os, statistics, time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Blockchain, ChainUser
+from api.models.utils import compute_merkle_root
+from api.views.blockchain_views import new_block, mine_header
+
+class Command(BaseCommand):
+    help = "Compare per-block commit latency of proof-of-authority and proof-of-work chains."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, default=50, help="Blocks to commit per mode.")
+        parser.add_argument("--target", default=None, help="Proof-of-work target in hex, the chain default when omitted.")
+        parser.add_argument("--txids", type=int, default=20, help="Transactions per block.")
+
+    def handle(self, *args, **options):
+        # Everything is rolled back, the benchmark leaves no chains behind.
+        with transaction.atomic():
+            for mode in ("poa", "pow"):
+                latencies = self.run(mode, options)
+                self.stdout.write(
+                    f"{mode}: {len(latencies)} blocks, median {statistics.median(latencies) * 1000:.2f} ms, "
+                    f"p95 {sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms, "
+                    f"total {sum(latencies):.2f}s"
+                )
+            transaction.set_rollback(True)
+
+    def run(self, mode: str, options) -> list[float]:
+        blockchain = Blockchain.objects.create(consensus=mode, **({"target": options["target"]} if options["target"] else {}))
+        if mode == "poa":
+            user = User.objects.create(username=f"bench-authority-{os.urandom(4).hex()}")
+            chain_user = ChainUser.objects.create(user=user, blockchain=blockchain)
+            chain_user.generate_keys()
+            blockchain.authorities.add(chain_user)
+
+        latencies = []
+        for height in range(options["blocks"]):
+            txids = [os.urandom(32).hex() for _ in range(options["txids"])]
+            payload = {
+                "action": "modify",
+                "journal_id": f"bench-{height}",
+                "transactions": txids,
+                "merkle_root": compute_merkle_root(txids),
+            }
+            t_0 = time.perf_counter()
+            block = new_block(blockchain)
+            block.set_journal_payloads([payload], commit=False)
+            mine_header(blockchain, block)
+            latencies.append(time.perf_counter() - t_0)
+        return latencies
@@ -0,0 +1,67 @@
+import os, statistics, time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.models import GeneralJournal, Transaction
+from api.models.utils import compute_merkle_root
+
+class Command(BaseCommand):
+    help = "Compare a full Merkle Root recompute with incremental updates of a journal's persisted tree."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=10_000, help="Transactions in the journal.")
+        parser.add_argument("--updates", type=int, default=50, help="Incremental updates timed per operation.")
+
+    def handle(self, *args, **options):
+        # Everything is rolled back, the benchmark leaves no journal behind.
+        with transaction.atomic():
+            journal = GeneralJournal.objects.create(company="bench-merkle", period=date.today(), balance=0)
+            now = timezone.now()
+            Transaction.objects.bulk_create(
+                [Transaction(journal=journal, date=now, txid=os.urandom(32).hex(), total=0) for _ in range(options["transactions"])],
+                batch_size=1000,
+            )
+            tree = journal.merkle_tree
+            t_0 = time.perf_counter()
+            tree.rebuild()
+            self.stdout.write(f"rebuild: {(time.perf_counter() - t_0) * 1000:.1f} ms for {journal.merkle_size} leaves")
+
+            full = []
+            for _ in range(5):
+                t_0 = time.perf_counter()
+                root = compute_merkle_root(list(journal.transactions.order_by("merkle_index").values_list("txid", flat=True)))
+                full.append(time.perf_counter() - t_0)
+            self.check_root(journal, root)
+            self.report("full recompute", full)
+
+            appended, replaced, removed = [], [], []
+            for _ in range(options["updates"]):
+                t_0 = time.perf_counter()
+                tree.append(os.urandom(32).hex())
+                appended.append(time.perf_counter() - t_0)
+
+                index = int.from_bytes(os.urandom(4), "big") % journal.merkle_size
+                t_0 = time.perf_counter()
+                tree.replace(index, os.urandom(32).hex())
+                replaced.append(time.perf_counter() - t_0)
+
+                index = int.from_bytes(os.urandom(4), "big") % journal.merkle_size
+                t_0 = time.perf_counter()
+                tree.remove(index)
+                removed.append(time.perf_counter() - t_0)
+            self.report("append", appended)
+            self.report("replace", replaced)
+            self.report("remove", removed)
+
+            leaves = journal.merkle_nodes.filter(level=0).order_by("index").values_list("hash", flat=True)
+            self.check_root(journal, compute_merkle_root([bytes(leaf).hex() for leaf in leaves]))
+            transaction.set_rollback(True)
+
+    def report(self, name: str, samples: list[float]):
+        self.stdout.write(f"{name}: median {statistics.median(samples) * 1000:.3f} ms over {len(samples)} runs")
+
+    def check_root(self, journal: GeneralJournal, expected: str):
+        if journal.merkle_root != expected:
+            raise CommandError(f"Stored root {journal.merkle_root} does not match the full recompute {expected}.")
+        self.stdout.write(f"root matches the full recompute: {expected}")
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand
+from api.models import BlockHeader
+from api.mining import BACKENDS, get_backend, mine_parallel
+
+class Command(BaseCommand):
+    help = "Compare hashes per second of the mining loops and backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hashes", type=int, default=200_000, help="Nonces to hash per engine.")
+        parser.add_argument("--workers", type=int, default=0, help="Also time the process pool with this many workers.")
+        parser.add_argument("--backend", choices=BACKENDS, action="append", help="Backends to time, all by default.")
+
+    def handle(self, *args, **options):
+        hashes = options["hashes"]
+        header = BlockHeader(merkle_root="ab" * 32, previous_hash="cd" * 32)
+        # A zero target is never met, so every engine hashes the full range.
+        impossible = "00" * 32
+
+        self.report("compute_block_hash loop", hashes, self.legacy_loop(header, hashes, impossible))
+
+        for name in options["backend"] or BACKENDS:
+            try:
+                template = get_backend(name).from_header(header)
+            except ImportError as e:
+                self.stdout.write(f"{name + ' backend':<36} skipped: {e}")
+                continue
+            t_0 = time.perf_counter()
+            template.search(bytes.fromhex(impossible), 0, hashes)
+            self.report(f"{name} backend", hashes, time.perf_counter() - t_0)
+
+            if options["workers"]:
+                result = mine_parallel(
+                    template.prefix, 0, workers=options["workers"], end=hashes,
+                    chunk_size=max(hashes // (options["workers"] * 4), 1), backend=name,
+                )
+                self.report(f"{name} backend x{result.workers} processes", result.attempts, result.elapsed)
+
+    def legacy_loop(self, header: BlockHeader, hashes: int, target: str) -> float:
+        """The loop BlockHeader.mine ran before the template fast path."""
+        t_0 = time.perf_counter()
+        for nonce in range(hashes):
+            header.nonce = nonce
+            block_hash = header.compute_block_hash()
+            if int(block_hash, 16) < int(target, 16):
+                break
+        return time.perf_counter() - t_0
+
+    def report(self, name: str, hashes: int, elapsed: float):
+        self.stdout.write(f"{name:<36} {hashes / elapsed:>14,.0f} H/s  ({hashes:,} hashes in {elapsed:.3f}s)")
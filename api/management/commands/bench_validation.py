@@ -0,0 +1,57 @@
+import hashlib, os, struct, time
+from django.core.management.base import BaseCommand
+from api.mining import HeaderVerifier, DEFAULT_VERIFY_CHUNK_SIZE
+from api.mining.verify import header_bytes
+
+class Command(BaseCommand):
+    help = "Time header hash and proof-of-work verification of a synthetic chain with one and several processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, default=100_000, help="Length of the synthetic chain.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the parallel run.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_VERIFY_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        t_0 = time.perf_counter()
+        rows = self.build_chain(options["blocks"])
+        self.stdout.write(f"built {len(rows)} headers in {time.perf_counter() - t_0:.1f}s")
+
+        for workers in sorted({1, options["workers"]}):
+            t_0 = time.perf_counter()
+            with HeaderVerifier(workers) as verifier:
+                previous_hash = "00" * 32
+                for start in range(0, len(rows), options["chunk_size"]):
+                    chunk = rows[start:start + options["chunk_size"]]
+                    # The sequential linkage pass that validate_chain runs next to the pool.
+                    for row in chunk:
+                        if row[2] != previous_hash:
+                            raise AssertionError(f"Block {row[0]} does not link.")
+                        previous_hash = row[1]
+                    verifier.submit(chunk)
+            elapsed = time.perf_counter() - t_0
+            self.stdout.write(
+                f"workers={workers}: {elapsed:.2f}s, {len(rows) / elapsed:,.0f} headers/s, "
+                f"failure={verifier.failure}"
+            )
+
+    def build_chain(self, length: int) -> list[tuple]:
+        """Headers at an easy target, so about every other nonce is valid."""
+        bits = "207fffff"
+        target = 0x7fffff << (8 * 29)
+        version = struct.pack('<I', 0x20000000).hex()
+        previous_hash = "00" * 32
+        rows = []
+        for height in range(length):
+            merkle_root = os.urandom(32).hex()
+            timestamp = 1_700_000_000 + height * 60
+            nonce = 0
+            while True:
+                block_hash = hashlib.sha256(hashlib.sha256(
+                    header_bytes(version, previous_hash, merkle_root, timestamp, bits, nonce)
+                ).digest()).hexdigest()
+                if int(block_hash, 16) < target:
+                    break
+                nonce += 1
+            rows.append((height, block_hash, previous_hash, merkle_root, version, bits, timestamp, nonce, None))
+            previous_hash = block_hash
+        return rows
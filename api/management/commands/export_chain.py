@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Blockchain
+from api.views.sync_views import iter_chain_export
+
+class Command(BaseCommand):
+    help = "Write a chain to a binary chain file, for backups or to bootstrap another node."
+
+    def add_arguments(self, parser):
+        parser.add_argument("blockchain", help="Id of the chain to export.")
+        parser.add_argument("path", help="File to write, - for standard output.")
+
+    def handle(self, *args, **options):
+        try:
+            blockchain = Blockchain.objects.get(pk=options["blockchain"])
+        except Blockchain.DoesNotExist:
+            raise CommandError(f"Blockchain {options['blockchain']} does not exist.")
+        file = sys.stdout.buffer if options["path"] == "-" else open(options["path"], 'wb')
+        written = 0
+        try:
+            for piece in iter_chain_export(blockchain):
+                file.write(piece)
+                written += len(piece)
+        finally:
+            if file is not sys.stdout.buffer:
+                file.close()
+        tip_height, tip_hash = blockchain.get_tip()
+        self.stderr.write(f"exported {written:,} bytes, tip {tip_height} {tip_hash}")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.blockstore import ChainFileError, ChainFileReader
+from api.light_client import VerificationError
+from api.models import Blockchain
+from api.views.sync_views import RemoteNode, import_chain
+
+class Command(BaseCommand):
+    help = "Load a binary chain file, or a peer's whole chain, checking every block on the way in."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="Chain file written by export_chain.")
+        parser.add_argument("--blockchain", help="Id of an existing chain without blocks to load into, a new chain when omitted.")
+        parser.add_argument("--url", help="Bootstrap from a peer's sync/export/ endpoint instead of a file.")
+        parser.add_argument("--username")
+        parser.add_argument("--password")
+        parser.add_argument("--timeout", type=int, default=30)
+        parser.add_argument("--batch-size", type=int, default=1000, help="Blocks checked and written at a time.")
+
+    def handle(self, *args, **options):
+        if bool(options["path"]) == bool(options["url"]):
+            raise CommandError("Pass either a chain file or --url.")
+        blockchain = None
+        if options["blockchain"]:
+            try:
+                blockchain = Blockchain.objects.get(pk=options["blockchain"])
+            except Blockchain.DoesNotExist:
+                raise CommandError(f"Blockchain {options['blockchain']} does not exist.")
+
+        if options["url"]:
+            stream = RemoteNode(options["url"], options["username"], options["password"], options["timeout"]).export_stream()
+        else:
+            stream = open(options["path"], 'rb')
+        try:
+            with stream:
+                blockchain = import_chain(ChainFileReader(stream), blockchain, options["batch_size"])
+        except (ChainFileError, VerificationError) as e:
+            raise CommandError(f"Rejected the chain file: {e}")
+        tip_height, tip_hash = blockchain.get_tip()
+        self.stdout.write(f"{blockchain.pk}: imported up to tip {tip_height} {tip_hash}")
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, Length
+from api.models import BlockHeader
+from api.models.blockchain_models import PACKED_HEADER_SPANS
+
+STORED_COLUMNS = ("version", "bits", "previous_hash", "merkle_root", "block_hash", "raw")
+
+class Command(BaseCommand):
+    help = "Convert stored block headers between hex text columns and 80-byte binary headers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["binary", "text"], default="binary", help="Storage to convert the headers to.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        before = self.stored_bytes()
+        converted = skipped = 0
+        to_binary = options["to"] == "binary"
+        # Only the rows still in the other layout are read, so an interrupted run can simply be restarted.
+        pending = BlockHeader.objects.filter(raw__isnull=to_binary).order_by("pk")
+        last = None
+        while True:
+            page = pending if last is None else pending.filter(pk__gt=last)
+            batch = list(page[:options["batch_size"]])
+            if not batch:
+                break
+            last = batch[-1].pk
+            updated = []
+            for header in batch:
+                if to_binary:
+                    raw = header.serialize()
+                    if header.compute_block_hash() != header.block_hash:
+                        # A header that no longer hashes to its key is left readable for validation to report.
+                        skipped += 1
+                        continue
+                    header.raw = raw
+                else:
+                    for field in PACKED_HEADER_SPANS:
+                        setattr(header, field, getattr(header, field))
+                    header.raw = None
+                updated.append(header)
+            with transaction.atomic():
+                if to_binary:
+                    BlockHeader.objects.bulk_update(updated, ["raw"])
+                    # Read through the model the hex fields would come back decoded, so they are emptied in SQL.
+                    BlockHeader.objects.filter(pk__in=[header.pk for header in updated]).update(
+                        **{field: '' for field in PACKED_HEADER_SPANS}
+                    )
+                else:
+                    BlockHeader.objects.bulk_update(updated, [*PACKED_HEADER_SPANS, "raw"])
+            converted += len(updated)
+
+        after = self.stored_bytes()
+        self.stdout.write(f"converted {converted} headers to {options['to']}, skipped {skipped} that do not match their hash")
+        if before["rows"]:
+            self.stdout.write(
+                f"header columns: {before['bytes'] / before['rows']:.0f} -> {after['bytes'] / after['rows']:.0f} bytes per row"
+            )
+
+    def stored_bytes(self) -> dict:
+        """Bytes held by the header's hash and hex or binary columns, before indexes and row overhead."""
+        totals = BlockHeader.objects.aggregate(
+            rows=Count("pk"),
+            **{column: Coalesce(Sum(Length(column)), 0) for column in STORED_COLUMNS},
+        )
+        rows = totals.pop("rows")
+        return {"rows": rows, "bytes": sum(totals.values())}
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, Length
+from api.blockstore import get_block_archive
+from api.models import Blockchain
+
+class Command(BaseCommand):
+    help = "Move the bodies of deep blocks into compressed archive files, or bring them back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("blockchains", nargs="*", help="Ids of the chains to prune, every chain when omitted.")
+        parser.add_argument("--depth", type=int, help="Blocks to keep live below the tip, PRUNE_DEPTH by default.")
+        parser.add_argument("--rehydrate", action="store_true", help="Move archived bodies back into the database instead.")
+        parser.add_argument("--from", dest="start", type=int, default=0, help="First height to rehydrate.")
+        parser.add_argument("--to", dest="stop", type=int, help="Height to stop rehydrating before, the tip when omitted.")
+
+    def handle(self, *args, **options):
+        blockchains = Blockchain.objects.all()
+        if options["blockchains"]:
+            blockchains = blockchains.filter(pk__in=options["blockchains"])
+        depth = options["depth"] if options["depth"] is not None else getattr(settings, 'PRUNE_DEPTH', 0)
+        if not options["rehydrate"] and depth <= 0:
+            raise CommandError("Pass --depth or set PRUNE_DEPTH to prune.")
+
+        for blockchain in blockchains:
+            if options["rehydrate"]:
+                moved = blockchain.rehydrate(options["start"], options["stop"])
+                action = "rehydrated"
+            else:
+                moved = blockchain.prune(depth)
+                action = "archived"
+            live = blockchain.blocks.aggregate(
+                blocks=Count("pk"),
+                bytes=Coalesce(Sum(Length("data")), 0) + Coalesce(Sum(Length("body")), 0),
+            )
+            self.stdout.write(
+                f"{blockchain.pk}: {action} {moved} block bodies, "
+                f"{live['bytes']:,} body bytes live in {live['blocks']} blocks, "
+                f"{get_block_archive().size(blockchain.pk):,} bytes archived below height {blockchain.archived_height}"
+            )
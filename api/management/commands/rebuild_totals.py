@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BigIntegerField, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Power, Round
+from api.models import GeneralJournal, Transaction, TransactionLine
+from api.models.accounting_models import minor_amounts
+
+AMOUNT = DecimalField(max_digits=100, decimal_places=2)
+
+def output_field(column: str):
+    return BigIntegerField() if column.endswith("_minor") else AMOUNT
+
+class Command(BaseCommand):
+    help = (
+        "Bring every line amount into AMOUNT_STORAGE and recompute the debit and credit totals "
+        "of every transaction and journal from their lines, e.g. after upgrading or switching storage."
+    )
+
+    def handle(self, *args, **options):
+        minor = minor_amounts()
+        with transaction.atomic():
+            self.fill_scales()
+            scale = Power(Value(10), F("amount_scale"))
+            if minor:
+                converted = TransactionLine.objects.filter(value__isnull=False).update(
+                    value_minor=Cast(Round(F("value") * scale), BigIntegerField()), value=None,
+                )
+            else:
+                converted = TransactionLine.objects.filter(value_minor__isnull=False).update(
+                    value=Cast(F("value_minor"), AMOUNT) / Cast(scale, AMOUNT), value_minor=None,
+                )
+
+            # Totals are written to the column of the storage in use, the other one is emptied.
+            suffix, other = ("_minor", "") if minor else ("", "_minor")
+            updated = Transaction.objects.update(**{
+                f"debit_total{suffix}": self.line_sum(Q(is_debit=True), f"value{suffix}"),
+                f"credit_total{suffix}": self.line_sum(Q(is_debit=False), f"value{suffix}"),
+                f"debit_total{other}": None, f"credit_total{other}": None, f"total{other}": None,
+            })
+            Transaction.objects.update(**{f"total{suffix}": F(f"debit_total{suffix}")})
+            journals = GeneralJournal.objects.update(**{
+                f"debit_total{suffix}": self.transaction_sum(f"debit_total{suffix}"),
+                f"credit_total{suffix}": self.transaction_sum(f"credit_total{suffix}"),
+                f"debit_total{other}": None, f"credit_total{other}": None, f"balance{other}": None,
+            })
+            GeneralJournal.objects.update(**{f"balance{suffix}": F(f"debit_total{suffix}")})
+        self.stdout.write(
+            f"converted {converted} line amounts to {'minor units' if minor else 'decimals'}, "
+            f"recomputed the totals of {updated} transactions and {journals} journals"
+        )
+
+    @staticmethod
+    def fill_scales():
+        """Give rows written before amounts had a scale their company's, journals first."""
+        for company, scale in getattr(settings, 'CURRENCY_SCALES', {}).items():
+            GeneralJournal.objects.filter(amount_scale__isnull=True, company=company).update(amount_scale=scale)
+        GeneralJournal.objects.filter(amount_scale__isnull=True).update(amount_scale=getattr(settings, 'DEFAULT_CURRENCY_SCALE', 2))
+        Transaction.objects.filter(amount_scale__isnull=True).update(
+            amount_scale=Subquery(GeneralJournal.objects.filter(pk=OuterRef("journal")).values("amount_scale")),
+        )
+        TransactionLine.objects.filter(amount_scale__isnull=True).update(
+            amount_scale=Subquery(Transaction.objects.filter(pk=OuterRef("transaction")).values("amount_scale")),
+        )
+
+    @staticmethod
+    def line_sum(condition: Q, column: str):
+        lines = TransactionLine.objects.filter(condition, transaction=OuterRef("pk")).values("transaction")
+        return Coalesce(Subquery(lines.annotate(sum=Sum(column)).values("sum")), Value(0), output_field=output_field(column))
+
+    @staticmethod
+    def transaction_sum(column: str):
+        transactions = Transaction.objects.filter(journal=OuterRef("pk")).values("journal")
+        return Coalesce(Subquery(transactions.annotate(sum=Sum(column)).values("sum")), Value(0), output_field=output_field(column))
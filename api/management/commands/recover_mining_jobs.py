@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.views.blockchain_views import recover_mining_jobs, shutdown_mining_executor
+
+class Command(BaseCommand):
+    help = (
+        "Requeue or fail mining jobs left queued or running by a stopped server, and mine what is pending. "
+        "Run it after a restart, e.g. with --stale-after 0 before the server takes requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stale-after", type=float, help="Age in seconds past which a job is abandoned, MINING_JOB_STALE_AFTER by default.")
+
+    def handle(self, *args, **options):
+        requeued, failed = recover_mining_jobs(options["stale_after"])
+        # The requeued jobs run in this process, so it waits for them before exiting.
+        shutdown_mining_executor()
+        self.stdout.write(f"requeued {requeued} mining jobs, failed {failed} interrupted ones")
@@ -0,0 +1,55 @@
+import random
+from collections import deque
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Blockchain
+from api.models.utils import bits_to_target_int, target_int_to_bits, MAX_TARGET
+
+class Command(BaseCommand):
+    help = "Simulate difficulty retargeting under a changing hashrate and report how block times converge."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=60, help="Target seconds between blocks.")
+        parser.add_argument("--window", type=int, default=10, help="Blocks per retarget window.")
+        parser.add_argument("--max-step", type=float, default=4.0, help="Largest difficulty change per retarget.")
+        parser.add_argument(
+            "--schedule", default="1e5:200,1e6:200,2e4:200",
+            help="Comma separated hashrate:blocks phases, in hashes per second.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            schedule = [(float(rate), int(blocks)) for rate, blocks in (phase.split(":") for phase in options["schedule"].split(","))]
+        except ValueError:
+            raise CommandError("Schedule must look like 1e5:200,1e6:200.")
+
+        # An unsaved chain is enough, the retarget rule only reads its settings.
+        chain = Blockchain(
+            retarget_enabled=True,
+            block_interval=options["interval"],
+            retarget_window=options["window"],
+            retarget_max_step=options["max_step"],
+        )
+        rng = random.Random(options["seed"])
+        bits = target_int_to_bits(MAX_TARGET)
+        timestamps = deque(maxlen=chain.retarget_window)
+        clock = 0.0
+        height = 0
+        window_times = []
+
+        self.stdout.write(f"{'height':>7} {'hashrate':>10} {'avg block s':>12} {'difficulty':>12}")
+        for hashrate, blocks in schedule:
+            for _ in range(blocks):
+                if height > 0:
+                    bits = chain.retarget_bits(height, bits, list(timestamps))
+                expected_hashes = 2 ** 256 / (bits_to_target_int(bits) + 1)
+                block_time = rng.expovariate(hashrate / expected_hashes)
+                clock += block_time
+                timestamps.append(int(clock))
+                window_times.append(block_time)
+                height += 1
+                if height % chain.retarget_window == 0:
+                    difficulty = MAX_TARGET / bits_to_target_int(bits)
+                    average = sum(window_times) / len(window_times)
+                    self.stdout.write(f"{height:>7} {hashrate:>10.0f} {average:>12.1f} {difficulty:>12.1f}")
+                    window_times = []
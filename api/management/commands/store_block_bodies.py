@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.blockstore import get_block_store, is_encoded_body
+from api.models import Block
+
+class Command(BaseCommand):
+    help = "Move stored block bodies between the Block.data column and the flat-file block store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["flatfile", "database"], default="flatfile", help="Where to move the bodies.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        store = get_block_store()
+        to_flat_file = options["to"] == "flatfile"
+        # Only the rows still on the other side are read, so an interrupted run can simply be restarted.
+        # Pruned bodies stay in their archive files, see prune_blocks.
+        pending = Block.objects.filter(body_segment__isnull=to_flat_file, archive_chunk__isnull=True).order_by("pk")
+        moved = 0
+        last = None
+        while True:
+            page = pending if last is None else pending.filter(pk__gt=last)
+            rows = list(page.values_list("pk", "data", "body", "body_segment", "body_offset")[:options["batch_size"]])
+            if not rows:
+                break
+            last = rows[-1][0]
+            with transaction.atomic():
+                if to_flat_file:
+                    blocks = []
+                    for pk, data, body, _, _ in rows:
+                        segment, offset = store.append(bytes(body) if body is not None else data.encode('utf-8'))
+                        blocks.append(Block(pk=pk, body_segment=segment, body_offset=offset))
+                    store.sync()
+                    Block.objects.bulk_update(blocks, ["body_segment", "body_offset"])
+                    # Read through the model the body would come back from the store, so it is emptied in SQL.
+                    Block.objects.filter(pk__in=[block.pk for block in blocks]).update(data='', body=None)
+                else:
+                    texts, encoded = [], []
+                    for pk, data, _, segment, offset in rows:
+                        record = bytes(store.read(segment, offset))
+                        if is_encoded_body(record):
+                            encoded.append(Block(pk=pk, body=record, body_segment=None, body_offset=None))
+                        else:
+                            texts.append(Block(pk=pk, data=data or str(record, 'utf-8'), body_segment=None, body_offset=None))
+                    # Encoded bodies would read back through ``data`` as JSON text, so that column is not written for them.
+                    Block.objects.bulk_update(encoded, ["body", "body_segment", "body_offset"])
+                    Block.objects.bulk_update(texts, ["data", "body_segment", "body_offset"])
+            moved += len(rows)
+        self.stdout.write(f"moved {moved} block bodies to the {options['to']} store")
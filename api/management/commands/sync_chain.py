@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.light_client import VerificationError
+from api.models import Blockchain
+from api.views.sync_views import RemoteNode, sync_from_remote
+
+class Command(BaseCommand):
+    help = "Header-first sync of a local chain from a peer node's sync/ endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("blockchain", help="Id of the local chain to bring up to date.")
+        parser.add_argument("--url", required=True, help="Base URL of the peer's API, e.g. http://node:8000/api/.")
+        parser.add_argument("--username")
+        parser.add_argument("--password")
+        parser.add_argument("--timeout", type=int, default=30)
+
+    def handle(self, *args, **options):
+        try:
+            blockchain = Blockchain.objects.get(pk=options["blockchain"])
+        except Blockchain.DoesNotExist:
+            raise CommandError(f"Blockchain {options['blockchain']} does not exist.")
+        node = RemoteNode(options["url"], options["username"], options["password"], options["timeout"])
+        try:
+            written = sync_from_remote(blockchain, node)
+        except VerificationError as e:
+            raise CommandError(f"Rejected the peer's chain: {e}")
+        tip_height, tip_hash = blockchain.get_tip()
+        self.stdout.write(f"wrote {written} blocks, tip {tip_height} {tip_hash}")
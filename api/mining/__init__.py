@@ -0,0 +1,20 @@
+from .template import HeaderTemplate, HEADER_PREFIX_SIZE
+from .backends import BACKENDS, get_backend
+from .parallel import MiningResult, NONCE_LIMIT, search_nonces, mine_parallel
+from .verify import HeaderVerifier, HEADER_ROW_FIELDS, DEFAULT_VERIFY_CHUNK_SIZE, verify_chunk, verify_signature
+
+__all__ = [
+    "HeaderTemplate",
+    "HEADER_PREFIX_SIZE",
+    "BACKENDS",
+    "get_backend",
+    "MiningResult",
+    "NONCE_LIMIT",
+    "search_nonces",
+    "mine_parallel",
+    "HeaderVerifier",
+    "HEADER_ROW_FIELDS",
+    "DEFAULT_VERIFY_CHUNK_SIZE",
+    "verify_chunk",
+    "verify_signature",
+]
@@ -0,0 +1,22 @@
+from .template import HeaderTemplate
+
+BACKENDS = ("hashlib", "numpy")
+DEFAULT_BACKEND = "hashlib"
+
+def get_backend(name: str | None = None) -> type[HeaderTemplate]:
+    """
+    Return the header template class that implements a proof-of-work backend.
+
+    Args:
+        name (str): ``"hashlib"`` or ``"numpy"``; None selects the default.
+
+    Returns:
+        type[HeaderTemplate]: A class built from a header prefix with a ``search`` method.
+    """
+    name = name or DEFAULT_BACKEND
+    if name == "hashlib":
+        return HeaderTemplate
+    if name == "numpy":
+        from .numpy_backend import NumpyHeaderTemplate
+        return NumpyHeaderTemplate
+    raise ValueError(f"Unknown mining backend '{name}', expected one of {', '.join(BACKENDS)}.")
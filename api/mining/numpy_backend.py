@@ -0,0 +1,128 @@
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("The numpy mining backend requires numpy. Install it with `pip install numpy`.") from e
+
+from .template import HeaderTemplate, HEADER_PREFIX_SIZE, HEADER_SIZE, SHA256_BLOCK_SIZE
+
+DEFAULT_BATCH_SIZE = 1 << 14
+
+_K = np.array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+], dtype=np.uint32)
+
+_IV = np.array([
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+], dtype=np.uint32)
+
+def _rotr(x, n: int):
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+def _compress(state: list, words: list) -> list:
+    """Run the SHA-256 compression function on lanes of uint32 arrays."""
+    w = list(words)
+    for t in range(16, 64):
+        s0 = _rotr(w[t - 15], 7) ^ _rotr(w[t - 15], 18) ^ (w[t - 15] >> np.uint32(3))
+        s1 = _rotr(w[t - 2], 17) ^ _rotr(w[t - 2], 19) ^ (w[t - 2] >> np.uint32(10))
+        w.append(w[t - 16] + s0 + w[t - 7] + s1)
+
+    a, b, c, d, e, f, g, h = state
+    for t in range(64):
+        t1 = h + (_rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)) + ((e & f) ^ (~e & g)) + _K[t] + w[t]
+        t2 = (_rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + t2
+    return [x + y for x, y in zip(state, (a, b, c, d, e, f, g, h))]
+
+def _lanes(value: int, size: int):
+    return np.full(size, value, dtype=np.uint32)
+
+class NumpyHeaderTemplate(HeaderTemplate):
+    """
+    A HeaderTemplate that hashes a whole batch of nonces per call.
+
+    The midstate of the first 64 header bytes is computed once; each batch
+    then runs the second block and the outer hash as vectorized uint32
+    operations, one lane per nonce.
+    """
+
+    def __init__(self, prefix: bytes, batch_size: int = DEFAULT_BATCH_SIZE):
+        super(NumpyHeaderTemplate, self).__init__(prefix)
+        self.batch_size = batch_size
+        self._compute_lane_midstate()
+
+    def set_timestamp(self, timestamp: int):
+        super(NumpyHeaderTemplate, self).set_timestamp(timestamp)
+        self._compute_lane_midstate()
+
+    def _compute_lane_midstate(self):
+        first_block = np.frombuffer(bytes(self.buffer[:SHA256_BLOCK_SIZE]), dtype='>u4').astype(np.uint32)
+        with np.errstate(over='ignore'):
+            state = _compress([_lanes(v, 1) for v in _IV], [_lanes(v, 1) for v in first_block])
+        self._lane_midstate = [int(v[0]) for v in state]
+        self._tail_words = [int(v) for v in np.frombuffer(bytes(self.buffer[SHA256_BLOCK_SIZE:HEADER_PREFIX_SIZE]), dtype='>u4')]
+
+    def hash_words(self, nonces) -> "np.ndarray":
+        """
+        Double SHA-256 of the header for every nonce in a uint32 array.
+
+        Returns:
+            np.ndarray: ``(len(nonces), 8)`` uint32 words; written big-endian they are the digest bytes.
+        """
+        nonces = np.asarray(nonces, dtype=np.uint32)
+        size = len(nonces)
+        with np.errstate(over='ignore'):
+            # Second block: the last 12 prefix bytes, the nonce and padding for an 80-byte message.
+            words = [_lanes(v, size) for v in self._tail_words]
+            words.append(nonces.byteswap())
+            words.append(_lanes(0x80000000, size))
+            words.extend(_lanes(0, size) for _ in range(10))
+            words.append(_lanes(HEADER_SIZE * 8, size))
+            inner = _compress([_lanes(v, size) for v in self._lane_midstate], words)
+
+            # Outer hash over the 32-byte inner digest.
+            words = inner + [_lanes(0x80000000, size)] + [_lanes(0, size) for _ in range(6)] + [_lanes(256, size)]
+            outer = _compress([_lanes(v, size) for v in _IV], words)
+        return np.stack(outer, axis=1)
+
+    def digest_batch(self, nonces) -> "np.ndarray":
+        """Digests for every nonce as a ``(len(nonces), 32)`` uint8 array in natural byte order."""
+        words = self.hash_words(nonces)
+        return words.astype('>u4').view(np.uint8).reshape(len(words), 32)
+
+    def search(self, target: bytes, start: int, end: int, stop=None, chunk_index: int = 0, check_interval: int = 1 << 12) -> tuple[int | None, bytes | None, int]:
+        """
+        Scan nonces in [start, end) for a digest below the target, one batch at a time.
+
+        The stop value is checked between batches, so ``check_interval`` is unused.
+
+        Returns:
+            tuple: ``(nonce, digest, attempts)``, with ``nonce`` and ``digest`` set to None on a miss.
+        """
+        target_words = np.frombuffer(target, dtype='>u4').astype(np.uint32)
+        attempts = 0
+        for batch_start in range(start, end, self.batch_size):
+            batch_end = min(batch_start + self.batch_size, end)
+            nonces = np.arange(batch_start, batch_end, dtype=np.uint64).astype(np.uint32)
+            words = self.hash_words(nonces)
+
+            # Lexicographic comparison of the eight big-endian words.
+            below = np.zeros(len(nonces), dtype=bool)
+            equal = np.ones(len(nonces), dtype=bool)
+            for i in range(8):
+                below |= equal & (words[:, i] < target_words[i])
+                equal &= words[:, i] == target_words[i]
+
+            if below.any():
+                index = int(below.argmax())
+                return batch_start + index, words[index].astype('>u4').tobytes(), attempts + index + 1
+            attempts += batch_end - batch_start
+            if stop is not None and stop.value < chunk_index:
+                break
+        return None, None, attempts
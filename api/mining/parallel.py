@@ -0,0 +1,179 @@
+import multiprocessing, os, sys, threading, time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from .backends import get_backend
+
+NONCE_LIMIT = 0x100000000
+DEFAULT_CHUNK_SIZE = 1 << 20
+PREFLIGHT_SIZE = 1 << 16
+STOP_CHECK_INTERVAL = 1 << 12
+# Search processes are never forked from the server: a fork copies the
+# locks its other threads hold at that moment, and a child can hang on one.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+@dataclass
+class MiningResult:
+    nonce: int | None
+    block_hash: str | None
+    attempts: int
+    elapsed: float
+    workers: int = 1
+
+    @property
+    def found(self) -> bool:
+        return self.nonce is not None
+
+    @property
+    def hashrate(self) -> float:
+        """Hashes per second over the whole search."""
+        return self.attempts / self.elapsed if self.elapsed > 0 else 0.0
+
+    def merge(self, other: "MiningResult") -> "MiningResult":
+        """Combine two consecutive searches, keeping the later outcome."""
+        return MiningResult(
+            nonce=other.nonce,
+            block_hash=other.block_hash,
+            attempts=self.attempts + other.attempts,
+            elapsed=self.elapsed + other.elapsed,
+            workers=max(self.workers, other.workers),
+        )
+
+def search_nonces(prefix: bytes, target: int, start: int, end: int, stop=None, chunk_index: int = 0, backend: str | None = None) -> tuple[int | None, bytes | None, int]:
+    """
+    Scan nonces in [start, end) and return the first one whose hash is below the target.
+
+    Args:
+        prefix (bytes): The 76-byte header without the nonce.
+        target (int): The proof-of-work target as an integer.
+        start (int): First nonce to try.
+        end (int): Nonce after the last one to try.
+        stop: Optional shared value holding the lowest chunk index with a hit so far.
+        chunk_index (int): Index of this range, compared against ``stop``.
+        backend (str): Name of the hashing backend, see ``get_backend``.
+
+    Returns:
+        tuple: ``(nonce, digest, attempts)``, with ``nonce`` and ``digest`` set to None on a miss.
+    """
+    target_bytes = target.to_bytes(32, 'big')
+    return get_backend(backend)(prefix).search(target_bytes, start, end, stop, chunk_index, STOP_CHECK_INTERVAL)
+
+# Process pool workers
+_found_chunk = None
+
+# The pool outlives a search, so its processes start once rather than per block.
+# One search runs on it at a time, each one already keeps every worker busy.
+_pool = None
+_pool_workers = None
+_pool_found_chunk = None
+_pool_lock = threading.Lock()
+
+def _init_worker(found_chunk):
+    global _found_chunk
+    _found_chunk = found_chunk
+
+def _search_chunk(prefix: bytes, target: int, backend: str | None, chunk_index: int, start: int, end: int):
+    nonce, digest, attempts = search_nonces(prefix, target, start, end, _found_chunk, chunk_index, backend)
+    if nonce is not None:
+        with _found_chunk.get_lock():
+            if chunk_index < _found_chunk.value:
+                _found_chunk.value = chunk_index
+    return chunk_index, nonce, digest, attempts
+
+def _search_pool(workers: int) -> tuple[ProcessPoolExecutor, object]:
+    """The pool of ``workers`` search processes and the value they share, started on first use."""
+    global _pool, _pool_workers, _pool_found_chunk
+    if _pool is None or _pool_workers != workers:
+        shutdown_search_pool()
+        context = multiprocessing.get_context(START_METHOD)
+        _pool_found_chunk = context.Value('q', sys.maxsize)
+        _pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_worker, initargs=(_pool_found_chunk,)
+        )
+        _pool_workers = workers
+    return _pool, _pool_found_chunk
+
+def shutdown_search_pool():
+    """Stop the search processes; the next parallel search starts new ones."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def mine_parallel(
+    prefix: bytes, target: int, workers: int | None = None,
+    start: int = 0, end: int = NONCE_LIMIT, chunk_size: int = DEFAULT_CHUNK_SIZE,
+    backend: str | None = None,
+) -> MiningResult:
+    """
+    Search the nonce range [start, end) across a process pool.
+
+    The range is split into ``chunk_size`` chunks handed out in order. When a
+    worker finds a valid nonce, chunks above it stop early while chunks below it
+    run to completion, so the result is always the lowest valid nonce — the same
+    one a serial scan would return. The processes are started with
+    ``START_METHOD`` and kept between calls, and concurrent calls take turns.
+
+    Args:
+        prefix (bytes): The 76-byte header without the nonce.
+        target (int): The proof-of-work target as an integer.
+        workers (int): Number of processes; ``None`` uses every core, 1 stays in-process.
+        start (int): First nonce to try.
+        end (int): Nonce after the last one to try.
+        chunk_size (int): Number of nonces per unit of work.
+        backend (str): Name of the hashing backend, see ``get_backend``.
+
+    Returns:
+        MiningResult: The nonce found (or None), attempts and timing.
+    """
+    workers = workers or os.cpu_count() or 1
+    t_0 = time.perf_counter()
+
+    # Easy targets are usually met within the first few thousand nonces,
+    # long before a process pool would have started.
+    preflight_end = end if workers <= 1 else min(end, start + PREFLIGHT_SIZE)
+    nonce, digest, attempts = search_nonces(prefix, target, start, preflight_end, backend=backend)
+    if nonce is not None or preflight_end >= end:
+        return MiningResult(
+            nonce=nonce,
+            block_hash=digest.hex() if digest else None,
+            attempts=attempts,
+            elapsed=time.perf_counter() - t_0,
+        )
+
+    chunks = (
+        (index, chunk_start, min(chunk_start + chunk_size, end))
+        for index, chunk_start in enumerate(range(preflight_end, end, chunk_size))
+    )
+    best = None
+    with _pool_lock:
+        pool, found_chunk = _search_pool(workers)
+        found_chunk.value = sys.maxsize
+        pending = set()
+        try:
+            while True:
+                while best is None and len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.add(pool.submit(_search_chunk, prefix, target, backend, *chunk))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, nonce, digest, chunk_attempts = future.result()
+                    attempts += chunk_attempts
+                    if nonce is not None and (best is None or index < best[0]):
+                        best = (index, nonce, digest)
+        except BaseException:
+            # Chunks still running would share the next search's stop value, and a dead worker breaks the pool.
+            shutdown_search_pool()
+            raise
+
+    return MiningResult(
+        nonce=best[1] if best else None,
+        block_hash=best[2].hex() if best else None,
+        attempts=attempts,
+        elapsed=time.perf_counter() - t_0,
+        workers=workers,
+    )
@@ -0,0 +1,84 @@
+import hashlib, struct, time
+
+HEADER_PREFIX_SIZE = 76
+HEADER_SIZE = 80
+SHA256_BLOCK_SIZE = 64
+
+# BlockHeader._header_data() reverses the whole concatenation, which leaves
+# the bits first and the timestamp right after them in big-endian order.
+TIMESTAMP_OFFSET = 4
+
+class HeaderTemplate:
+    """
+    A serialized block header kept in a preallocated 80-byte buffer.
+
+    The 76-byte prefix is written once. Each round only the nonce is packed
+    into the last four bytes, and the SHA-256 state of the first 64 bytes is
+    copied instead of hashed again.
+    """
+
+    def __init__(self, prefix: bytes):
+        if len(prefix) != HEADER_PREFIX_SIZE:
+            raise ValueError(f"Header prefix must be {HEADER_PREFIX_SIZE} bytes, got {len(prefix)}.")
+        self.buffer = bytearray(HEADER_SIZE)
+        self.buffer[:HEADER_PREFIX_SIZE] = prefix
+        self._tail = memoryview(self.buffer)[SHA256_BLOCK_SIZE:]
+        self._midstate = hashlib.sha256(self.buffer[:SHA256_BLOCK_SIZE])
+
+    @classmethod
+    def from_header(cls, header) -> "HeaderTemplate":
+        """Build a template from a BlockHeader."""
+        return cls(header._header_data())
+
+    @property
+    def prefix(self) -> bytes:
+        return bytes(self.buffer[:HEADER_PREFIX_SIZE])
+
+    @property
+    def timestamp(self) -> int:
+        return struct.unpack_from('>I', self.buffer, TIMESTAMP_OFFSET)[0]
+
+    def set_timestamp(self, timestamp: int):
+        """Write a new timestamp; it lives in the first block, so the midstate is rebuilt."""
+        struct.pack_into('>I', self.buffer, TIMESTAMP_OFFSET, timestamp)
+        self._midstate = hashlib.sha256(self.buffer[:SHA256_BLOCK_SIZE])
+
+    def roll_timestamp(self) -> int:
+        """Move to the current time, or one second past the old timestamp if the clock has not advanced."""
+        timestamp = max(int(time.time()), self.timestamp + 1) & 0xFFFFFFFF
+        self.set_timestamp(timestamp)
+        return timestamp
+
+    def digest(self, nonce: int) -> bytes:
+        """Double SHA-256 of the header with the given nonce, in natural byte order."""
+        struct.pack_into('<I', self.buffer, HEADER_PREFIX_SIZE, nonce)
+        inner = self._midstate.copy()
+        inner.update(self._tail)
+        return hashlib.sha256(inner.digest()).digest()
+
+    def search(self, target: bytes, start: int, end: int, stop=None, chunk_index: int = 0, check_interval: int = 1 << 12) -> tuple[int | None, bytes | None, int]:
+        """
+        Scan nonces in [start, end) for a digest below the target.
+
+        The target is 32 big-endian bytes, so the check is a plain bytes
+        comparison with no hex or integer conversion.
+
+        Returns:
+            tuple: ``(nonce, digest, attempts)``, with ``nonce`` and ``digest`` set to None on a miss.
+        """
+        buffer = self.buffer
+        tail = self._tail
+        copy = self._midstate.copy
+        pack_into = struct.pack_into
+        sha256 = hashlib.sha256
+        mask = check_interval - 1
+        for nonce in range(start, end):
+            pack_into('<I', buffer, HEADER_PREFIX_SIZE, nonce)
+            inner = copy()
+            inner.update(tail)
+            digest = sha256(inner.digest()).digest()
+            if digest < target:
+                return nonce, digest, nonce - start + 1
+            if stop is not None and not (nonce - start + 1) & mask and stop.value < chunk_index:
+                return None, None, nonce - start + 1
+        return None, None, max(end - start, 0)
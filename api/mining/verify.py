@@ -0,0 +1,150 @@
+import hashlib, multiprocessing, os, struct, threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ecdsa import VerifyingKey, SECP256k1, BadSignatureError, MalformedPointError
+from ..light_client import bits_to_target
+from .parallel import START_METHOD
+
+DEFAULT_VERIFY_CHUNK_SIZE = 4096
+
+# Fields of one header row, in the order the verifier reads them. ``raw`` is
+# the stored 80-byte header, None unless headers are stored in binary.
+HEADER_ROW_FIELDS = ("height", "block_hash", "previous_hash", "merkle_root", "version", "bits", "timestamp", "nonce", "raw")
+
+def header_bytes(version: str, previous_hash: str, merkle_root: str, timestamp: int, bits: str, nonce: int) -> bytes:
+    """The serialized header ``BlockHeader.serialize`` produces, built from its stored fields."""
+    return (
+        bytes.fromhex(bits) + struct.pack('>I', timestamp) + bytes.fromhex(merkle_root)
+        + bytes.fromhex(previous_hash) + bytes.fromhex(version) + struct.pack('<I', nonce)
+    )
+
+def verify_signature(public_key: str, digest: bytes, signature: str) -> bool:
+    """Check a secp256k1 signature over a digest against a compressed public key in hex."""
+    try:
+        verifying_key = VerifyingKey.from_string(bytes.fromhex(public_key), curve=SECP256k1)
+        return verifying_key.verify_digest(bytes.fromhex(signature), digest)
+    except (BadSignatureError, MalformedPointError, ValueError):
+        return False
+
+def verify_chunk(rows: list[tuple], check_work: bool = True, check_seals: bool = False) -> tuple[int, str] | None:
+    """
+    Recompute the hash of every header in a chunk and check it against its target or its seal.
+
+    Each row starts with the ``HEADER_ROW_FIELDS``, followed by the signer and
+    signature when ``check_seals`` is set; anything after them is ignored.
+    Rows that carry their raw header are hashed as stored, the others are
+    serialized from their fields first. Rows do not depend on each other, so
+    chunks can be checked in any process. Whether a signer was an authority
+    at its height is left to the caller, only the signature is checked here.
+
+    Returns:
+        tuple: ``(height, reason)`` of the first failing header, or None.
+    """
+    sha256 = hashlib.sha256
+    for height, block_hash, previous_hash, merkle_root, version, bits, timestamp, nonce, raw, *seal in rows:
+        if raw is None:
+            raw = header_bytes(version, previous_hash, merkle_root, timestamp, bits, nonce)
+        digest = sha256(sha256(raw).digest())
+        if digest.hexdigest() != block_hash:
+            return height, "failed header validation"
+        if check_work and int(block_hash, 16) >= bits_to_target(bits):
+            return height, "does not meet the proof-of-work requirement"
+        if check_seals and not (seal[1] and verify_signature(seal[0], digest.digest(), seal[1])):
+            return height, "is not sealed by an authority of the chain"
+    return None
+
+# Like the search pool, the verify pool is started once and kept between
+# validations, which take turns on it.
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def _verify_pool(workers: int) -> ProcessPoolExecutor:
+    """The pool of ``workers`` verify processes, started on first use."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_verify_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+        _pool_workers = workers
+    return _pool
+
+def shutdown_verify_pool():
+    """Stop the verify processes; the next parallel validation starts new ones."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+class HeaderVerifier:
+    """
+    Checks chunks of header rows across a process pool while the caller streams them in.
+
+    The first chunk is checked in-process, and the pool only starts when a
+    second one arrives, so short suffixes never pay for process startup. The
+    processes are started with ``START_METHOD`` and kept between verifiers,
+    and a verifier holds the pool until its ``with`` block ends. At most
+    ``workers * 2`` chunks are in flight, which keeps memory bounded however
+    long the chain is. ``failure`` is the lowest failing height seen so far;
+    after the ``with`` block every submitted chunk has been checked.
+    """
+
+    def __init__(self, workers: int | None = None, check_work: bool = True, check_seals: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        self.check_work = check_work
+        self.check_seals = check_seals
+        self.failure = None
+        self._pool = None
+        self._pending = set()
+        self._submitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self._pool is None:
+            return False
+        try:
+            if exc_type is None:
+                self._collect(set(self._pending), wait_all=True)
+            else:
+                # The outcome no longer matters, only that no chunk is left running on the pool.
+                for future in self._pending:
+                    future.cancel()
+                wait(self._pending)
+                if issubclass(exc_type, BrokenExecutor):
+                    shutdown_verify_pool()
+        except BaseException:
+            # A dead worker breaks the pool for every later verifier too.
+            shutdown_verify_pool()
+            raise
+        finally:
+            self._pool = None
+            _pool_lock.release()
+        return False
+
+    def submit(self, rows: list[tuple]):
+        if not rows:
+            return
+        self._submitted += 1
+        if self.workers <= 1 or self._submitted == 1:
+            self._record(verify_chunk(rows, self.check_work, self.check_seals))
+            return
+        if self._pool is None:
+            _pool_lock.acquire()
+            try:
+                self._pool = _verify_pool(self.workers)
+            except BaseException:
+                _pool_lock.release()
+                raise
+        if len(self._pending) >= self.workers * 2:
+            self._collect(self._pending)
+        self._pending.add(self._pool.submit(verify_chunk, rows, self.check_work, self.check_seals))
+
+    def _collect(self, futures: set, wait_all: bool = False):
+        done, _ = wait(futures, return_when='ALL_COMPLETED' if wait_all else FIRST_COMPLETED)
+        for future in done:
+            self._pending.discard(future)
+            self._record(future.result())
+
+    def _record(self, failure: tuple[int, str] | None):
+        if failure is not None and (self.failure is None or failure[0] < self.failure[0]):
+            self.failure = failure
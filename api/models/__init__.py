@@ -1,13 +1,21 @@
-from .blockchain_models import Block, BlockHeader, Blockchain, ChainUser
+from .blockchain_models import Block, BlockHeader, Blockchain, ChainUser, MiningJob, MempoolEntry, BlockTxid, JournalState, AuthorityChange
 from .accounting_models import Account, GeneralJournal, Transaction, TransactionLine
+from .merkle_models import MerkleNode, JournalMerkleTree
 
 __all__ = [
     "Block", 
     "BlockHeader", 
     "Blockchain",
     "ChainUser", 
+    "MiningJob",
+    "MempoolEntry",
+    "BlockTxid",
+    "JournalState",
+    "AuthorityChange",
     "Account", 
     "GeneralJournal", 
     "Transaction", 
-    "TransactionLine"
+    "TransactionLine",
+    "MerkleNode",
+    "JournalMerkleTree",
 ]
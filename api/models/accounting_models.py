@@ -1,6 +1,69 @@
 import uuid
-from .utils import sha256, str_to_natural_byte_order, natural_byte_order_to_str
-from django.db import models
+from decimal import Decimal
+from .utils import sha256, str_to_natural_byte_order, natural_byte_order_to_str, to_minor_units, from_minor_units
+from .merkle_models import JournalMerkleTree, EMPTY_MERKLE_ROOT
+from django.conf import settings
+from django.db import models, transaction as db_transaction
+from django.db.models import F, Sum
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+def minor_amounts() -> bool:
+    """Whether new amounts are stored as integer minor units (``AMOUNT_STORAGE = "minor"``)."""
+    return getattr(settings, 'AMOUNT_STORAGE', 'decimal') == 'minor'
+
+def company_scale(company: str) -> int:
+    """Decimal places of a company's currency, from ``CURRENCY_SCALES``."""
+    return getattr(settings, 'CURRENCY_SCALES', {}).get(company, getattr(settings, 'DEFAULT_CURRENCY_SCALE', 2))
+
+def shift_amounts(columns: tuple[str, ...], value: Decimal, scale: int | None) -> dict:
+    """
+    ``update()`` arguments adding ``value`` to amount columns in both representations.
+    
+    Only one of an amount's columns is set on any row, and adding to NULL
+    leaves it NULL, so the same update serves rows of either storage.
+    """
+    changes = {column: F(column) + value for column in columns}
+    if scale is not None:
+        minor = to_minor_units(value, scale)
+        changes.update({f"{column}_minor": F(f"{column}_minor") + minor for column in columns})
+    return changes
+
+class AmountAttribute(DeferredAttribute):
+    """Reads an amount as a Decimal, from its ``<name>_minor`` units when the decimal column was left empty."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value is None:
+            minor = getattr(instance, f"{self.field.attname}_minor")
+            if minor is not None:
+                return from_minor_units(minor, instance.amount_scale)
+        return value
+    
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+        if value is not None:
+            # A new amount replaces the minor units it was read from.
+            instance.__dict__[f"{self.field.attname}_minor"] = None
+
+class AmountField(models.DecimalField):
+    """
+    A ledger amount. With ``AMOUNT_STORAGE = "minor"`` the decimal column is
+    left empty and the amount goes to the ``<name>_minor`` BigIntegerField
+    as whole minor units at the row's ``amount_scale``.
+    """
+    descriptor_class = AmountAttribute
+    
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        minor = None
+        if value is not None and minor_amounts():
+            minor, value = to_minor_units(value, model_instance.amount_scale), None
+        model_instance.__dict__[f"{self.attname}_minor"] = minor
+        return value
 
 # Models
 ACCOUNT_TYPES = [
@@ -25,14 +88,59 @@ class GeneralJournal(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, max_length=255)
     company = models.CharField(max_length=255)
     period = models.DateField(verbose_name="Journal Period")
-    balance = models.DecimalField(decimal_places=2, max_digits=100)
+    balance = AmountField(decimal_places=2, max_digits=100, null=True)
+    balance_minor = models.BigIntegerField(null=True, blank=True, editable=False)
     is_deleted = models.BooleanField(default=False)
+    merkle_size = models.PositiveIntegerField(default=0, editable=False)
+    merkle_root = models.CharField(max_length=64, default=EMPTY_MERKLE_ROOT, editable=False)
+    # Sums of the journal's transaction lines, kept in step by TransactionLine saves and deletes.
+    debit_total = AmountField(decimal_places=2, max_digits=100, default=0, null=True, editable=False)
+    debit_total_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    credit_total = AmountField(decimal_places=2, max_digits=100, default=0, null=True, editable=False)
+    credit_total_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    # Decimal places of the company's currency, fixed when the journal is first saved.
+    amount_scale = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return self.id
     
+    @property
+    def merkle_tree(self) -> JournalMerkleTree:
+        return JournalMerkleTree(self)
+    
+    @property
+    def scale(self) -> int:
+        """Decimal places of the journal's amounts."""
+        return self.amount_scale if self.amount_scale is not None else company_scale(self.company)
+    
+    def account_totals(self) -> dict:
+        """
+        Debit and credit totals per account over the journal's lines, summed by the database.
+        
+        Returns:
+            dict: ``{account_id: (debits, credits)}`` as exact Decimals.
+        """
+        rows = TransactionLine.objects.filter(transaction__journal=self).values_list("account_id", "is_debit").annotate(
+            amount=Sum("value"), minor=Sum("value_minor"),
+        ).order_by()
+        totals = {}
+        for account_id, is_debit, amount, minor in rows:
+            amount = (amount or 0) + (from_minor_units(minor, self.scale) if minor is not None else 0)
+            debits, credits = totals.get(account_id, (0, 0))
+            totals[account_id] = (debits + amount, credits) if is_debit else (debits, credits + amount)
+        return totals
+    
     def save(self, *args, **kwargs):
-        self.balance = sum(tx.total_debits() for tx in self.transactions.all())
+        # The Merkle tree fields are written by JournalMerkleTree and the totals
+        # by the transaction lines, never from a stale instance.
+        stored = GeneralJournal.objects.filter(pk=self.pk).values_list(
+            "amount_scale", "merkle_size", "merkle_root", "debit_total", "credit_total", "debit_total_minor", "credit_total_minor",
+        ).first()
+        if stored:
+            (self.amount_scale, self.merkle_size, self.merkle_root,
+             self.debit_total, self.credit_total, self.debit_total_minor, self.credit_total_minor) = stored
+        self.amount_scale = self.scale
+        self.balance = self.debit_total
         super(GeneralJournal, self).save(*args, **kwargs)
 
 class Transaction(models.Model):
@@ -44,32 +152,97 @@ class Transaction(models.Model):
         GeneralJournal, on_delete=models.CASCADE, related_name="transactions"
     )
     txid = models.CharField(max_length=64, unique=True, blank=True, null=True)
-    total = models.DecimalField(decimal_places=2, max_digits=100)
+    total = AmountField(decimal_places=2, max_digits=100, null=True)
+    total_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    merkle_index = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Sums of the transaction's lines, kept in step by TransactionLine saves and deletes.
+    debit_total = AmountField(decimal_places=2, max_digits=100, default=0, null=True, editable=False)
+    debit_total_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    credit_total = AmountField(decimal_places=2, max_digits=100, default=0, null=True, editable=False)
+    credit_total_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    # The journal's scale, see GeneralJournal.amount_scale.
+    amount_scale = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"Transaction #{self.id}: {self.description}"
     
+    @property
+    def scale(self) -> int:
+        """Decimal places of the transaction's amounts, its journal's."""
+        return self.amount_scale if self.amount_scale is not None else self.journal.scale
+    
+    def default_txid(self) -> str:
+        """The txid given to a transaction saved without one, a hash of its date, description and journal."""
+        serialized_data = f"{self.date.isoformat()}-{self.description}-{self.journal_id}"
+        return natural_byte_order_to_str(sha256(serialized_data.encode()))
+    
     def total_debits(self):
         """Sum of all debit values for this transaction."""
-        return sum(line.value for line in self.lines.filter(is_debit=True))
+        return self.debit_total
     
     def total_credits(self):
         """Sum of all credit values for this transaction."""
-        return sum(line.value for line in self.lines.filter(is_debit=False))
+        return self.credit_total
     
     def is_balanced(self):
         """Check if the transaction is balanced."""
         return self.total_debits() == self.total_credits()
     
     def save(self, *args, **kwargs):
-        if not self.is_balanced():
-            raise ValueError("Transaction is not balanced: Debits and Credits do not match.")
-        else:
-            self.total = self.total_debits()
         if not self.txid:
-            serialized_data = f"{self.date.isoformat()}-{self.description}-{self.journal.id}"
-            self.txid = natural_byte_order_to_str(sha256(serialized_data.encode()))
-        super(Transaction, self).save(*args, **kwargs)
+            self.txid = self.default_txid()
+        
+        with db_transaction.atomic():
+            stored = None
+            if not self._state.adding:
+                stored = Transaction.objects.filter(pk=self.pk).values_list(
+                    "journal_id", "merkle_index", "amount_scale", "debit_total", "credit_total", "debit_total_minor", "credit_total_minor",
+                ).first()
+            if stored is not None:
+                # The totals are written by the lines, never from a stale instance.
+                self.amount_scale, self.debit_total, self.credit_total, self.debit_total_minor, self.credit_total_minor = stored[2:]
+            if not self.is_balanced():
+                raise ValueError("Transaction is not balanced: Debits and Credits do not match.")
+            self.total = self.total_debits()
+            
+            if stored is not None and stored[0] != self.journal_id and self.amount_scale not in (None, self.journal.scale):
+                raise ValueError("Transaction cannot move to a journal in a currency with a different scale.")
+            self.amount_scale = self.journal.scale
+            if stored is None:
+                self.merkle_index = self.journal.merkle_tree.append(self.txid)
+            else:
+                previous_journal_id, self.merkle_index = stored[:2]
+                if previous_journal_id != self.journal_id:
+                    # Moving to another journal removes the leaf from one tree and appends it to the other.
+                    if self.merkle_index is not None:
+                        GeneralJournal.objects.get(pk=previous_journal_id).merkle_tree.remove(self.merkle_index)
+                    self.merkle_index = None
+                    # The totals move along with it.
+                    for journal_id, sign in ((previous_journal_id, -1), (self.journal_id, 1)):
+                        GeneralJournal.objects.filter(pk=journal_id).update(
+                            **shift_amounts(("debit_total", "balance"), sign * self.debit_total, self.amount_scale),
+                            **shift_amounts(("credit_total",), sign * self.credit_total, self.amount_scale),
+                        )
+                if self.merkle_index is None:
+                    self.merkle_index = self.journal.merkle_tree.append(self.txid)
+            super(Transaction, self).save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            stored = Transaction.objects.filter(pk=self.pk).values_list(
+                "merkle_index", "debit_total", "credit_total", "debit_total_minor", "credit_total_minor",
+            ).first()
+            if stored is not None:
+                # The journal loses the totals the lines wrote, not those of a stale instance.
+                self.merkle_index, self.debit_total, self.credit_total, self.debit_total_minor, self.credit_total_minor = stored
+            if self.merkle_index is not None:
+                self.journal.merkle_tree.remove(self.merkle_index)
+            return super(Transaction, self).delete(*args, **kwargs)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=["journal", "merkle_index"]),
+        ]
 
 class TransactionLine(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
@@ -78,18 +251,94 @@ class TransactionLine(models.Model):
     )
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     is_debit = models.BooleanField()
-    value = models.DecimalField(decimal_places=2, max_digits=100)
+    value = AmountField(decimal_places=2, max_digits=100, null=True)
+    value_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    # The transaction's scale, see GeneralJournal.amount_scale.
+    amount_scale = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"{'Debit' if self.is_debit else 'Credit'}: {self.account.name} - {self.value}"
-        
+    
+    def check_value(self, scale: int):
+        """
+        Raises:
+            ValueError: When the value has more decimal places than ``scale``, or than the decimal column keeps.
+        """
+        if not minor_amounts():
+            scale = min(scale, self._meta.get_field("value").decimal_places)
+        to_minor_units(self.value, scale)
+    
     def save(self, *args, **kwargs):
-        super(TransactionLine, self).save(*args, **kwargs)
+        self.amount_scale = self.transaction.scale
+        self.check_value(self.amount_scale)
+        with db_transaction.atomic():
+            stored = None
+            if not self._state.adding:
+                stored = TransactionLine.objects.filter(pk=self.pk).values_list(
+                    "transaction_id", "is_debit", "amount_scale", "value", "value_minor",
+                ).first()
+            super(TransactionLine, self).save(*args, **kwargs)
+            value = self._meta.get_field("value").to_python(self.value)
+            if stored is not None:
+                transaction_id, is_debit, stored_scale, stored_value, minor = stored
+                stored_value = stored_value if stored_value is not None else from_minor_units(minor, stored_scale)
+                if (transaction_id, is_debit, stored_scale) == (self.transaction_id, self.is_debit, self.amount_scale):
+                    # An edit in place only moves the totals by the difference.
+                    value -= stored_value
+                else:
+                    self.add_to_totals(transaction_id, is_debit, -stored_value, stored_scale)
+            if value:
+                self.add_to_totals(self.transaction_id, self.is_debit, value, self.amount_scale)
+    
+    def add_to_totals(self, transaction_id, is_debit: bool, value, scale: int | None):
+        """
+        Move the debit or credit total of a transaction and its journal by ``value``.
+        
+        Both are ``F()`` updates done by the database, on integer minor
+        units for rows stored that way, so the cost does not depend on how
+        many lines the transaction has, and concurrent line saves do not
+        overwrite each other. The line's transaction, if loaded, is updated
+        in memory too.
+        """
+        value = self._meta.get_field("value").to_python(value)
+        column = "debit_total" if is_debit else "credit_total"
+        transaction = self._meta.get_field("transaction").get_cached_value(self, None)
+        if transaction is None or transaction.pk != transaction_id:
+            transaction = None
+        Transaction.objects.filter(pk=transaction_id).update(**shift_amounts((column, "total") if is_debit else (column,), value, scale))
+        journals = GeneralJournal.objects.filter(pk=transaction.journal_id) if transaction else GeneralJournal.objects.filter(transactions=transaction_id)
+        journals.update(**shift_amounts((column, "balance") if is_debit else (column,), value, scale))
+        if transaction is not None:
+            setattr(transaction, column, getattr(transaction, column) + value)
+            transaction.total = transaction.debit_total
     
     class Meta:
         constraints = [
             models.CheckConstraint(
-                check=models.Q(value__gt=0),
+                check=models.Q(value__gt=0) | models.Q(value__isnull=True, value_minor__gt=0),
                 name="check_positive_transaction_value",
             )
         ]
+
+def deleted_from(origin, *senders) -> bool:
+    """Whether the delete a signal reports was started on an instance or queryset of one of ``senders``."""
+    model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    return model in senders
+
+@receiver(post_delete, sender=TransactionLine)
+def subtract_line_from_totals(sender, instance: TransactionLine, origin=None, **kwargs):
+    # Also runs for lines removed by a cascade, e.g. from their account, so bulk and related deletes keep the totals too.
+    # Lines going with their transaction are left to subtract_transaction_from_journal.
+    if deleted_from(origin, Transaction, GeneralJournal):
+        return
+    instance.add_to_totals(instance.transaction_id, instance.is_debit, -instance.value, instance.amount_scale)
+
+@receiver(post_delete, sender=Transaction)
+def subtract_transaction_from_journal(sender, instance: Transaction, origin=None, **kwargs):
+    """Take a deleted transaction's totals off its journal in one update, unless the journal is being deleted too."""
+    if deleted_from(origin, GeneralJournal):
+        return
+    GeneralJournal.objects.filter(pk=instance.journal_id).update(
+        **shift_amounts(("debit_total", "balance"), -instance.debit_total, instance.amount_scale),
+        **shift_amounts(("credit_total",), -instance.credit_total, instance.amount_scale),
+    )
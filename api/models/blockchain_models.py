@@ -1,11 +1,20 @@
 from typing import List
-import os, uuid, json
+import os, uuid, json, time, hashlib
+from collections import deque
+from itertools import islice
 from datetime import datetime
 from ecdsa import SigningKey, SECP256k1
-from .utils import sha256, int_to_little_endian, datetime_to_little_endian, little_endian_to_int, little_endian_to_datetime, str_to_natural_byte_order, natural_byte_order_to_str, compute_merkle_root
+from .utils import sha256, int_to_little_endian, datetime_to_little_endian, little_endian_to_int, little_endian_to_datetime, str_to_natural_byte_order, natural_byte_order_to_str, compute_merkle_root, merkle_branch, txid_changes, apply_txid_changes, bits_to_target_int, target_int_to_bits, block_work, retarget, verify_signature
 from .accounting_models import GeneralJournal
+from ..blockstore import flat_file_bodies, binary_bodies, body_compression, get_block_store, get_block_archive, archive_chunk_size, sync_block_store, encode_body, decode_body, body_size, is_encoded_body
+from ..mining import HeaderTemplate, MiningResult, mine_parallel, HeaderVerifier, HEADER_ROW_FIELDS, DEFAULT_VERIFY_CHUNK_SIZE
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from rest_framework.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
@@ -13,14 +22,122 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 
 DEFAULT_HASH = b'\x00'*32
 
+# Blocks per keyset page when streaming a chain.
+CHAIN_PAGE_SIZE = 10_000
+
+# Fields a journal payload carries whether it lists every txid or only the changes.
+JOURNAL_FIELDS = ("action", "journal_id", "company", "period", "balance")
+
+CONSENSUS_MODES = [
+    ('pow', 'Proof of Work'),
+    ('poa', 'Proof of Authority'),
+]
+
+MINING_JOB_STATUSES = [
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('mined', 'Mined'),
+    ('failed', 'Failed'),
+]
+
 # Models
+# Where each hex header field sits in the serialized header.
+PACKED_HEADER_SPANS = {"bits": (0, 4), "merkle_root": (8, 40), "previous_hash": (40, 72), "version": (72, 76)}
+
+def binary_headers() -> bool:
+    return getattr(settings, 'HEADER_STORAGE', 'text') == 'binary'
+
+class PackedHexAttribute(DeferredAttribute):
+    """Reads a hex header field, slicing it out of the raw header only when the column was left empty."""
+    
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value == '':
+            raw = instance.raw
+            if raw:
+                begin, end = PACKED_HEADER_SPANS[self.field.attname]
+                value = instance.__dict__[self.field.attname] = bytes(raw[begin:end]).hex()
+        return value
+    
+    def __set__(self, instance, value):
+        # A data descriptor, so reads go through __get__ even once the value is in the instance dict.
+        instance.__dict__[self.field.attname] = value
+
+class PackedHexField(models.TextField):
+    """A hex header field whose column stays empty when headers are stored in binary."""
+    descriptor_class = PackedHexAttribute
+    
+    def pre_save(self, model_instance, add):
+        return '' if binary_headers() else super().pre_save(model_instance, add)
+
+class RawHeaderField(models.BinaryField):
+    """The serialized 80-byte header, written only when headers are stored in binary."""
+    
+    def pre_save(self, model_instance, add):
+        value = model_instance.serialize() if binary_headers() else None
+        setattr(model_instance, self.attname, value)
+        return value
+
+class StoredBodyAttribute(DeferredAttribute):
+    """
+    Reads a block body as JSON text, whether it was stored as text, as an
+    encoded ``body`` or in the flat-file store. Text set on the block wins
+    over any encoded body it had.
+    """
+    
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value == '':
+            body = instance.encoded_body()
+            if body is not None:
+                return json.dumps(decode_body(body), indent=4)
+            record = instance.stored_record()
+            if record is not None:
+                return str(record, 'utf-8')
+        return value
+    
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+        if value:
+            instance.__dict__['body'] = None
+
+class BlockBodyField(models.TextField):
+    """
+    A block body that is appended to the flat-file store when ``BLOCK_STORE``
+    is ``"flatfile"``, leaving the columns empty and the record's location in
+    ``body_segment`` and ``body_offset``.
+    """
+    descriptor_class = StoredBodyAttribute
+    
+    def pre_save(self, model_instance, add):
+        unchanged = model_instance.__dict__.get(self.attname) == '' and model_instance.body is None
+        if unchanged and (model_instance.archive_chunk is not None or (model_instance.body_segment is not None and flat_file_bodies())):
+            # Saved again unchanged, the record already in the store or archive stays where it is.
+            return ''
+        body = model_instance.encoded_body()
+        model_instance.archive_chunk = model_instance.archive_generation = model_instance.archive_offset = None
+        value = '' if body is not None else super().pre_save(model_instance, add)
+        if not flat_file_bodies():
+            model_instance.body = bytes(body) if body is not None else None
+            model_instance.body_segment = model_instance.body_offset = None
+            return value
+        model_instance.body_segment, model_instance.body_offset = get_block_store().append(
+            bytes(body) if body is not None else value.encode('utf-8')
+        )
+        model_instance.body = None
+        return ''
+
 class BlockHeader(models.Model):
     timestamp = models.IntegerField(null=True)
-    version = models.TextField(
+    version = PackedHexField(
         null=False, blank=False, 
         default=natural_byte_order_to_str(int_to_little_endian(0x20000000))
     )
-    bits = models.TextField(
+    bits = PackedHexField(
         null=False, blank=False, 
         default="1d00ffff"
     )
@@ -32,11 +149,11 @@ class BlockHeader(models.Model):
             MinValueValidator(0)
         ]
     )
-    previous_hash = models.TextField(
+    previous_hash = PackedHexField(
         default=natural_byte_order_to_str(DEFAULT_HASH), 
         null=False, blank=False
     )
-    merkle_root = models.TextField(
+    merkle_root = PackedHexField(
         default=natural_byte_order_to_str(DEFAULT_HASH), 
         null=False, blank=False
     )
@@ -44,6 +161,12 @@ class BlockHeader(models.Model):
         primary_key=True, default=natural_byte_order_to_str(DEFAULT_HASH), 
         null=False, blank=False
     )
+    # Binary storage (HEADER_STORAGE = "binary"): the hex fields above are
+    # left empty and read back from the raw header on first access.
+    raw = RawHeaderField(max_length=80, null=True, blank=True)
+    # Proof-of-authority seal over the block hash, not part of the hashed header.
+    signer = models.TextField(null=True, blank=True)
+    signature = models.TextField(null=True, blank=True)
     
     def __init__(self, *args, **kwargs):
         super(BlockHeader, self).__init__(*args, **kwargs)
@@ -69,9 +192,13 @@ class BlockHeader(models.Model):
             str_to_natural_byte_order(self.bits)[::-1]
         )[::-1]
     
+    def serialize(self) -> bytes:
+        """The 80-byte header that is hashed, nonce included; what light clients download."""
+        return self._header_data() + int_to_little_endian(self.nonce)
+    
     def compute_block_hash(self) -> str:
         """Compute the block hash as the double SHA-256 of the header."""
-        header = self._header_data() + int_to_little_endian(self.nonce)
+        header = self.serialize()
         hash1 = sha256(header)
         hash2 = sha256(hash1)
         return natural_byte_order_to_str(hash2)
@@ -82,67 +209,813 @@ class BlockHeader(models.Model):
     
     def bits_to_target(self, bits: str) -> bytes:
         """Convert the compact bits representation to the full target in bytes."""
-        if len(bits) != 8:
-            raise ValueError("Bits must be exactly 8 characters long.")
-        exponent = int(bits[:2], 16)
-        coefficient = int(bits[2:], 16)
-        target = coefficient * (2 ** (8 * (exponent - 3)))
-        return target.to_bytes(32, byteorder='big')
+        return bits_to_target_int(bits).to_bytes(32, byteorder='big')
     
     @staticmethod
     def target_to_bits(target: bytes) -> str:
         """Convert the full target to its compact bits representation."""
-        target_int = int.from_bytes(target, byteorder="big")
-        hex_target = f"{target_int:064x}"
-        first_non_zero = next((i for i, c in enumerate(hex_target) if c != "0"), len(hex_target))
-        coefficient = int(hex_target[first_non_zero:first_non_zero + 6], 16)
-        exponent = (len(hex_target) - first_non_zero + 2) // 2
-        if coefficient > 0x7fffff:
-            coefficient >>= 8
-            exponent += 1
-        bits = f"{exponent:02x}{coefficient:06x}"
-        return bits
-    
-    def mine(self, target):
-        """Mine the block by finding a nonce that produces a hash below the target."""
+        return target_int_to_bits(int.from_bytes(target, byteorder="big"))
+    
+    def mine(self, target, workers: int | None = None, backend: str | None = None) -> MiningResult:
+        """
+        Mine the block by finding a nonce that produces a hash below the target.
+
+        The nonce search is spread over ``workers`` processes (``MINING_WORKERS``
+        by default) using the ``backend`` hashing engine (``MINING_BACKEND`` by
+        default). When the nonce space is exhausted the timestamp is refreshed
+        and the search restarts from zero.
+        """
+        if workers is None:
+            workers = getattr(settings, 'MINING_WORKERS', 1)
+        if backend is None:
+            backend = getattr(settings, 'MINING_BACKEND', None)
+        target_int = int(target, 16)
+        template = HeaderTemplate.from_header(self)
+        result = None
         while True:
-            self.block_hash = self.compute_block_hash()
-            print(self.nonce, ':', self.block_hash)
-            if int(self.block_hash, 16) < int(target, 16):
+            attempt = mine_parallel(template.prefix, target_int, workers=workers, start=self.nonce, backend=backend)
+            result = attempt if result is None else result.merge(attempt)
+            if attempt.found:
                 break
-            self.nonce += 1
-            if self.nonce > 0xFFFFFFFF:
-                self.timestamp = int(datetime.now())
-                self.nonce = 0
+            self.timestamp = template.roll_timestamp()
+            self.nonce = 0
+        self.nonce = result.nonce
+        self.save()
+        return result
+
+    def seal(self, chain_user: "ChainUser") -> MiningResult:
+        """Seal the block for proof-of-authority by signing its hash instead of searching for a nonce."""
+        t_0 = time.perf_counter()
+        self.nonce = 0
+        self.block_hash = self.compute_block_hash()
+        self.signer = chain_user.public_key
+        self.signature = chain_user.sign(str_to_natural_byte_order(self.block_hash))
         self.save()
+        return MiningResult(nonce=0, block_hash=self.block_hash, attempts=1, elapsed=time.perf_counter() - t_0)
+    
+    def has_valid_seal(self, authorities: set[str]) -> bool:
+        """Check that the block is signed by one of the given public keys."""
+        if not self.signer or not self.signature or self.signer not in authorities:
+            return False
+        return verify_signature(self.signer, str_to_natural_byte_order(self.compute_block_hash()), self.signature)
 
 class Blockchain(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     target = models.TextField(default="0ffff00000000000000000000000000000000000000000000000000000000000")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Difficulty retargeting; while enabled, target holds the latest retargeted value.
+    retarget_enabled = models.BooleanField(default=False)
+    block_interval = models.IntegerField(default=60, validators=[MinValueValidator(1)])
+    retarget_window = models.IntegerField(default=10, validators=[MinValueValidator(2)])
+    retarget_max_step = models.FloatField(default=4.0, validators=[MinValueValidator(1.0)])
+    # First height the retarget rule applies to, set when retargeting is switched on, so earlier blocks stay valid.
+    retarget_height = models.IntegerField(null=True, blank=True)
+    consensus = models.CharField(max_length=3, choices=CONSENSUS_MODES, default='pow')
+    authorities = models.ManyToManyField("ChainUser", blank=True, related_name="authority_chains")
+    # Validated-tip checkpoint: every block up to this height has been checked.
+    validated_height = models.IntegerField(null=True, blank=True)
+    validated_hash = models.TextField(null=True, blank=True)
+    validated_work = models.DecimalField(max_digits=80, decimal_places=0, null=True, blank=True)
+    # Denormalized tip, moved forward by every append. A null chain_work marks it stale,
+    # including on chains that predate these fields.
+    tip_height = models.IntegerField(null=True, blank=True)
+    tip_hash = models.TextField(null=True, blank=True)
+    chain_work = models.DecimalField(max_digits=80, decimal_places=0, null=True, blank=True)
+    # Pruning: the bodies of every block below this height are in archive files.
+    archived_height = models.IntegerField(default=0)
     
     def __str__(self):
         return self.id
     
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'retarget_enabled' in update_fields:
+            if not self.retarget_enabled:
+                self.retarget_height = None
+            elif self._state.adding:
+                if self.retarget_height is None:
+                    self.retarget_height = 0
+            elif not Blockchain.objects.filter(pk=self.pk, retarget_enabled=True).exists():
+                # Switched on now: the blocks up to the tip were mined without the rule.
+                tip_height, _ = self.get_tip()
+                self.retarget_height = tip_height + 1 if tip_height is not None else 0
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'retarget_height'}
+        super(Blockchain, self).save(*args, **kwargs)
+    
+    def retargets_at(self, height: int) -> bool:
+        """Whether the block at ``height`` must follow the retarget rule."""
+        return self.retarget_enabled and height >= (self.retarget_height or 0)
+    
+    def get_tip(self) -> tuple[int | None, str | None]:
+        """The height and hash of the tip, ``(None, None)`` for an empty chain; recomputed only when stale."""
+        if self.chain_work is None:
+            self.refresh_tip()
+        return self.tip_height, self.tip_hash
+    
+    def get_chain_work(self) -> int:
+        """Cumulative work of every block in the chain."""
+        if self.chain_work is None:
+            self.refresh_tip()
+        return int(self.chain_work)
+    
+    def extend_tip(self, block: "Block") -> bool:
+        """
+        Move the tip onto ``block`` if it builds directly on the current tip.
+        
+        The update only matches while the stored tip is still the block's
+        parent, so concurrent appends cannot both advance it. Anything else
+        (a rewrite, a second child of the same parent) marks the tip stale.
+        
+        Returns:
+            bool: Whether the tip moved.
+        """
+        parent = Blockchain.objects.filter(pk=self.pk, chain_work__isnull=False)
+        if block.height == 0:
+            parent = parent.filter(tip_height__isnull=True)
+        else:
+            parent = parent.filter(tip_height=block.height - 1, tip_hash=block.header.previous_hash)
+        moved = parent.update(
+            tip_height=block.height,
+            tip_hash=block.header.block_hash,
+            chain_work=F('chain_work') + self.block_work(block.header.bits),
+        )
+        if not moved:
+            self.mark_tip_stale()
+        self.refresh_from_db(fields=['tip_height', 'tip_hash', 'chain_work'])
+        return bool(moved)
+    
+    def mark_tip_stale(self):
+        Blockchain.objects.filter(pk=self.pk).update(tip_height=None, tip_hash=None, chain_work=None)
+        self.tip_height = self.tip_hash = self.chain_work = None
+    
+    def refresh_tip(self):
+        """Recompute the tip and cumulative work from the stored blocks, streaming their bits once."""
+        tip_height, tip_hash, work = None, None, 0
+        for tip_height, tip_hash, bits in self.iter_headers(("height", "block_hash", "bits")):
+            work += self.block_work(bits)
+        self.tip_height, self.tip_hash, self.chain_work = tip_height, tip_hash, work
+        Blockchain.objects.filter(pk=self.pk).update(tip_height=tip_height, tip_hash=tip_hash, chain_work=work)
+    
+    def retarget_bits(self, height: int, previous_bits: str, timestamps: list[int]) -> str:
+        """
+        Bits the block at ``height`` must carry under the retarget rule.
+
+        The target only moves on heights that are a multiple of ``retarget_window``,
+        scaled by how long the previous window took against ``block_interval``.
+
+        Args:
+            height (int): Height of the block.
+            previous_bits (str): Bits of the block at ``height - 1``.
+            timestamps (list[int]): Header timestamps of the ``retarget_window`` blocks before ``height``.
+        """
+        if height % self.retarget_window != 0 or len(timestamps) < self.retarget_window:
+            return previous_bits
+        window = timestamps[-self.retarget_window:]
+        new_target = retarget(
+            bits_to_target_int(previous_bits),
+            window[-1] - window[0],
+            (self.retarget_window - 1) * self.block_interval,
+            self.retarget_max_step,
+        )
+        return target_int_to_bits(new_target)
+    
+    def block_locator(self) -> list[str]:
+        """
+        Hashes describing this chain to a peer: the last ten blocks, then
+        exponentially sparser ones back to genesis, tip first.
+        """
+        tip_height, _ = self.get_tip()
+        if tip_height is None:
+            return []
+        heights = []
+        height, step = tip_height, 1
+        while height > 0:
+            heights.append(height)
+            if len(heights) >= 10:
+                step *= 2
+            height -= step
+        heights.append(0)
+        hashes = dict(self.blocks.filter(height__in=heights).values_list('height', 'header_id'))
+        return [hashes[height] for height in heights if height in hashes]
+    
+    def find_fork(self, locator: list[str]) -> tuple[int, str] | None:
+        """
+        The highest block of this chain that appears in a peer's locator.
+        
+        Returns:
+            tuple: ``(height, hash)`` of the shared block, None when the chains share nothing.
+        """
+        return self.blocks.filter(header_id__in=locator).order_by('-height').values_list('height', 'header_id').first()
+    
+    def work_above(self, height: int) -> int:
+        """Cumulative work of the blocks above ``height``."""
+        return sum(self.block_work(bits) for bits, in self.iter_headers(("bits",), height + 1))
+    
+    def reorganize(self, fork_height: int, blocks, tip_height: int, tip_hash: str, chain_work: int) -> int:
+        """
+        Move the chain onto another branch above ``fork_height``.
+        
+        The blocks above the fork are disconnected by applying their undo
+        records, then ``blocks`` are connected, all in one transaction with
+        the chain row locked, so an interrupted reorg leaves the chain as it
+        was and a one-block reorg touches one block each way. A checkpoint
+        above the fork is moved back to it rather than dropped.
+        
+        Args:
+            fork_height (int): Height of the last shared block, -1 when nothing is shared.
+            blocks: Unsaved Block objects of the new branch in height order; their headers must exist.
+            tip_height (int): Height of the new tip.
+            tip_hash (str): Hash of the new tip.
+            chain_work (int): Cumulative work of the new chain.
+        
+        Returns:
+            int: Number of blocks connected.
+        """
+        with transaction.atomic():
+            checkpoint = Blockchain.objects.select_for_update(no_key=True).filter(pk=self.pk).values_list(
+                "validated_height", "validated_work"
+            ).first()
+            validated_height, validated_work = checkpoint or (None, None)
+            if validated_height is not None and validated_height > fork_height >= 0:
+                validated_work = int(validated_work) - sum(
+                    self.block_work(bits) for bits, in self.iter_headers(("bits",), fork_height + 1, validated_height + 1)
+                )
+                fork_hash = self.blocks.filter(height=fork_height).values_list("header_id", flat=True).first()
+            else:
+                validated_height = None
+            
+            # Blocks connected below the archived height would be live, so it is moved back to the fork's chunk.
+            Blockchain.objects.filter(pk=self.pk, archived_height__gt=fork_height + 1).update(
+                archived_height=(fork_height + 1) // archive_chunk_size() * archive_chunk_size()
+            )
+            self.disconnect_blocks(fork_height)
+            connected = self.connect_blocks(blocks)
+            Blockchain.objects.filter(pk=self.pk).update(tip_height=tip_height, tip_hash=tip_hash, chain_work=chain_work)
+            self.tip_height, self.tip_hash, self.chain_work = tip_height, tip_hash, chain_work
+            if validated_height is not None:
+                self._save_checkpoint(fork_height, fork_hash, validated_work)
+            self.prune_after_commit()
+        return connected
+    
+    def disconnect_blocks(self, fork_height: int) -> int:
+        """
+        Remove the blocks above ``fork_height``, putting the journal state back from their undo records.
+        
+        Only the undo entry of the lowest removed block matters for each
+        journal, so the state is restored in one batch before the blocks are
+        deleted. Chains written before undo records existed are replayed once
+        instead.
+        
+        Returns:
+            int: Number of blocks removed.
+        """
+        undo_rows = list(self.blocks.filter(height__gt=fork_height).order_by('-height').values_list('undo', flat=True))
+        if not undo_rows:
+            return 0
+        if any(undo is None for undo in undo_rows):
+            self.blocks.filter(height__gt=fork_height).delete()
+            self.rebuild_journal_state()
+            return len(undo_rows)
+        
+        restored = {}
+        for undo in undo_rows:
+            for entry in json.loads(undo):
+                restored[entry[0]] = entry
+        self._restore_journal_states(restored.values())
+        self.blocks.filter(height__gt=fork_height).delete()
+        return len(undo_rows)
+    
+    def connect_blocks(self, blocks) -> int:
+        """
+        Insert unsaved blocks on top of the chain in batches, recording each one's undo data.
+        
+        Args:
+            blocks: Block objects in height order, with their ids set and headers saved.
+        
+        Returns:
+            int: Number of blocks inserted.
+        """
+        connected = 0
+        blocks = iter(blocks)
+        while batch := list(islice(blocks, 1000)):
+            for block in batch:
+                block.pack_body()
+            states = self.stage_blocks(batch)
+            Block.objects.bulk_create(batch)
+            Block.bulk_index_txids(batch)
+            self._write_journal_states(states)
+            connected += len(batch)
+        # Bodies in flat files are made durable before the transaction that points at them commits.
+        sync_block_store()
+        return connected
+    
+    def stage_blocks(self, blocks: list["Block"]) -> list["JournalState"]:
+        """
+        Fill in the undo records of blocks about to be connected.
+        
+        Each block's undo lists, for every journal it carries, the journal's
+        state on the chain before it: ``[journal_id, block_id, merkle_root,
+        is_deleted]``, or just ``[journal_id]`` when the chain had not seen
+        the journal yet.
+        
+        Returns:
+            list[JournalState]: The journal states to write once the blocks are stored.
+        """
+        if blocks and blocks[0].height > 0 and self.blocks.filter(height=blocks[0].height - 1, undo__isnull=True).exists():
+            self.rebuild_journal_state()
+        journals = [block.journal_states() for block in blocks]
+        journal_ids = {journal_id for entries in journals for journal_id, *_ in entries}
+        current = {state.journal_id: state for state in self.journal_states.filter(journal_id__in=journal_ids)}
+        for block, entries in zip(blocks, journals):
+            block.undo = self._apply_block(current, block.id, entries)
+        return [current[journal_id] for journal_id in journal_ids]
+    
+    def rebuild_journal_state(self):
+        """Replay the whole chain to regenerate the journal state and every block's undo record."""
+        current, updated = {}, []
+        for block_id, data in self.iter_chain(("id", "data")):
+            block = Block(id=block_id, data=data)
+            block.undo = self._apply_block(current, block_id, block.journal_states())
+            updated.append(block)
+            if len(updated) >= 1000:
+                Block.objects.bulk_update(updated, ["undo"])
+                updated = []
+        Block.objects.bulk_update(updated, ["undo"])
+        self.journal_states.all().delete()
+        JournalState.objects.bulk_create(current.values(), batch_size=1000)
+    
+    def _apply_block(self, current: dict, block_id: str, journals: list[tuple]) -> str:
+        """Move ``current`` past one block and return the block's undo record."""
+        undo = []
+        for journal_id, merkle_root, is_deleted in journals:
+            previous = current.get(journal_id)
+            if not any(entry[0] == journal_id for entry in undo):
+                undo.append([journal_id] if previous is None else [journal_id, previous.block_id, previous.merkle_root, previous.is_deleted])
+            current[journal_id] = JournalState(
+                blockchain_id=self.pk, journal_id=journal_id, block_id=block_id, merkle_root=merkle_root, is_deleted=is_deleted
+            )
+        return json.dumps(undo, separators=(",", ":"))
+    
+    def _write_journal_states(self, states: list["JournalState"]):
+        JournalState.objects.bulk_create(
+            states, batch_size=1000, update_conflicts=True,
+            unique_fields=["blockchain", "journal_id"], update_fields=["block", "merkle_root", "is_deleted"],
+        )
+    
+    def _restore_journal_states(self, entries):
+        """Apply undo entries: journals the chain had not seen are dropped, the rest point back at their earlier block."""
+        entries = list(entries)
+        self.journal_states.filter(journal_id__in=[entry[0] for entry in entries if len(entry) == 1]).delete()
+        self._write_journal_states([
+            JournalState(blockchain_id=self.pk, journal_id=journal_id, block_id=block_id, merkle_root=merkle_root, is_deleted=is_deleted)
+            for journal_id, block_id, merkle_root, is_deleted in (entry for entry in entries if len(entry) > 1)
+        ])
+    
+    def delta_payload(self, payload: dict) -> dict:
+        """
+        Express a journal payload as its changes since the journal's latest block on this chain.
+        
+        The delta keeps the journal's fields and Merkle Root but replaces
+        ``transactions`` with ``base`` (hash of that earlier block),
+        ``depth`` (deltas since the last full list), ``size`` and the
+        ``changes`` ``txid_changes`` lists. A full payload is kept instead
+        for journals the chain has not seen, every ``JOURNAL_SNAPSHOT_INTERVAL``
+        blocks of a journal, and whenever the delta would not be smaller.
+        """
+        interval = getattr(settings, 'JOURNAL_SNAPSHOT_INTERVAL', 32)
+        if "transactions" not in payload or "merkle_root" not in payload or interval <= 1:
+            return payload
+        state = self.journal_states.filter(journal_id=payload["journal_id"]).select_related("block").first()
+        if state is None:
+            return payload
+        previous = state.block.journal(payload["journal_id"])
+        depth = previous.get("depth", 0) + 1
+        if depth >= interval:
+            return payload
+        changes = txid_changes(self.expand_journal(previous, state.block.height), payload["transactions"])
+        if len(changes) >= len(payload["transactions"]):
+            return payload
+        delta = {key: payload[key] for key in JOURNAL_FIELDS}
+        delta.update(
+            base=state.block.header_id, depth=depth, size=len(payload["transactions"]),
+            changes=changes, merkle_root=payload["merkle_root"],
+        )
+        return delta
+    
+    def expand_journal(self, payload: dict, height: int, pending: dict | None = None) -> list[str]:
+        """
+        Full txid list of a journal payload carried by the block at ``height``.
+        
+        Deltas are replayed from the journal's last full list on the chain,
+        at most ``JOURNAL_SNAPSHOT_INTERVAL`` blocks back.
+        
+        Args:
+            payload (dict): A full or delta journal payload.
+            height (int): Height of the block carrying it.
+            pending (dict): Blocks not stored yet, keyed by hash, e.g. a batch being synced.
+        
+        Raises:
+            ValueError: When a delta does not lead back to a full list below it on the chain.
+        """
+        journal_id = payload.get("journal_id")
+        deltas = []
+        txids = payload.get("transactions")
+        while txids is None:
+            if "base" not in payload:
+                raise ValueError(f"Journal {journal_id} carries neither txids nor changes.")
+            deltas.append(payload)
+            base = (pending or {}).get(payload["base"]) or self.blocks.filter(header_id=payload["base"]).first()
+            if base is None or base.height >= height:
+                raise ValueError(f"Journal {journal_id} builds on block {payload['base']}, which is not below it on the chain.")
+            height = base.height
+            # A pending block already expanded stops the walk there instead of at the last full list.
+            txids = getattr(base, "expanded_journals", {}).get(journal_id)
+            if txids is None:
+                payload = base.journal(journal_id)
+                txids = payload.get("transactions")
+        txids = list(txids)
+        for delta in reversed(deltas):
+            txids = apply_txid_changes(txids, delta["size"], delta["changes"])
+        return txids
+    
+    def journal_transactions(self, journal_id: str, block: "Block" = None) -> list[str]:
+        """
+        Rebuild the full txid list of a journal, in Merkle leaf order.
+        
+        Args:
+            journal_id (str): The journal.
+            block (Block): Block whose copy of the journal to rebuild, the chain's latest one when None.
+        
+        Raises:
+            ValueError: When the chain does not carry the journal.
+        """
+        if block is None:
+            state = self.journal_states.filter(journal_id=str(journal_id)).select_related("block").first()
+            if state is None:
+                raise ValueError(f"Journal {journal_id} is not committed to the chain.")
+            block = state.block
+        return self.expand_journal(block.journal(str(journal_id)), block.height)
+    
+    def prune(self, depth: int | None = None) -> int:
+        """
+        Move the bodies of blocks at least ``depth`` below the tip into archive files.
+        
+        Whole chunks of ``BLOCK_ARCHIVE_CHUNK`` heights are archived at a
+        time, from ``archived_height`` up, so the bodies left in the live
+        tables stay bounded by the depth plus one chunk however long the
+        chain grows. Headers, undo records and the txid index stay live.
+        
+        Args:
+            depth (int): Blocks to keep live below the tip, ``PRUNE_DEPTH`` when None; 0 disables pruning.
+        
+        Returns:
+            int: Number of blocks archived.
+        """
+        if depth is None:
+            depth = getattr(settings, 'PRUNE_DEPTH', 0)
+        if not depth:
+            return 0
+        tip_height, _ = self.get_tip()
+        if tip_height is None:
+            return 0
+        chunk = archive_chunk_size()
+        stop = (tip_height - depth + 1) // chunk * chunk
+        self.refresh_from_db(fields=['archived_height'])
+        archived = 0
+        for start in range(self.archived_height, stop, chunk):
+            with transaction.atomic():
+                # Another prune of the chain waits here and then finds the chunk done.
+                if Blockchain.objects.select_for_update(no_key=True).filter(pk=self.pk).values_list("archived_height", flat=True).first() > start:
+                    continue
+                archived += self._archive_chunk(start, start + chunk)
+                Blockchain.objects.filter(pk=self.pk).update(archived_height=start + chunk)
+            self.archived_height = start + chunk
+        return archived
+    
+    def prune_after_commit(self):
+        """
+        Prune to ``PRUNE_DEPTH`` once the current transaction commits.
+        
+        Writes of new blocks call this rather than ``prune``, so archive files
+        are not written for blocks that may still roll back and the request
+        that added a block does not hold its transaction open while chunks
+        are compressed.
+        """
+        if getattr(settings, 'PRUNE_DEPTH', 0):
+            transaction.on_commit(self.prune)
+    
+    def _archive_chunk(self, start: int, stop: int) -> int:
+        """Write the bodies of the blocks in ``[start, stop)`` to their archive file and empty their live columns."""
+        blocks = list(self.blocks.filter(height__gte=start, height__lt=stop).order_by("height"))
+        if all(block.archive_chunk == start for block in blocks):
+            return 0
+        # Blocks of the chunk that were archived before, e.g. under a later reorged branch, are written again with the rest.
+        archive = get_block_archive()
+        generation, offsets = archive.write(self.pk, start, [block.stored_body() for block in blocks])
+        for block, offset in zip(blocks, offsets):
+            block.archive_chunk, block.archive_generation, block.archive_offset = start, generation, offset
+        Block.objects.bulk_update(blocks, ["archive_chunk", "archive_generation", "archive_offset"])
+        # Read through the model the bodies would come back from the archive, so they are emptied in SQL.
+        Block.objects.filter(pk__in=[block.pk for block in blocks]).update(data='', body=None, body_segment=None, body_offset=None)
+        # Older generations, and files left by a rolled back prune, go once the blocks point at the new one.
+        stale = [old for old in archive.generations(self.pk, start) if old != generation]
+        
+        def remove_stale():
+            for old in stale:
+                archive.remove(self.pk, start, old)
+        transaction.on_commit(remove_stale)
+        return len(blocks)
+    
+    def rehydrate(self, start: int = 0, stop: int | None = None) -> int:
+        """
+        Bring archived bodies of the blocks in ``[start, stop)`` back into the live tables.
+        
+        Archive files no block points at any more are removed, and
+        ``archived_height`` is lowered so that ``prune`` archives them again.
+        
+        Returns:
+            int: Number of blocks rehydrated.
+        """
+        archived = self.blocks.filter(height__gte=start, archive_chunk__isnull=False).order_by("height")
+        if stop is not None:
+            archived = archived.filter(height__lt=stop)
+        rehydrated = 0
+        with transaction.atomic():
+            for chunk in sorted(set(archived.values_list("archive_chunk", flat=True))):
+                blocks = list(archived.filter(archive_chunk=chunk))
+                generations = {block.archive_generation for block in blocks}
+                texts, encoded = [], []
+                for block in blocks:
+                    record = block.stored_body()
+                    if is_encoded_body(record):
+                        encoded.append(Block(pk=block.pk, body=record, archive_chunk=None, archive_generation=None, archive_offset=None))
+                    else:
+                        texts.append(Block(pk=block.pk, data=str(record, 'utf-8'), archive_chunk=None, archive_generation=None, archive_offset=None))
+                # Encoded bodies would read back through ``data`` as JSON text, so that column is not written for them.
+                Block.objects.bulk_update(encoded, ["body", "archive_chunk", "archive_generation", "archive_offset"])
+                Block.objects.bulk_update(texts, ["data", "archive_chunk", "archive_generation", "archive_offset"])
+                rehydrated += len(blocks)
+                generations -= set(self.blocks.filter(archive_chunk=chunk).values_list("archive_generation", flat=True))
+                for generation in generations:
+                    transaction.on_commit(lambda chunk=chunk, generation=generation: get_block_archive().remove(self.pk, chunk, generation))
+            Blockchain.objects.filter(pk=self.pk, archived_height__gt=start).update(
+                archived_height=start // archive_chunk_size() * archive_chunk_size()
+            )
+        self.refresh_from_db(fields=['archived_height'])
+        return rehydrated
+    
+    def next_bits(self) -> str:
+        """Bits for the block that will follow the current tip."""
+        tip_height, _ = self.get_tip()
+        if tip_height is None or not self.retarget_enabled:
+            return target_int_to_bits(int(self.target, 16))
+        height = tip_height + 1
+        window = list(self.iter_headers(("bits", "timestamp"), max(height - self.retarget_window, 0), height))
+        return self.retarget_bits(height, window[-1][0], [timestamp for _, timestamp in window])
+    
+    def authority_checker(self):
+        """
+        A function telling whether a public key may seal the block at a given height.
+        
+        Keys are checked against the authorities as they stood at that height,
+        from the chain's ``AuthorityChange`` rows, so removing a key stops it
+        sealing new blocks without invalidating the ones it already sealed.
+        A key with no recorded change, e.g. on a chain that predates them,
+        counts as an authority at every height while it is one now.
+        """
+        current = set(self.authorities.values_list('public_key', flat=True))
+        history = {}
+        for public_key, height, added in self.authority_changes.order_by('height', 'id').values_list('public_key', 'height', 'added'):
+            history.setdefault(public_key, []).append((height, added))
+        
+        def is_authority(public_key: str | None, height: int) -> bool:
+            changes = history.get(public_key)
+            if not changes:
+                return public_key in current
+            # Before its first recorded change a key held the opposite state.
+            state = not changes[0][1]
+            for change_height, added in changes:
+                if change_height > height:
+                    break
+                state = added
+            return state
+        return is_authority
+    
+    def sealer(self) -> "ChainUser":
+        """The authority whose key seals new proof-of-authority blocks on this server."""
+        return self.authorities.exclude(private_key__isnull=True).exclude(private_key='').order_by('id').first()
+    
     def get_chain(self):
         """Retrieve the ordered chain of blocks."""
         return self.blocks.order_by('height')
     
-    def validate_chain(self):
-        """Validate the blockchain by checking hashes and connections."""
-        chain:List[Block] = self.get_chain()
+    def iter_chain(self, fields: tuple[str, ...], start: int = 0, stop: int | None = None, page_size: int = CHAIN_PAGE_SIZE):
+        """
+        Stream column tuples of the chain's blocks in height order.
+        
+        Pages are fetched by keyset (``height > last height``) rather than by
+        offset, and each page is read through a server-side cursor, so memory
+        stays bounded and the number of queries depends only on the page size,
+        never on one query per block.
+        
+        Args:
+            fields (tuple): Block lookups to select, e.g. ``"height"`` or ``"header__bits"``.
+            start (int): First height to yield.
+            stop (int): Height to stop before, the tip when None.
+            page_size (int): Blocks per keyset page.
+        
+        Yields:
+            tuple: The selected values, in ``fields`` order; ``data`` is read from the flat-file store for blocks kept there.
+        """
+        fields = tuple(fields)
+        if "data" in fields:
+            storage = ("body", "body_segment", "body_offset", "blockchain_id", "archive_chunk", "archive_generation", "archive_offset")
+            return self._load_bodies(self._iter_rows((*fields, *storage), start, stop, page_size), fields.index("data"))
+        return self._iter_rows(fields, start, stop, page_size)
+    
+    def _iter_rows(self, fields: tuple[str, ...], start: int, stop: int | None, page_size: int):
+        select = fields if "height" in fields else ("height", *fields)
+        position = select.index("height")
+        after = start - 1
+        while True:
+            page = self.blocks.filter(height__gt=after).order_by('height')
+            if stop is not None:
+                page = page.filter(height__lt=stop)
+            count = 0
+            for row in page.values_list(*select)[:page_size].iterator(chunk_size=min(page_size, 2000)):
+                count += 1
+                after = row[position]
+                yield row if select is fields else row[1:]
+            if count < page_size:
+                return
+    
+    @staticmethod
+    def _load_bodies(rows, position: int):
+        """Swap the empty ``data`` of encoded or flat-file rows for their body as JSON text, dropping the storage columns."""
+        for *row, body, segment, offset, blockchain_id, chunk, generation, chunk_offset in rows:
+            if row[position] == '' and (body is not None or segment is not None or chunk is not None):
+                row[position] = Block(
+                    body=body, body_segment=segment, body_offset=offset, blockchain_id=blockchain_id,
+                    archive_chunk=chunk, archive_generation=generation, archive_offset=chunk_offset,
+                ).data
+            yield tuple(row)
+
+    def iter_stored_bodies(self, fields: tuple[str, ...] = (), start: int = 0, stop: int | None = None, page_size: int = CHAIN_PAGE_SIZE):
+        """
+        Stream ``fields`` of every block followed by its body exactly as stored, encoded bytes or JSON text, without decoding it.
+
+        Pages are read like ``iter_chain``; bodies outside the block row are
+        fetched from the flat-file store or the archive.
+        """
+        storage = ("data", "body", "body_segment", "body_offset", "archive_chunk", "archive_generation", "archive_offset")
+        for *row, data, body, segment, offset, chunk, generation, chunk_offset in self._iter_rows((*fields, *storage), start, stop, page_size):
+            if body is None and data == '' and (segment is not None or chunk is not None):
+                body = Block(
+                    body_segment=segment, body_offset=offset, blockchain_id=self.pk,
+                    archive_chunk=chunk, archive_generation=generation, archive_offset=chunk_offset,
+                ).stored_body()
+            yield (*row, bytes(body) if body is not None else data.encode('utf-8'))
+
+    def iter_headers(self, fields: tuple[str, ...] = HEADER_ROW_FIELDS, start: int = 0, stop: int | None = None, page_size: int = CHAIN_PAGE_SIZE):
+        """
+        Stream header tuples in height order without loading blocks or their data.
+        
+        ``fields`` are BlockHeader field names, plus ``"height"`` for the block
+        height; the default matches the rows ``HeaderVerifier`` reads.
+        """
+        lookups = tuple(field if field == "height" else f"header__{field}" for field in fields)
+        packed = [(position, *PACKED_HEADER_SPANS[field]) for position, field in enumerate(fields) if field in PACKED_HEADER_SPANS]
+        if not packed and "raw" not in fields:
+            return self.iter_chain(lookups, start, stop, page_size)
+        if "raw" in fields:
+            return self._unpack_headers(self.iter_chain(lookups, start, stop, page_size), packed, fields.index("raw"))
+        return (row[:-1] for row in self._unpack_headers(self.iter_chain((*lookups, "header__raw"), start, stop, page_size), packed, -1))
+    
+    @staticmethod
+    def _unpack_headers(rows, packed: list[tuple[int, int, int]], raw_position: int):
+        """Fill in the hex fields of binary-stored rows from their raw header, which is passed on as bytes."""
+        for row in rows:
+            raw = row[raw_position]
+            if raw is None:
+                yield row
+                continue
+            row, raw = list(row), bytes(raw)
+            row[raw_position] = raw
+            for position, begin, end in packed:
+                if row[position] == '':
+                    row[position] = raw[begin:end].hex()
+            yield tuple(row)
+    
+    def block_work(self, bits: str) -> int:
+        """Work a block adds to the chain; proof-of-authority blocks count one each."""
+        return 1 if self.consensus == 'poa' else block_work(bits)
+    
+    def invalidate_checkpoint(self, height: int = 0):
+        """Drop the validated-tip checkpoint if it covers ``height``, so the next validation starts from genesis."""
+        Blockchain.objects.filter(pk=self.pk, validated_height__gte=height).update(
+            validated_height=None, validated_hash=None, validated_work=None
+        )
+        if self.validated_height is not None and self.validated_height >= height:
+            self.validated_height = self.validated_hash = self.validated_work = None
+    
+    def _save_checkpoint(self, height: int, block_hash: str, work: int):
+        self.validated_height, self.validated_hash, self.validated_work = height, block_hash, work
+        Blockchain.objects.filter(pk=self.pk).update(validated_height=height, validated_hash=block_hash, validated_work=work)
+    
+    def validate_chain(self, full: bool = False, workers: int | None = None, chunk_size: int = DEFAULT_VERIFY_CHUNK_SIZE) -> bool:
+        """
+        Validate the blockchain by checking hashes and connections.
+        
+        Only blocks above the validated-tip checkpoint are checked, starting
+        from the checkpoint's hash and cumulative work, unless ``full`` is set
+        or the checkpoint no longer matches the stored chain.
+        
+        Header rows are streamed in height order. Each chunk's hashes and
+        proof-of-work, or the ECDSA signatures of authority seals, go to a
+        ``HeaderVerifier`` process pool, while the checks that depend on the
+        chain's history (linkage, retarget rule, whether the signer was an
+        authority at that height) run here in one pass. The checkpoint then
+        moves to the last block below the first failure.
+        
+        Args:
+            full (bool): Revalidate every block from genesis.
+            workers (int): Hashing processes, ``VALIDATION_WORKERS`` by default.
+            chunk_size (int): Header rows per unit of work.
+        
+        Raises:
+            ValueError: Naming the lowest block that fails.
+        """
+        if workers is None:
+            workers = getattr(settings, 'VALIDATION_WORKERS', 1)
+        self.refresh_from_db(fields=['validated_height', 'validated_hash', 'validated_work'])
+        start = 0
         previous_hash = natural_byte_order_to_str(DEFAULT_HASH)
-        for index, block in enumerate(chain):
-            if not block.header.is_valid():
-                raise ValueError(f"Block {block.height} failed header validation.")
-            if block.header.previous_hash != previous_hash:
-                raise ValueError(f"Block {block.height} has incorrect previous hash.")
-            hash_result = sha256(sha256(block.header._header_data()))
-            target = block.header.bits_to_target(block.header.bits)
-            if hash_result[::-1] >= target:
-                raise ValueError(f"Block {block.height} does not meet the proof-of-work requirement.")
-            previous_hash = block.header.block_hash
-        return True
+        work = 0
+        if not full and self.validated_height is not None and self.blocks.filter(
+            height=self.validated_height, header_id=self.validated_hash
+        ).exists():
+            start = self.validated_height + 1
+            previous_hash = self.validated_hash
+            work = int(self.validated_work)
+        
+        # The retarget rule looks back one window, so reload it from below the checkpoint.
+        previous_bits = None
+        timestamps = deque(maxlen=self.retarget_window)
+        for bits, timestamp in self.iter_headers(("bits", "timestamp"), max(start - self.retarget_window, 0), start):
+            previous_bits = bits
+            timestamps.append(timestamp)
+        
+        is_authority = self.authority_checker() if self.consensus == 'poa' else None
+        rows = self.iter_headers((*HEADER_ROW_FIELDS, "signer", "signature"), start)
+        height = start - 1
+        initial = (height, previous_hash, work)
+        failure = None
+        checkpoints = []
+        with HeaderVerifier(workers, check_work=is_authority is None, check_seals=is_authority is not None) as verifier:
+            while failure is None and verifier.failure is None:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                for offset, (block_height, block_hash, previous, _, _, bits, timestamp, _, _, signer, signature) in enumerate(chunk):
+                    if block_height != height + 1:
+                        failure = (height + 1, "is missing")
+                    elif previous != previous_hash:
+                        failure = (block_height, "has incorrect previous hash")
+                    elif is_authority is not None and not is_authority(signer, block_height):
+                        failure = (block_height, "is not sealed by an authority of the chain")
+                    elif is_authority is None and self.retargets_at(block_height) and previous_bits is not None and (
+                        bits != self.retarget_bits(block_height, previous_bits, list(timestamps))
+                    ):
+                        failure = (block_height, "does not follow the difficulty retarget rule")
+                    if failure is not None:
+                        chunk = chunk[:offset]
+                        break
+                    previous_bits = bits
+                    timestamps.append(timestamp)
+                    work += self.block_work(bits)
+                    height = block_height
+                    previous_hash = block_hash
+                verifier.submit(chunk)
+                if chunk:
+                    checkpoints.append((height, previous_hash, work))
+        
+        if verifier.failure is not None and (failure is None or verifier.failure[0] < failure[0]):
+            failure = verifier.failure
+        if failure is None:
+            self._save_checkpoint(height, previous_hash, work)
+            return True
+        
+        # Replay the hashes and work of the few blocks between the last chunk
+        # boundary and the failure, so the checkpoint lands right below it.
+        height, previous_hash, work = [initial, *(c for c in checkpoints if c[0] < failure[0])][-1]
+        for block_hash, bits in self.iter_headers(("block_hash", "bits"), height + 1, failure[0]):
+            height, previous_hash, work = height + 1, block_hash, work + self.block_work(bits)
+        if height >= 0:
+            self._save_checkpoint(height, previous_hash, work)
+        else:
+            self.invalidate_checkpoint()
+        raise ValueError(f"Block {failure[0]} {failure[1]}.")
     
     def create_genesis_block(self):
         """Initialize the blockchain with a genesis block."""
@@ -151,7 +1024,7 @@ class Blockchain(models.Model):
             previous_hash="00" * 32,
             merkle_root="3ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a",
             timestamp=int(datetime.now().timestamp()),
-            bits=self.target,
+            bits=target_int_to_bits(int(self.target, 16)),
             nonce=0
         )
         genesis_header.save()
@@ -170,51 +1043,343 @@ class Block(models.Model):
     blockchain = models.ForeignKey(Blockchain, on_delete=models.CASCADE, related_name="blocks")
     size = models.IntegerField(default=0, null=False, blank=False)
     header = models.ForeignKey(BlockHeader, on_delete=models.CASCADE)
-    data = models.TextField(default='', null=False)
+    data = BlockBodyField(default='', null=False)
+    # The body in the binary encoding, see api.blockstore.encoding; ``data`` is then left empty.
+    body = models.BinaryField(null=True, blank=True, editable=False)
+    # Location of the body in the flat-file block store, None while it is kept in ``data``.
+    body_segment = models.IntegerField(null=True, blank=True, editable=False)
+    body_offset = models.BigIntegerField(null=True, blank=True, editable=False)
+    # Location of a pruned body in the chain's archive files, see Blockchain.prune.
+    archive_chunk = models.IntegerField(null=True, blank=True, editable=False)
+    archive_generation = models.IntegerField(null=True, blank=True, editable=False)
+    archive_offset = models.BigIntegerField(null=True, blank=True, editable=False)
+    # The journal state this block replaced on its chain, see Blockchain.stage_blocks.
+    undo = models.TextField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"Block #{self.height} of {self.blockchain}"
     
-    def set_general_journal(self, journal: GeneralJournal):
-        """Serialize GeneralJournal's transactions and compute Merkle Root."""
-        transactions = journal.transactions.all()
+    class Meta:
+        indexes = [
+            models.Index(fields=["blockchain", "height"]),
+        ]
+    
+    @staticmethod
+    def journal_payload(journal: GeneralJournal) -> dict:
+        """Serialize the current state of a GeneralJournal for inclusion in a block, txids in Merkle leaf order."""
+        rows = list(journal.transactions.order_by("merkle_index").values_list("merkle_index", "txid"))
+        transactions = [txid for _, txid in rows]
         if not transactions and not journal.is_deleted:
             raise ValueError("GeneralJournal must have at least one transaction.")
         
-        txids = [tx.txid for tx in transactions]
-        self.header.merkle_root = compute_merkle_root(txids)
+        # Journals whose tree is missing or out of step are rebuilt once: ones created before it existed,
+        # and ones whose rows were changed around it by queryset deletes or bulk_create, which leave
+        # leaf indexes missing, repeated or unset even when the count happens to match.
+        journal.refresh_from_db(fields=["merkle_size", "merkle_root"])
+        if journal.merkle_size != len(rows) or any(index != position for position, (index, _) in enumerate(rows)):
+            journal.merkle_tree.rebuild()
+            transactions = list(journal.transactions.order_by("merkle_index").values_list("txid", flat=True))
         
-        transaction_data = {
+        return {
             "action": "delete" if journal.is_deleted else "modify",
             "journal_id": str(journal.id),
             "company": journal.company,
             "period": journal.period.isoformat(),
             "balance": str(journal.balance),
-            "transactions": txids,
+            "transactions": transactions,
+            "merkle_root": journal.merkle_root,
         }
+    
+    def set_general_journal(self, journal: GeneralJournal, commit: bool = True):
+        """Serialize GeneralJournal's changes since its previous block and take the journal's stored Merkle Root, saving the block unless ``commit`` is False."""
+        transaction_data = self.blockchain.delta_payload(self.journal_payload(journal))
+        self.header.merkle_root = transaction_data["merkle_root"]
         
-        self.data = json.dumps(transaction_data, indent=4)
-        self.size = len(self.data)
-        self.save()
+        self.set_payload(transaction_data)
+        if commit:
+            self.save()
+    
+    def set_journal_payloads(self, payloads: list[dict], commit: bool = True):
+        """
+        Pack several serialized journals into the block.
+        
+        The block's Merkle Root is taken over the journals' own roots, so it
+        still commits to every txid without hashing them all again; a block
+        with a single journal has that journal's root.
+        """
+        self.header.merkle_root = compute_merkle_root([payload["merkle_root"] for payload in payloads])
+        
+        self.set_payload({"journals": payloads})
+        if commit:
+            self.save()
+    
+    @staticmethod
+    def payload_size(payload: dict) -> int:
+        """
+        Bytes a journal adds to a block body in the configured encoding, counted as the only journal of a packed body.
+        
+        Like ``Block.size`` this leaves compression out, so the sizes of a
+        block's journals add up to at least the block's size.
+        """
+        packed = {"journals": [payload]}
+        return len(encode_body(packed)) if binary_bodies() else len(json.dumps(packed, indent=4))
+    
+    def set_payload(self, payload: dict):
+        """
+        Store a body in the configured encoding (``BLOCK_ENCODING``).
+        
+        The block is sized in bytes of that encoding before compression,
+        the measure ``MEMPOOL_MAX_BLOCK_SIZE`` limits, so a block's size
+        does not depend on how well it happened to compress.
+        """
+        self.__dict__.pop("expanded_journals", None)
+        if binary_bodies():
+            self.data = ''
+            self.body = encode_body(payload, body_compression())
+            self.size = body_size(self.body)
+        else:
+            self.data = json.dumps(payload, indent=4)
+            self.size = len(self.data)
+    
+    def pack_body(self):
+        """Bring the body into the configured encoding before it is written, e.g. when copied from another chain."""
+        body = self.encoded_body()
+        if binary_bodies() != (body is not None):
+            self.set_payload(self.get_general_journal())
+        else:
+            self.size = body_size(body) if body is not None else len(self.data)
+    
+    def encoded_body(self) -> bytes | memoryview | None:
+        """The body in the binary encoding, None when it is JSON text."""
+        if self.__dict__.get('data'):
+            return None
+        if self.body is not None:
+            return self.body
+        record = self.stored_record()
+        if record is not None and is_encoded_body(record):
+            return record
+        return None
     
-    def get_general_journal(self) -> GeneralJournal:
-        """Deserialize the data field into a GeneralJournal object."""
-        journal_data = json.loads(self.data)
-        return journal_data
+    def stored_record(self) -> memoryview | None:
+        """The body kept outside the block row, in a pruned archive or the flat-file store."""
+        if self.archive_chunk is not None:
+            return get_block_archive().read(self.blockchain_id, self.archive_chunk, self.archive_offset, self.archive_generation)
+        if self.body_segment is not None:
+            return get_block_store().read(self.body_segment, self.body_offset)
+        return None
+    
+    def stored_body(self) -> bytes:
+        """The body as stored, encoded bytes or JSON text, wherever it is kept."""
+        body = self.encoded_body()
+        return bytes(body) if body is not None else self.data.encode('utf-8')
+    
+    def get_general_journal(self) -> dict:
+        """Decode the block body, binary or JSON."""
+        body = self.encoded_body()
+        if body is not None:
+            return decode_body(body)
+        return json.loads(self.data)
+    
+    def get_general_journals(self) -> list[dict]:
+        """Deserialize every journal in the block, whether it holds one journal or a packed list."""
+        journal_data = self.get_general_journal()
+        return journal_data.get("journals", [journal_data])
+    
+    def journal(self, journal_id: str) -> dict:
+        """The payload of one journal the block carries, as stored (full or delta)."""
+        for payload in self.get_general_journals():
+            if payload.get("journal_id") == journal_id:
+                return payload
+        raise ValueError(f"Block {self.height} does not carry journal {journal_id}.")
+    
+    def full_journals(self, pending: dict | None = None) -> list[dict]:
+        """
+        ``get_general_journals`` with every delta expanded into the journal's full txid list, see ``Blockchain.expand_journal``.
+
+        The lists are kept in ``expanded_journals``, so a later block of a
+        batch whose deltas build on this one replays only its own changes.
+        """
+        payloads = [
+            payload if "base" not in payload else {
+                **{key: payload[key] for key in JOURNAL_FIELDS},
+                "transactions": self.blockchain.expand_journal(payload, self.height, pending),
+                "merkle_root": payload["merkle_root"],
+            }
+            for payload in self.get_general_journals()
+        ]
+        self.expanded_journals = {payload["journal_id"]: payload["transactions"] for payload in payloads if "transactions" in payload and "journal_id" in payload}
+        return payloads
+    
+    def journal_states(self) -> list[tuple[str, str, bool]]:
+        """``(journal_id, merkle_root, is_deleted)`` of every journal the block carries."""
+        try:
+            payloads = self.get_general_journals()
+        except ValueError:
+            return []
+        return [
+            (payload["journal_id"], payload.get("merkle_root", ""), payload.get("action") == "delete")
+            for payload in payloads if "journal_id" in payload
+        ]
+    
+    def merkle_proof(self, txid: str) -> list[dict]:
+        """
+        Merkle branch linking ``txid`` to this block's header Merkle Root.
+        
+        Blocks that carry journal roots get the branch inside the journal,
+        read from the journal's stored tree while it still has the same root,
+        followed by the branch from the journal root to the block root. Older
+        blocks hash every txid in one tree.
+        
+        Returns:
+            list[dict]: ``{"hash", "side"}`` steps, bottom up, see ``merkle_branch``.
+        """
+        payloads = self.full_journals()
+        for position, payload in enumerate(payloads):
+            if txid in payload.get("transactions", []):
+                break
+        else:
+            raise ValueError(f"Transaction {txid} is not committed by block {self.height}.")
+        
+        if not all("merkle_root" in payload for payload in payloads):
+            txids = [tx for payload in payloads for tx in payload.get("transactions", [])]
+            return merkle_branch(txids, txids.index(txid))
+        
+        index = payload["transactions"].index(txid)
+        journal = GeneralJournal.objects.filter(pk=payload["journal_id"], merkle_root=payload["merkle_root"]).first()
+        branch = journal.merkle_tree.branch(index) if journal else merkle_branch(payload["transactions"], index)
+        return branch + merkle_branch([payload["merkle_root"] for payload in payloads], position)
+    
+    def data_merkle_root(self, pending: dict | None = None) -> str | None:
+        """
+        Merkle Root recomputed from the block's data, to compare with its header.
+        
+        Args:
+            pending (dict): Blocks not stored yet that deltas may build on, keyed by hash.
+        
+        Returns:
+            str: The root, or None for data without transactions such as the genesis message.
+        
+        Raises:
+            ValueError: When a journal's stated root does not match its txids.
+        """
+        payloads = self.full_journals(pending)
+        if not any("transactions" in payload for payload in payloads):
+            return None
+        if not all("merkle_root" in payload for payload in payloads):
+            return compute_merkle_root([txid for payload in payloads for txid in payload.get("transactions", [])])
+        for payload in payloads:
+            if compute_merkle_root(payload["transactions"]) != payload["merkle_root"]:
+                raise ValueError(f"Journal {payload.get('journal_id')} does not match its Merkle Root.")
+        return compute_merkle_root([payload["merkle_root"] for payload in payloads])
+    
+    def index_txids(self):
+        """Rewrite the txid lookup rows of this block from its data."""
+        self.txids.all().delete()
+        Block.bulk_index_txids([self])
+    
+    @staticmethod
+    def bulk_index_txids(blocks: list["Block"]):
+        """Write the txid lookup rows of freshly inserted blocks in one batch."""
+        rows = []
+        for block in blocks:
+            try:
+                payloads = block.get_general_journals()
+            except ValueError:
+                continue
+            # A delta indexes only the txids it writes, the latest block holding a txid is still where it was last placed.
+            rows.extend(
+                BlockTxid(block=block, txid=txid) for payload in payloads
+                for txid in payload.get("transactions", [txid for _, txid in payload.get("changes", [])])
+            )
+        BlockTxid.objects.bulk_create(rows, batch_size=1000)
     
     def save(self, *args, **kwargs):
         if not self.blockchain or not self.header:
             raise ValueError("Both blockchain and header must be set before saving the block.")
-        self.id = f"{self.blockchain.id}-{self.header.block_hash}"
-        self.size = len(self.data)
+        self.pack_body()
         
         if self.height == 0:
             self.header.previous_hash = natural_byte_order_to_str(DEFAULT_HASH)
         elif not self.header.previous_hash:
             prev_block = Block.objects.filter(blockchain=self.blockchain).order_by('-height').first()
             self.header.previous_hash = prev_block.header.block_hash if prev_block else natural_byte_order_to_str(DEFAULT_HASH)
-        self.header.save()
-        super(Block, self).save(*args, **kwargs)
+        with transaction.atomic():
+            self.header.save()
+            # The header's primary key is its hash, which only settles once it is saved.
+            self.header_id = self.header.block_hash
+            self.id = f"{self.blockchain.id}-{self.header.block_hash}"
+            states = self.blockchain.stage_blocks([self]) if self._state.adding else []
+            super(Block, self).save(*args, **kwargs)
+            sync_block_store()
+            self.index_txids()
+            self.blockchain._write_journal_states(states)
+            self.blockchain.extend_tip(self)
+            self.blockchain.prune_after_commit()
+
+@receiver([post_save, post_delete], sender=Block)
+def invalidate_validated_tip(sender, instance: Block, **kwargs):
+    """Writing a block at or below the checkpoint means the validated prefix may have changed."""
+    Blockchain(pk=instance.blockchain_id).invalidate_checkpoint(instance.height)
+
+@receiver(post_delete, sender=Block)
+def invalidate_chain_tip(sender, instance: Block, **kwargs):
+    """The tip cannot be moved back without the removed block's work, so it is recomputed on next use."""
+    Blockchain(pk=instance.blockchain_id).mark_tip_stale()
+
+@receiver(pre_delete, sender=Block)
+def restore_journal_state(sender, instance: Block, **kwargs):
+    """A block removed on its own hands the journals it last wrote back to the blocks before it."""
+    if instance.undo is None:
+        return
+    written = set(JournalState.objects.filter(block_id=instance.pk).values_list("journal_id", flat=True))
+    if written:
+        Blockchain(pk=instance.blockchain_id)._restore_journal_states(
+            entry for entry in json.loads(instance.undo) if entry[0] in written
+        )
+
+class BlockTxid(models.Model):
+    """Which blocks commit a txid, so inclusion proofs do not scan block data."""
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name="txids")
+    txid = models.CharField(max_length=64, db_index=True)
+    
+    def __str__(self):
+        return f"{self.txid} in {self.block_id}"
+
+class JournalState(models.Model):
+    """
+    Where a chain currently holds each journal: the latest block carrying it.
+    
+    Connecting a block moves these rows forward and records what they were
+    in the block's undo data; disconnecting it moves them back.
+    """
+    blockchain = models.ForeignKey(Blockchain, on_delete=models.CASCADE, related_name="journal_states")
+    journal_id = models.CharField(max_length=255)
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name="+")
+    merkle_root = models.CharField(max_length=64, blank=True, default="")
+    is_deleted = models.BooleanField(default=False)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["blockchain", "journal_id"], name="unique_journal_state"),
+        ]
+    
+    def __str__(self):
+        return f"Journal {self.journal_id} at {self.block_id}"
+
+class AuthorityChange(models.Model):
+    """
+    A key joining or leaving a chain's authorities, from the block at ``height`` on.
+    
+    Written whenever ``Blockchain.authorities`` changes, see ``Blockchain.authority_checker``.
+    """
+    blockchain = models.ForeignKey(Blockchain, on_delete=models.CASCADE, related_name="authority_changes")
+    public_key = models.TextField()
+    height = models.IntegerField()
+    added = models.BooleanField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{'Added' if self.added else 'Removed'} {self.public_key} at {self.height}"
 
 class ChainUser(models.Model):
     user = models.OneToOneField(User, unique=True, on_delete=models.CASCADE, related_name="chain_user")
@@ -247,6 +1412,11 @@ class ChainUser(models.Model):
 
         return self.private_key, self.public_key
 
+    def sign(self, digest: bytes) -> str:
+        """Sign a 32-byte digest with the user's private key, returning the signature in hexadecimal."""
+        sk = SigningKey.from_string(bytes.fromhex(self.private_key), curve=SECP256k1)
+        return sk.sign_digest_deterministic(digest, hashfunc=hashlib.sha256).hex()
+
     def sign_transaction(private_key_hex: str, transaction_data: str) -> str:
         """
         Signs the transaction data using the private key.
@@ -261,4 +1431,65 @@ class ChainUser(models.Model):
         sk = SigningKey.from_string(bytes.fromhex(private_key_hex), curve=SECP256k1)
         hashed_data = sha256(transaction_data)
         signature = sk.sign(hashed_data)
-        return signature.hex()
\ No newline at end of file
+        return signature.hex()
+
+class MiningJob(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    blockchain = models.ForeignKey(Blockchain, on_delete=models.CASCADE, related_name="mining_jobs")
+    status = models.CharField(max_length=10, choices=MINING_JOB_STATUSES, default='queued', db_index=True)
+    block = models.ForeignKey(Block, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    block_hash = models.TextField(null=True, blank=True)
+    journal_count = models.IntegerField(null=True, blank=True)
+    mining_time = models.FloatField(null=True, blank=True)
+    attempts = models.BigIntegerField(null=True, blank=True)
+    hashrate = models.FloatField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Mining job {self.id} ({self.status})"
+
+    class Meta:
+        constraints = [
+            # Requests that race to queue a job for the same chain end up sharing one.
+            models.UniqueConstraint(fields=["blockchain"], condition=models.Q(status='queued'), name="one_queued_mining_job"),
+        ]
+
+class MempoolEntry(models.Model):
+    """A journal with changes waiting to be committed; repeated edits bump the version of the same entry."""
+    blockchain = models.ForeignKey(Blockchain, on_delete=models.CASCADE, related_name="mempool")
+    journal = models.ForeignKey(GeneralJournal, on_delete=models.CASCADE, related_name="mempool_entries")
+    version = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Pending journal {self.journal_id} on {self.blockchain_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["blockchain", "journal"], name="unique_mempool_journal")
+        ]
+
+@receiver(m2m_changed, sender=Blockchain.authorities.through)
+def record_authority_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Record keys joining or leaving a chain's authorities as effective from the block after its tip."""
+    if action == "pre_clear":
+        pairs = [(chain, instance) for chain in instance.authority_chains.all()] if reverse else [(instance, user) for user in instance.authorities.all()]
+    elif action in ("post_add", "post_remove") and pk_set:
+        if reverse:
+            pairs = [(chain, instance) for chain in Blockchain.objects.filter(pk__in=pk_set)]
+        else:
+            pairs = [(instance, user) for user in ChainUser.objects.filter(pk__in=pk_set)]
+    else:
+        return
+    changes = []
+    for chain, user in pairs:
+        if not user.public_key:
+            continue
+        tip_height, _ = chain.get_tip()
+        height = tip_height + 1 if tip_height is not None else 0
+        changes.append(AuthorityChange(blockchain=chain, public_key=user.public_key, height=height, added=action == "post_add"))
+    AuthorityChange.objects.bulk_create(changes)
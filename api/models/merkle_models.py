@@ -0,0 +1,228 @@
+from .utils import sha256, merkle_parent, str_to_natural_byte_order, natural_byte_order_to_str
+from django.db import models, transaction as db_transaction
+
+EMPTY_MERKLE_ROOT = natural_byte_order_to_str(sha256(b''))
+
+# Models
+class MerkleNode(models.Model):
+    journal = models.ForeignKey(
+        "GeneralJournal", on_delete=models.CASCADE, related_name="merkle_nodes"
+    )
+    level = models.PositiveSmallIntegerField()
+    index = models.PositiveIntegerField()
+    hash = models.BinaryField(max_length=32)
+
+    def __str__(self):
+        return f"MerkleNode({self.journal_id}, {self.level}, {self.index})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["journal", "level", "index"], name="unique_merkle_node"),
+        ]
+
+class JournalMerkleTree:
+    """
+    The persisted Merkle tree over a GeneralJournal's transactions.
+
+    Leaves are the txids in ``Transaction.merkle_index`` order and the tree is
+    shaped like ``compute_merkle_root``: the last node of an odd level is
+    paired with itself. Appending, removing or replacing a leaf only rewrites
+    the nodes on its path to the root, so every update is O(log n).
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+
+    @staticmethod
+    def level_sizes(size: int) -> list[int]:
+        """Number of nodes on each level, from the leaves up to the root."""
+        sizes = [size]
+        while sizes[-1] > 1:
+            sizes.append((sizes[-1] + 1) // 2)
+        return sizes
+
+    @property
+    def nodes(self):
+        return MerkleNode.objects.filter(journal_id=self.journal.pk)
+
+    def append(self, txid: str) -> int:
+        """
+        Add a leaf at the end of the tree.
+
+        Returns:
+            int: The leaf index, to be stored as the transaction's ``merkle_index``.
+        """
+        with db_transaction.atomic():
+            size = self._lock()
+            self._update(size + 1, {size: str_to_natural_byte_order(txid)})
+        return size
+
+    def extend(self, txids: list[str]) -> int:
+        """
+        Add several leaves at the end of the tree, rehashing each node above them once.
+
+        Returns:
+            int: The index of the first new leaf, the others follow in order.
+        """
+        with db_transaction.atomic():
+            size = self._lock()
+            if txids:
+                self._update(size + len(txids), {size + offset: str_to_natural_byte_order(txid) for offset, txid in enumerate(txids)})
+        return size
+
+    def replace(self, index: int, txid: str):
+        """Change the txid stored at a leaf."""
+        with db_transaction.atomic():
+            size = self._lock()
+            if not 0 <= index < size:
+                raise IndexError(f"Leaf {index} is outside a tree of {size} leaves.")
+            self._update(size, {index: str_to_natural_byte_order(txid)})
+
+    def remove(self, index: int):
+        """
+        Remove a leaf by moving the last leaf into its place.
+
+        The transaction holding the last leaf has its ``merkle_index`` moved
+        with it, so the leaf order stays dense without renumbering.
+        """
+        with db_transaction.atomic():
+            size = self._lock()
+            if not 0 <= index < size:
+                raise IndexError(f"Leaf {index} is outside a tree of {size} leaves.")
+            last = size - 1
+            leaves = {}
+            if index != last:
+                leaves[index] = bytes(self.nodes.get(level=0, index=last).hash)
+                self.journal.transactions.filter(merkle_index=last).update(merkle_index=index)
+            self._update(last, leaves, dirty={last - 1}, previous_size=size)
+
+    def rebuild(self):
+        """
+        Renumber every transaction of the journal and write the whole tree again.
+
+        Transactions created before the tree existed are placed after the
+        indexed ones, oldest first. This is the O(n) path, used to seed the
+        tree for existing journals.
+        """
+        with db_transaction.atomic():
+            self._lock()
+            Transaction = self.journal.transactions.model
+            rows = list(
+                self.journal.transactions
+                .order_by(models.F("merkle_index").asc(nulls_last=True), "date", "id")
+                .values_list("pk", "txid", "merkle_index")
+            )
+            Transaction.objects.bulk_update(
+                [Transaction(pk=pk, merkle_index=index) for index, (pk, _, current) in enumerate(rows) if current != index],
+                ["merkle_index"], batch_size=1000,
+            )
+
+            self.nodes.delete()
+            level = [str_to_natural_byte_order(txid) for _, txid, _ in rows]
+            nodes = []
+            for depth in range(len(self.level_sizes(len(level)))):
+                nodes.extend(MerkleNode(journal_id=self.journal.pk, level=depth, index=i, hash=h) for i, h in enumerate(level))
+                level = [merkle_parent(level[i], level[i + 1] if i + 1 < len(level) else level[i]) for i in range(0, len(level), 2)]
+            MerkleNode.objects.bulk_create(nodes, batch_size=1000)
+            self._set_root(len(rows), nodes[-1].hash if nodes else None)
+
+    def branch(self, index: int) -> list[dict]:
+        """
+        Merkle branch of the leaf at ``index``, read from the stored nodes in one query.
+
+        Returns:
+            list[dict]: The same ``{"hash", "side"}`` steps as ``merkle_branch``.
+        """
+        sizes = self.level_sizes(self.journal.merkle_size)
+        if not 0 <= index < sizes[0]:
+            raise IndexError(f"Leaf {index} is outside a tree of {sizes[0]} leaves.")
+        steps = []
+        for depth, size in enumerate(sizes[:-1]):
+            position = index >> depth
+            sibling = position ^ 1
+            # The last node of an odd level is paired with itself.
+            steps.append((depth, sibling if sibling < size else position, sibling < position))
+        known = self._fetch({(depth, node) for depth, node, _ in steps})
+        return [
+            {"hash": natural_byte_order_to_str(known[(depth, node)]), "side": "left" if left else "right"}
+            for depth, node, left in steps
+        ]
+
+    def root(self) -> str:
+        """The stored Merkle Root, equal to ``compute_merkle_root`` over the txids in leaf order."""
+        return self.journal.merkle_root
+
+    def _lock(self) -> int:
+        """Lock the journal row and return the current number of leaves."""
+        return type(self.journal).objects.select_for_update().values_list("merkle_size", flat=True).get(pk=self.journal.pk)
+
+    def _update(self, size: int, leaves: dict[int, bytes], dirty: set[int] = frozenset(), previous_size: int | None = None):
+        """
+        Write the given leaves and rehash the paths above them and above ``dirty``.
+
+        Siblings that are not being rewritten are read in one query and every
+        changed node is written in one upsert; nodes past the end of a
+        shrunken tree are deleted.
+        """
+        sizes = self.level_sizes(size)
+        rows = {(0, index): digest for index, digest in leaves.items()}
+
+        # The nodes to recompute on each level, bottom up.
+        paths = [{i for i in set(leaves) | set(dirty) if 0 <= i < size}]
+        for _ in sizes[1:]:
+            paths.append({i // 2 for i in paths[-1]})
+
+        wanted = {(0, i) for i in paths[0] if i not in leaves}
+        for depth, parents in enumerate(paths[1:]):
+            for parent in parents:
+                for child in (2 * parent, 2 * parent + 1):
+                    if child < sizes[depth] and (depth, child) not in rows and child not in paths[depth]:
+                        wanted.add((depth, child))
+        wanted -= set(rows)
+        known = self._fetch(wanted)
+
+        for depth, parents in enumerate(paths[1:]):
+            for parent in sorted(parents):
+                left = rows.get((depth, 2 * parent)) or known[(depth, 2 * parent)]
+                right_index = 2 * parent + 1
+                right = (rows.get((depth, right_index)) or known[(depth, right_index)]) if right_index < sizes[depth] else left
+                rows[(depth + 1, parent)] = merkle_parent(left, right)
+
+        if rows:
+            MerkleNode.objects.bulk_create(
+                [MerkleNode(journal_id=self.journal.pk, level=depth, index=index, hash=digest) for (depth, index), digest in rows.items()],
+                update_conflicts=True, unique_fields=["journal", "level", "index"], update_fields=["hash"],
+            )
+        if previous_size is not None and previous_size > size:
+            stale = {
+                (depth, index)
+                for depth, previous in enumerate(self.level_sizes(previous_size))
+                for index in range(sizes[depth] if depth < len(sizes) and size else 0, previous)
+            }
+            self.nodes.filter(pk__in=self._fetch(stale, pks=True).values()).delete()
+
+        top = (len(sizes) - 1, 0)
+        root = (rows.get(top) or known.get(top)) if size else None
+        self._set_root(size, root)
+
+    def _fetch(self, keys: set[tuple[int, int]], pks: bool = False) -> dict:
+        """
+        Read the nodes at the given ``(level, index)`` keys in one query.
+
+        Filtering on a level list and an index list keeps the lookup on the
+        unique index; the few extra rows it matches are dropped here.
+        """
+        if not keys:
+            return {}
+        rows = self.nodes.filter(level__in={k[0] for k in keys}, index__in={k[1] for k in keys})
+        return {
+            (level, index): pk if pks else bytes(digest)
+            for pk, level, index, digest in rows.values_list("pk", "level", "index", "hash")
+            if (level, index) in keys
+        }
+
+    def _set_root(self, size: int, root: bytes | None):
+        root = natural_byte_order_to_str(root) if root else EMPTY_MERKLE_ROOT
+        type(self.journal).objects.filter(pk=self.journal.pk).update(merkle_size=size, merkle_root=root)
+        self.journal.merkle_size = size
+        self.journal.merkle_root = root
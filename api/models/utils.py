@@ -1,5 +1,9 @@
 import hashlib, struct
 from datetime import datetime
+from decimal import Decimal
+from ..light_client import bits_to_target
+# Header workers check seals too, so the signature check lives with them, outside Django.
+from ..mining.verify import verify_signature
 
 def sha256(data: str | bytes) -> bytes:
     """Returns SHA-256 hash of the input."""
@@ -43,16 +47,125 @@ def natural_byte_order_to_str(value: bytes) -> str:
     """Convert a 32-byte hash back to its hexadecimal string representation."""
     return value.hex()
 
+def to_minor_units(value, scale: int) -> int:
+    """
+    An amount as a whole number of minor units, e.g. cents at ``scale`` 2.
+    
+    Raises:
+        ValueError: When the amount has more decimal places than ``scale`` or does not fit in 64 bits.
+    """
+    amount = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+    minor = amount.scaleb(scale)
+    if minor != minor.to_integral_value():
+        raise ValueError(f"{value} has more than {scale} decimal places.")
+    minor = int(minor)
+    if not -2**63 <= minor < 2**63:
+        raise ValueError(f"{value} does not fit in 64-bit minor units.")
+    return minor
+
+def from_minor_units(minor: int, scale: int) -> Decimal:
+    """The exact Decimal amount of ``minor`` units, with ``scale`` decimal places."""
+    return Decimal(minor).scaleb(-scale)
+
+def merkle_parent(left: bytes, right: bytes) -> bytes:
+    """Hash two sibling Merkle nodes into their parent."""
+    return sha256(sha256(left + right))
+
 def compute_merkle_root(txids: list[str]) -> str:
     """Compute the Merkle Root from a list of TXIDs."""
     if not txids:
         return natural_byte_order_to_str(sha256(b''))
     
-    while len(txids) > 1:
-        if len(txids) % 2 == 1:
-            txids.append(txids[-1])
-        txids = [
-            natural_byte_order_to_str(sha256(sha256(bytes.fromhex(txids[i] + txids[i + 1]))))
-            for i in range(0, len(txids), 2)
-        ]
-    return txids[0]
+    level = [str_to_natural_byte_order(txid) for txid in txids]
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level.append(level[-1])
+        level = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return natural_byte_order_to_str(level[0])
+
+def merkle_branch(txids: list[str], index: int) -> list[dict]:
+    """
+    Sibling hashes from the txid at ``index`` up to the root ``compute_merkle_root`` returns.
+
+    Returns:
+        list[dict]: One ``{"hash": ..., "side": "left" | "right"}`` per level, bottom up,
+        where ``side`` is the side of the sibling.
+    """
+    level = [str_to_natural_byte_order(txid) for txid in txids]
+    branch = []
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level.append(level[-1])
+        sibling = index ^ 1
+        branch.append({"hash": natural_byte_order_to_str(level[sibling]), "side": "left" if sibling < index else "right"})
+        level = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+        index //= 2
+    return branch
+
+def txid_changes(previous: list[str], current: list[str]) -> list[list]:
+    """
+    The leaves of ``current`` that differ from ``previous`` at the same position.
+
+    Journal trees remove a leaf by moving the last one into its place, so a
+    change is positional: ``[index, txid]`` pairs together with the new
+    length are enough to rebuild ``current``, see ``apply_txid_changes``.
+    """
+    return [[index, txid] for index, txid in enumerate(current) if index >= len(previous) or previous[index] != txid]
+
+def apply_txid_changes(previous: list[str], size: int, changes: list[list]) -> list[str]:
+    """
+    Rebuild a txid list from the one before it and the changes ``txid_changes`` listed.
+
+    Raises:
+        ValueError: When the changes leave a position without a txid.
+    """
+    txids = previous[:size] + [None] * (size - len(previous))
+    for index, txid in changes:
+        if not 0 <= index < size:
+            raise ValueError(f"Change at leaf {index} is outside a list of {size} txids.")
+        txids[index] = txid
+    if size > len(previous) and None in txids[len(previous):]:
+        raise ValueError("Changes leave leaves without a txid.")
+    return txids
+
+# The easiest target a retargeting chain may drift to, equal to the default Blockchain.target.
+MAX_TARGET = 0x0ffff << 236
+
+def bits_to_target_int(bits: str) -> int:
+    """
+    Expand the compact bits representation into the full target.
+
+    The decoding itself is ``light_client.bits_to_target``, which has to stay
+    in that standard-library-only module; this checks the length first.
+    """
+    if len(bits) != 8:
+        raise ValueError("Bits must be exactly 8 characters long.")
+    return bits_to_target(bits)
+
+def target_int_to_bits(target: int) -> str:
+    """Encode a target as compact bits, keeping the three most significant bytes."""
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        coefficient = target << (8 * (3 - size))
+    else:
+        coefficient = target >> (8 * (size - 3))
+    # The top bit of the coefficient is a sign bit, so move to the next byte.
+    if coefficient & 0x800000:
+        coefficient >>= 8
+        size += 1
+    return f"{size:02x}{coefficient:06x}"
+
+def block_work(bits: str) -> int:
+    """Expected number of hashes to find a block at the given bits, the block's contribution to chain work."""
+    return (1 << 256) // (bits_to_target_int(bits) + 1)
+
+def retarget(target: int, timespan: int, expected_timespan: int, max_step: float = 4.0, limit: int = MAX_TARGET) -> int:
+    """
+    Scale a target by how long a window of blocks took compared to the expected time.
+
+    The observed timespan is clamped to ``max_step`` times faster or slower than
+    expected, so a single retarget can change difficulty by at most that factor.
+    """
+    timespan = min(max(timespan, int(expected_timespan / max_step)), int(expected_timespan * max_step))
+    return max(1, min(target * max(timespan, 1) // expected_timespan, limit))
+
@@ -1,8 +1,21 @@
 from rest_framework import serializers
-from .models import BlockHeader, Blockchain, Block, ChainUser, TransactionLine, Transaction, GeneralJournal, Account
+from .models import BlockHeader, Blockchain, Block, ChainUser, MiningJob, TransactionLine, Transaction, GeneralJournal, Account
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.models import User
 
+class AmountField(serializers.DecimalField):
+    """A ledger amount, exact to the places it is stored with, two or the company's currency scale, rather than rounded to the model field."""
+    
+    def __init__(self, **kwargs):
+        super().__init__(max_digits=None, decimal_places=None, **kwargs)
+
+# Columns holding amounts as integer minor units, read through the amount fields instead.
+MINOR_UNIT_COLUMNS = {
+    TransactionLine: ('value_minor',),
+    Transaction: ('total_minor', 'debit_total_minor', 'credit_total_minor'),
+    GeneralJournal: ('balance_minor', 'debit_total_minor', 'credit_total_minor'),
+}
+
 # GET
 class BlockHeaderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,6 +38,16 @@ class ChainUserSerializer(serializers.ModelSerializer):
         model = ChainUser
         fields = '__all__'
 
+class MiningJobSerializer(serializers.ModelSerializer):
+    height = serializers.IntegerField(source='block.height', read_only=True, default=None)
+
+    class Meta:
+        model = MiningJob
+        fields = [
+            'id', 'blockchain', 'status', 'height', 'block_hash', 'journal_count',
+            'mining_time', 'attempts', 'hashrate', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+
 class AccountSerializer(serializers.ModelSerializer):
     class Meta:
         model = Account
@@ -32,23 +55,30 @@ class AccountSerializer(serializers.ModelSerializer):
 
 class TransactionLineSerializer(serializers.ModelSerializer):
     account = AccountSerializer(required=True)
+    value = AmountField()
     class Meta:
         model = TransactionLine
-        fields = '__all__'
+        exclude = MINOR_UNIT_COLUMNS[TransactionLine]
 
 class TransactionSerializer(serializers.ModelSerializer):
     lines = TransactionLineSerializer(many=True, required=False)
+    total = AmountField(read_only=True)
+    debit_total = AmountField(read_only=True)
+    credit_total = AmountField(read_only=True)
 
     class Meta:
         model = Transaction
-        fields = '__all__'
+        exclude = MINOR_UNIT_COLUMNS[Transaction]
 
 class GeneralJournalSerializer(serializers.ModelSerializer):
     transactions = TransactionSerializer(many=True, required=False)
+    balance = AmountField(read_only=True)
+    debit_total = AmountField(read_only=True)
+    credit_total = AmountField(read_only=True)
 
     class Meta:
         model = GeneralJournal
-        fields = '__all__'
+        exclude = MINOR_UNIT_COLUMNS[GeneralJournal]
 
 # POST
 class LoginSerializer(serializers.Serializer):
@@ -81,10 +111,44 @@ class TransactionFormSerializer(serializers.ModelSerializer):
         fields = ['description', 'date', 'journal']
 
 class TransactionLineFormSerializer(serializers.ModelSerializer):
+    value = AmountField()
+
     class Meta:
         model = TransactionLine
         fields = ['account', 'is_debit', 'value', 'transaction']
 
+    def validate(self, attrs):
+        transaction = attrs.get('transaction') or self.instance.transaction
+        line = TransactionLine(value=attrs.get('value', getattr(self.instance, 'value', None)))
+        try:
+            line.check_value(transaction.scale)
+        except ValueError as e:
+            raise serializers.ValidationError({'value': str(e)})
+        return attrs
+
+class TransactionLineOperationSerializer(serializers.Serializer):
+    """One step of a TransactionLineBatchAPI request: creating a line, or updating or deleting one by ``id``."""
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.UUIDField(required=False)
+    account = serializers.PrimaryKeyRelatedField(queryset=Account.objects.all(), required=False)
+    is_debit = serializers.BooleanField(required=False)
+    value = AmountField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'create':
+            missing = [field for field in ('account', 'is_debit', 'value') if field not in attrs]
+            if missing:
+                raise serializers.ValidationError({field: ['This field is required.'] for field in missing})
+        elif 'id' not in attrs:
+            raise serializers.ValidationError({'id': ['This field is required.']})
+        if attrs.get('value') is not None and attrs['value'] <= 0:
+            raise serializers.ValidationError({'value': ['Ensure this value is greater than 0.']})
+        return attrs
+
+class TransactionLineBatchSerializer(serializers.Serializer):
+    transaction = serializers.DictField(required=False)
+    operations = TransactionLineOperationSerializer(many=True, allow_empty=False)
+
 class AccountFormSerializer(serializers.ModelSerializer):
     class Meta:
         model = Account
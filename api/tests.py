@@ -1,3 +1,1257 @@
-from django.test import TestCase
+import importlib.util, json, os, random, shutil, tempfile, threading
+from io import BytesIO, StringIO
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Account, Block, BlockHeader, Blockchain, ChainUser, GeneralJournal, JournalState, MempoolEntry, MiningJob, Transaction, TransactionLine
+from .models.utils import MAX_TARGET, bits_to_target_int, compute_merkle_root, target_int_to_bits
+from .light_client import VerificationError, verify_inclusion
+from .blockstore import ChainFileReader, FlatFileStore, decode_body, encode_body, get_block_archive, is_encoded_body
+from .views import blockchain_views
+from .views.blockchain_views import build_block_template, enqueue_mining_job, mine_mempool_block, new_block, mine_header, header_chain, queued_job, recover_mining_jobs, run_mining_job, schedule_mempool
+from .views.sync_views import RemoteNode, import_chain, iter_chain_export, sync_from_chain, sync_from_remote
+from .serializers import TransactionLineFormSerializer, TransactionLineSerializer, TransactionSerializer
+from .mining import HeaderTemplate, get_backend, mine_parallel
+from .mining import verify
+from .mining.parallel import PREFLIGHT_SIZE, START_METHOD, shutdown_search_pool
 
-# Create your tests here.
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+def random_header(rng: random.Random) -> BlockHeader:
+    return BlockHeader(
+        version=rng.randbytes(4).hex(),
+        bits=rng.randbytes(4).hex(),
+        previous_hash=rng.randbytes(32).hex(),
+        merkle_root=rng.randbytes(32).hex(),
+        timestamp=rng.randrange(0, 0x100000000),
+    )
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class NumpyBackendParityTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = random.Random(1234)
+        self.backend = get_backend("numpy")
+
+    def test_digests_match_compute_block_hash(self):
+        edge_nonces = [0, 1, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFE, 0xFFFFFFFF]
+        for _ in range(20):
+            header = random_header(self.rng)
+            nonces = edge_nonces + [self.rng.randrange(0, 0x100000000) for _ in range(50)]
+            digests = self.backend.from_header(header).digest_batch(nonces)
+            for nonce, digest in zip(nonces, digests):
+                header.nonce = nonce
+                self.assertEqual(bytes(digest).hex(), header.compute_block_hash())
+
+    def test_digests_match_after_timestamp_roll(self):
+        header = random_header(self.rng)
+        template = self.backend.from_header(header)
+        header.timestamp = template.roll_timestamp()
+        header.nonce = 42
+        self.assertEqual(bytes(template.digest_batch([42])[0]).hex(), header.compute_block_hash())
+
+    def test_search_matches_hashlib_backend(self):
+        target = (1 << 244).to_bytes(32, "big")
+        for _ in range(5):
+            prefix = random_header(self.rng)._header_data()
+            expected = HeaderTemplate(prefix).search(target, 0, 50_000)
+            self.assertEqual(self.backend(prefix, batch_size=4096).search(target, 0, 50_000), expected)
+
+    def test_search_miss_counts_every_attempt(self):
+        prefix = random_header(self.rng)._header_data()
+        self.assertEqual(self.backend(prefix, batch_size=1000).search(bytes(32), 10, 2510), (None, None, 2500))
+
+    def test_mine_parallel_matches_hashlib_backend(self):
+        prefix = random_header(self.rng)._header_data()
+        target = 1 << 240
+        expected = mine_parallel(prefix, target, workers=1, backend="hashlib")
+        result = mine_parallel(prefix, target, workers=1, backend="numpy")
+        self.assertEqual((result.nonce, result.block_hash), (expected.nonce, expected.block_hash))
+
+class HeaderTemplateTests(SimpleTestCase):
+    def test_digest_matches_compute_block_hash(self):
+        header = random_header(random.Random(99))
+        template = HeaderTemplate.from_header(header)
+        for nonce in (0, 1, 0xFFFFFFFF):
+            header.nonce = nonce
+            self.assertEqual(template.digest(nonce).hex(), header.compute_block_hash())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend("cuda")
+
+class ParallelMiningTests(SimpleTestCase):
+    def test_parallel_search_finds_the_serial_nonce(self):
+        self.addCleanup(shutdown_search_pool)
+        prefix = bytes([4]) * 76
+        target = (1 << 256) // 100_000
+        expected = mine_parallel(prefix, target, workers=1, end=1 << 19, backend="hashlib")
+        # Past the in-process preflight, so the pool does the finding.
+        self.assertGreater(expected.nonce, PREFLIGHT_SIZE)
+        for _ in range(2):
+            result = mine_parallel(prefix, target, workers=2, end=1 << 19, chunk_size=1 << 14, backend="hashlib")
+            self.assertEqual((result.nonce, result.block_hash, result.workers), (expected.nonce, expected.block_hash, 2))
+
+class JournalMerkleTreeTests(TestCase):
+    def setUp(self):
+        self.journals = [GeneralJournal.objects.create(company=name, period=date(2024, 1, 1), balance=0) for name in "ab"]
+
+    def assertTreesMatchFullRecompute(self):
+        for journal in self.journals:
+            journal.refresh_from_db()
+            txids = list(journal.transactions.order_by("merkle_index").values_list("txid", flat=True))
+            self.assertEqual(journal.merkle_size, len(txids))
+            self.assertEqual(journal.merkle_root, compute_merkle_root(txids))
+            self.assertEqual(journal.merkle_nodes.count(), sum(journal.merkle_tree.level_sizes(len(txids))) if txids else 0)
+
+    def test_random_edits_match_full_recompute(self):
+        rng = random.Random(7)
+        transactions = []
+        for step in range(120):
+            choice = rng.random()
+            if choice < 0.55 or not transactions:
+                tx = Transaction(journal=rng.choice(self.journals), date=timezone.now(), description=f"tx {step}")
+                tx.save()
+                transactions.append(tx.pk)
+            elif choice < 0.85:
+                Transaction.objects.get(pk=transactions.pop(rng.randrange(len(transactions)))).delete()
+            else:
+                tx = Transaction.objects.get(pk=rng.choice(transactions))
+                tx.journal = next(journal for journal in self.journals if journal.pk != tx.journal_id)
+                tx.save()
+            self.assertTreesMatchFullRecompute()
+
+    def test_rebuild_matches_full_recompute(self):
+        for step in range(9):
+            Transaction(journal=self.journals[0], date=timezone.now(), description=f"tx {step}").save()
+        Transaction.objects.update(merkle_index=None)
+        self.journals[0].merkle_tree.rebuild()
+        self.assertTreesMatchFullRecompute()
+
+    def test_payload_repairs_trees_changed_around_them(self):
+        for step in range(4):
+            Transaction(journal=self.journals[0], date=timezone.now(), description=f"tx {step}").save()
+        # A queryset delete and a bulk insert bypass the tree but leave the count as it was.
+        self.journals[0].transactions.filter(merkle_index=1).delete()
+        Transaction.objects.bulk_create([Transaction(journal=self.journals[0], date=timezone.now(), description="bulk", txid="ab" * 32)])
+        self.assertEqual(self.journals[0].transactions.count(), GeneralJournal.objects.get(pk=self.journals[0].pk).merkle_size)
+        payload = Block.journal_payload(self.journals[0])
+        self.assertEqual(payload["merkle_root"], compute_merkle_root(payload["transactions"]))
+        self.assertIn("ab" * 32, payload["transactions"])
+        self.assertTreesMatchFullRecompute()
+
+    def test_compute_merkle_root_leaves_input_alone(self):
+        rng = random.Random(3)
+        txids = [rng.randbytes(32).hex() for _ in range(3)]
+        compute_merkle_root(txids)
+        self.assertEqual(len(txids), 3)
+
+class TotalsTests(TestCase):
+    def setUp(self):
+        self.journals = [GeneralJournal.objects.create(company=name, period=date(2024, 1, 1), balance=0) for name in "ab"]
+        self.cash = Account.objects.create(ref="100", name="Cash", type="asset")
+        self.sales = Account.objects.create(ref="400", name="Sales", type="revenue")
+
+    def transaction(self, lines: int) -> Transaction:
+        tx = Transaction(journal=self.journals[0], date=timezone.now(), description=f"{lines} lines")
+        tx.save()
+        for _ in range(lines):
+            TransactionLine(transaction=tx, account=self.cash, is_debit=True, value=5).save()
+            TransactionLine(transaction=tx, account=self.sales, is_debit=False, value=5).save()
+        return tx
+
+    def totals(self, model, pk) -> tuple:
+        row = model.objects.get(pk=pk)
+        return row.debit_total, row.credit_total
+
+    def test_lines_keep_totals_in_step(self):
+        tx = self.transaction(3)
+        self.assertEqual((tx.total_debits(), tx.total_credits()), (15, 15))
+        self.assertEqual(self.totals(GeneralJournal, self.journals[0].pk), (15, 15))
+        line = tx.lines.filter(is_debit=True).first()
+        line.value = 10
+        line.save()
+        self.assertEqual(self.totals(Transaction, tx.pk), (20, 15))
+        with self.assertRaises(ValueError):
+            Transaction.objects.get(pk=tx.pk).save()
+        line.delete()
+        tx.lines.filter(is_debit=False).first().delete()
+        tx.save()
+        self.assertEqual(Transaction.objects.get(pk=tx.pk).total, 10)
+        self.journals[0].save()
+        self.assertEqual(self.journals[0].balance, 10)
+
+    def test_moves_and_deletes_carry_the_totals(self):
+        tx = self.transaction(2)
+        tx.journal = self.journals[1]
+        tx.save()
+        self.assertEqual(self.totals(GeneralJournal, self.journals[0].pk), (0, 0))
+        self.assertEqual(self.totals(GeneralJournal, self.journals[1].pk), (10, 10))
+        tx.delete()
+        self.assertEqual(self.totals(GeneralJournal, self.journals[1].pk), (0, 0))
+
+    def test_saves_cost_the_same_whatever_the_line_count(self):
+        counts = []
+        for lines in (1, 20):
+            tx = self.transaction(lines)
+            with CaptureQueriesContext(connection) as queries:
+                tx.save()
+                self.journals[0].save()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_deletes_cost_the_same_whatever_the_line_count(self):
+        counts = []
+        for lines in (1, 20):
+            tx = self.transaction(lines)
+            with CaptureQueriesContext(connection) as queries:
+                Transaction.objects.filter(pk=tx.pk).delete()
+            counts.append(sum(query["sql"].startswith("UPDATE") for query in queries))
+            self.assertEqual(self.totals(GeneralJournal, self.journals[0].pk), (0, 0))
+        self.assertEqual(counts, [1, 1])
+        self.transaction(2)
+        self.cash.delete()
+        self.assertEqual(self.totals(GeneralJournal, self.journals[0].pk), (0, 10))
+        with CaptureQueriesContext(connection) as queries:
+            GeneralJournal.objects.filter(pk=self.journals[0].pk).delete()
+        self.assertFalse([query for query in queries if query["sql"].startswith("UPDATE")])
+
+    def test_rebuild_totals_matches_the_lines(self):
+        tx = self.transaction(2)
+        Transaction.objects.update(debit_total=0, credit_total=0)
+        GeneralJournal.objects.update(debit_total=0, credit_total=0, balance=0)
+        call_command("rebuild_totals", stdout=StringIO())
+        self.assertEqual(self.totals(Transaction, tx.pk), (10, 10))
+        self.assertEqual(self.totals(GeneralJournal, self.journals[0].pk), (10, 10))
+        self.assertEqual(GeneralJournal.objects.get(pk=self.journals[0].pk).balance, 10)
+
+@override_settings(AMOUNT_STORAGE="minor", CURRENCY_SCALES={"jp": 0, "bh": 3})
+class MinorUnitTotalsTests(TotalsTests):
+    def test_amounts_are_stored_as_minor_units(self):
+        tx = self.transaction(2)
+        self.assertEqual(
+            list(TransactionLine.objects.filter(transaction=tx).values_list("value", "value_minor", "amount_scale").distinct()),
+            [(None, 500, 2)],
+        )
+        self.assertEqual(Transaction.objects.filter(pk=tx.pk).values_list("debit_total", "debit_total_minor").get(), (None, 1000))
+        self.assertEqual(str(TransactionLine.objects.filter(transaction=tx).first().value), "5.00")
+        self.assertEqual(self.journals[0].account_totals(), {self.cash.pk: (Decimal("10.00"), 0), self.sales.pk: (0, Decimal("10.00"))})
+
+    def test_company_scales_are_exact_at_the_api(self):
+        journal = GeneralJournal.objects.create(company="bh", period=date(2024, 1, 1), balance=0)
+        tx = Transaction(journal=journal, date=timezone.now(), description="fils")
+        tx.save()
+        form = TransactionLineFormSerializer(data={"account": self.cash.pk, "is_debit": True, "value": "1.234", "transaction": tx.pk})
+        self.assertTrue(form.is_valid(), form.errors)
+        line = form.save()
+        self.assertEqual(TransactionLine.objects.filter(pk=line.pk).values_list("value_minor", flat=True).get(), 1234)
+        self.assertEqual(TransactionLineSerializer(TransactionLine.objects.get(pk=line.pk)).data["value"], "1.234")
+        self.assertEqual(TransactionSerializer(Transaction.objects.get(pk=tx.pk)).data["debit_total"], "1.234")
+
+        yen = GeneralJournal.objects.create(company="jp", period=date(2024, 1, 1), balance=0)
+        tx = Transaction(journal=yen, date=timezone.now(), description="yen")
+        tx.save()
+        form = TransactionLineFormSerializer(data={"account": self.cash.pk, "is_debit": True, "value": "1.5", "transaction": tx.pk})
+        self.assertFalse(form.is_valid())
+        self.assertIn("value", form.errors)
+
+    def test_rebuild_converts_decimal_rows(self):
+        with self.settings(AMOUNT_STORAGE="decimal"):
+            tx = self.transaction(2)
+        self.assertEqual(TransactionLine.objects.filter(value_minor__isnull=False).count(), 0)
+        call_command("rebuild_totals", stdout=StringIO())
+        self.assertEqual(TransactionLine.objects.filter(value__isnull=False).count(), 0)
+        self.assertEqual(Transaction.objects.filter(pk=tx.pk).values_list("debit_total", "debit_total_minor").get(), (None, 1000))
+        self.assertEqual(self.totals(GeneralJournal, self.journals[0].pk), (10, 10))
+
+class JournalImportTests(TestCase):
+    def setUp(self):
+        self.journal = GeneralJournal.objects.create(company="a", period=date(2024, 1, 1), balance=0)
+        self.cash = Account.objects.create(ref="100", name="Cash", type="asset")
+        self.sales = Account.objects.create(ref="400", name="Sales", type="revenue")
+        user = User.objects.create_user("importer", password="secret")
+        ChainUser.objects.create(user=user, blockchain=Blockchain.objects.create(target="7" + "f" * 63))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def post(self, body: str, content_type: str):
+        return self.client.post(f"/api/journal/import/?journal_id={self.journal.pk}", body.encode(), content_type=content_type)
+
+    def test_csv_import_is_one_mining_job(self):
+        rows = ["transaction,date,description,account,is_debit,value"]
+        for index in range(5):
+            rows += [
+                f"t{index},2024-01-0{index + 1}T10:00:00,sale {index},100,true,12.50",
+                f"t{index},,,400,false,10.00",
+                f"t{index},,,{self.sales.pk},false,2.50",
+            ]
+        response = self.post("\n".join(rows), "text/csv")
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual((response.data["transactions"], response.data["lines"]), (5, 15))
+        self.assertEqual((MempoolEntry.objects.count(), MiningJob.objects.count()), (1, 1))
+
+        self.journal.refresh_from_db()
+        self.assertEqual((self.journal.debit_total, self.journal.credit_total, self.journal.balance), (Decimal("62.5"), Decimal("62.5"), Decimal("62.5")))
+        transactions = list(self.journal.transactions.order_by("merkle_index"))
+        self.assertEqual(self.journal.merkle_root, compute_merkle_root([tx.txid for tx in transactions]))
+        self.assertEqual([(tx.debit_total, tx.credit_total, tx.lines.count()) for tx in transactions[:1]], [(Decimal("12.5"), Decimal("12.5"), 3)])
+
+    def test_errors_are_reported_per_row_and_nothing_is_written(self):
+        entries = [
+            {"date": "2024-01-01T10:00:00", "description": "ok", "lines": [
+                {"account": "100", "is_debit": True, "value": 5}, {"account": "400", "is_debit": False, "value": 5},
+            ]},
+            {"date": "2024-01-02T10:00:00", "description": "unbalanced", "lines": [
+                {"account": "100", "is_debit": True, "value": 5}, {"account": "400", "is_debit": False, "value": 4},
+            ]},
+            {"date": "2024-01-03T10:00:00", "description": "bad line", "lines": [
+                {"account": "999", "is_debit": True, "value": 5}, {"account": "400", "is_debit": False, "value": 5.001},
+            ]},
+        ]
+        body = "\n".join(json.dumps(entry) for entry in entries) + "\n{not json\n"
+        response = self.post(body, "application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+        errors = [(error["row"], error.get("line"), sorted(error["errors"])) for error in response.data["errors"]]
+        self.assertEqual(errors, [
+            (2, None, ["non_field_errors"]), (3, 0, ["account"]), (3, 1, ["value"]), (4, None, ["non_field_errors"]),
+        ])
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(MiningJob.objects.exists())
+        self.journal.refresh_from_db()
+        self.assertEqual((self.journal.merkle_size, self.journal.debit_total), (0, 0))
+
+    def test_duplicate_transactions_are_rejected(self):
+        line = {"date": "2024-01-01T10:00:00", "description": "dup", "lines": [
+            {"account": "100", "is_debit": True, "value": "1"}, {"account": "400", "is_debit": False, "value": "1"},
+        ]}
+        self.assertEqual(self.post(json.dumps(line), "application/x-ndjson").status_code, 202)
+        response = self.post(json.dumps(line), "application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("txid", response.data["errors"][0]["errors"])
+        self.assertEqual(self.post("a,b\n1,2", "text/plain").status_code, 415)
+
+class TransactionLineBatchTests(TestCase):
+    def setUp(self):
+        self.journal = GeneralJournal.objects.create(company="a", period=date(2024, 1, 1), balance=0)
+        self.cash = Account.objects.create(ref="100", name="Cash", type="asset")
+        self.sales = Account.objects.create(ref="400", name="Sales", type="revenue")
+        user = User.objects.create_user("clerk", password="secret")
+        ChainUser.objects.create(user=user, blockchain=Blockchain.objects.create(target="7" + "f" * 63))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def batch(self, query: str, operations: list, **body):
+        return self.client.post(f"/api/transaction-line/batch/?{query}", {**body, "operations": operations}, format="json")
+
+    def entry(self) -> Transaction:
+        response = self.batch(f"journal_id={self.journal.pk}", [
+            {"op": "create", "account": str(self.cash.pk), "is_debit": True, "value": "30.00"},
+            {"op": "create", "account": str(self.sales.pk), "is_debit": False, "value": "20.00"},
+            {"op": "create", "account": str(self.sales.pk), "is_debit": False, "value": "10.00"},
+        ], transaction={"date": "2024-01-05T10:00:00", "description": "sale"})
+        self.assertEqual(response.status_code, 202, response.data)
+        return Transaction.objects.get(pk=response.data["id"])
+
+    def test_an_entry_takes_one_request_and_one_job(self):
+        tx = self.entry()
+        self.assertEqual((tx.lines.count(), tx.debit_total, tx.credit_total), (3, 30, 30))
+        self.assertEqual(self.journal.transactions.count(), 1)
+        self.assertEqual(MiningJob.objects.count(), 1)
+
+    def test_operations_are_balanced_as_a_whole(self):
+        tx = self.entry()
+        debit = tx.lines.get(is_debit=True)
+        credit = tx.lines.filter(is_debit=False).order_by("value").first()
+        response = self.batch(f"transaction_id={tx.pk}", [
+            {"op": "update", "id": str(debit.pk), "value": "35.00"},
+            {"op": "delete", "id": str(credit.pk)},
+            {"op": "create", "account": str(self.sales.pk), "is_debit": False, "value": "15.00"},
+        ])
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual((response.data["debit_total"], response.data["credit_total"]), ("35.00", "35.00"))
+        self.assertEqual(MiningJob.objects.count(), 1)
+
+        response = self.batch(f"transaction_id={tx.pk}", [{"op": "update", "id": str(debit.pk), "value": "36.00"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TransactionLine.objects.get(pk=debit.pk).value, 35)
+        self.assertEqual(GeneralJournal.objects.get(pk=self.journal.pk).debit_total, 35)
+
+    def test_errors_are_reported_per_operation(self):
+        tx = self.entry()
+        other = Transaction(journal=self.journal, date=timezone.now(), description="other")
+        other.save()
+        stranger = TransactionLine(transaction=other, account=self.cash, is_debit=True, value=1)
+        stranger.save()
+        response = self.batch(f"transaction_id={tx.pk}", [
+            {"op": "delete", "id": str(stranger.pk)},
+            {"op": "create", "account": str(self.cash.pk), "is_debit": True, "value": "1.001"},
+            {"op": "create", "account": str(self.sales.pk), "is_debit": False, "value": "1.00"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([sorted(error) for error in response.data["operations"]], [["id"], ["value"], []])
+        self.assertEqual(tx.lines.count(), 3)
+        self.assertTrue(TransactionLine.objects.filter(pk=stranger.pk).exists())
+
+class MerkleProofTests(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(target="7" + "f" * 63)
+        self.journals = [GeneralJournal.objects.create(company=name, period=date(2024, 1, 1), balance=0) for name in "abc"]
+        for step in range(11):
+            Transaction(journal=self.journals[step % 3], date=timezone.now(), description=f"tx {step}").save()
+        for _ in range(2):
+            block = new_block(self.blockchain)
+            block.set_journal_payloads([Block.journal_payload(journal) for journal in self.journals], commit=False)
+            mine_header(self.blockchain, block)
+
+    def proof(self, block: Block, txid: str) -> dict:
+        return {
+            "txid": txid,
+            "consensus": self.blockchain.consensus,
+            "block_hash": block.header.block_hash,
+            "branch": block.merkle_proof(txid),
+            "headers": header_chain(self.blockchain, block.height),
+        }
+
+    def test_every_transaction_verifies_against_headers(self):
+        block = self.blockchain.blocks.get(height=0)
+        tip = self.blockchain.blocks.get(height=1).header.block_hash
+        for txid in Transaction.objects.values_list("txid", flat=True):
+            self.assertEqual(verify_inclusion(self.proof(block, txid), trusted_tip=tip).block_hash, block.header.block_hash)
+
+    def test_stale_journal_tree_falls_back_to_block_data(self):
+        block = self.blockchain.blocks.get(height=0)
+        txid = self.journals[0].transactions.order_by("merkle_index").values_list("txid", flat=True).first()
+        Transaction(journal=self.journals[0], date=timezone.now(), description="later").save()
+        verify_inclusion(self.proof(block, txid))
+
+    def test_tampered_branch_is_rejected(self):
+        block = self.blockchain.blocks.get(height=0)
+        proof = self.proof(block, Transaction.objects.values_list("txid", flat=True).first())
+        proof["branch"][0]["hash"] = "00" * 32
+        with self.assertRaises(VerificationError):
+            verify_inclusion(proof)
+
+    def test_proof_headers_are_paged(self):
+        client = APIClient()
+        user = User.objects.create_user("auditor")
+        ChainUser.objects.create(user=user, blockchain=self.blockchain)
+        client.force_authenticate(user)
+        block = self.blockchain.blocks.get(height=1)
+        txid = Transaction.objects.values_list("txid", flat=True).first()
+        later = new_block(self.blockchain)
+        later.set_journal_payloads([{"action": "modify", "journal_id": "later", "transactions": [], "merkle_root": compute_merkle_root([])}], commit=False)
+        mine_header(self.blockchain, later)
+        with mock.patch.object(blockchain_views, "MAX_HEADERS", 1):
+            proof = client.get(f"/api/merkle-proof/?txid={txid}").data
+            self.assertEqual((len(proof["headers"]), proof["tip_height"], proof["chain_tip_height"]), (1, 1, 2))
+            proof["headers"] += client.get(f"/api/headers/?from={proof['tip_height'] + 1}").data["headers"]
+        tip = later.header.block_hash
+        self.assertEqual(verify_inclusion(proof, trusted_tip=tip).block_hash, block.header.block_hash)
+
+class ChainMixin:
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(target="7" + "f" * 63)
+        journal = GeneralJournal.objects.create(company="a", period=date(2024, 1, 1), balance=0)
+        Transaction(journal=journal, date=timezone.now(), description="tx").save()
+        self.journal = journal
+        for _ in range(4):
+            self.append()
+
+    def append(self):
+        block = new_block(self.blockchain)
+        block.set_general_journal(self.journal, commit=False)
+        mine_header(self.blockchain, block)
+
+class MempoolTests(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(target="7" + "f" * 63)
+        self.journals = []
+        for company in "abc":
+            journal = GeneralJournal.objects.create(company=company, period=date(2024, 1, 1), balance=0)
+            Transaction(journal=journal, date=timezone.now(), description=f"{company} tx").save()
+            self.journals.append(journal)
+
+    def packed(self, block: Block) -> list[str]:
+        return [journal["journal_id"] for journal in block.get_general_journals()]
+
+    def test_edits_of_a_journal_collapse_into_one_entry(self):
+        jobs = {enqueue_mining_job(self.blockchain, self.journals[0]).pk for _ in range(3)}
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(list(MempoolEntry.objects.values_list("journal_id", "version")), [(self.journals[0].pk, 2)])
+
+    def test_packing_respects_the_limits(self):
+        for journal in self.journals:
+            enqueue_mining_job(self.blockchain, journal)
+        ids = [str(journal.pk) for journal in self.journals]
+        block, included = build_block_template(self.blockchain)
+        self.assertEqual((self.packed(block), len(included)), (ids, 3))
+        block, _ = build_block_template(self.blockchain, max_journals=2)
+        self.assertEqual(self.packed(block), ids[:2])
+        # The first journal always fits, so an oversized one cannot stall the mempool.
+        block, included = build_block_template(self.blockchain, max_size=1)
+        self.assertEqual((self.packed(block), len(included)), (ids[:1], 1))
+
+    def test_size_limit_holds_for_the_stored_block(self):
+        for journal in self.journals:
+            enqueue_mining_job(self.blockchain, journal)
+        for encoding in ("json", "binary"):
+            with self.subTest(encoding), override_settings(BLOCK_ENCODING=encoding):
+                full, _ = build_block_template(self.blockchain)
+                block, included = build_block_template(self.blockchain, max_size=full.size - 1)
+                self.assertEqual(len(included), 2)
+                self.assertLessEqual(block.size, full.size - 1)
+                self.assertEqual(block.size, len(encode_body(block.get_general_journal())) if encoding == "binary" else len(block.data))
+
+    def test_journals_edited_during_mining_stay_pending(self):
+        for journal in self.journals[:2]:
+            enqueue_mining_job(self.blockchain, journal)
+
+        def mine_and_edit(*args):
+            MempoolEntry.objects.filter(journal=self.journals[0]).update(version=F("version") + 1)
+            return mine_header(*args)
+
+        with mock.patch.object(blockchain_views, "mine_header", mine_and_edit):
+            block = mine_mempool_block(self.blockchain)
+        self.assertEqual(len(self.packed(block)), 2)
+        self.assertEqual(list(MempoolEntry.objects.values_list("journal_id", flat=True)), [self.journals[0].pk])
+
+    def test_one_queued_job_per_chain(self):
+        job, created = queued_job(self.blockchain.pk)
+        self.assertTrue(created)
+        self.assertEqual(queued_job(self.blockchain.pk), (job, False))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MiningJob.objects.create(blockchain=self.blockchain)
+        enqueue_mining_job(self.blockchain, self.journals[0])
+        with mock.patch.object(blockchain_views, "mining_executor") as executor:
+            schedule_mempool(self.blockchain.pk)
+        executor.assert_not_called()
+        self.assertEqual(MiningJob.objects.count(), 1)
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+@mock.patch.object(blockchain_views, "mining_executor", InlineExecutor)
+class MiningJobTests(TransactionTestCase):
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(target="7" + "f" * 63)
+        self.journal = GeneralJournal.objects.create(company="a", period=date(2024, 1, 1), balance=0)
+        Transaction(journal=self.journal, date=timezone.now(), description="tx").save()
+        user = User.objects.create_user("miner", password="secret")
+        ChainUser.objects.create(user=user, blockchain=self.blockchain)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_jobs_are_accepted_then_mined(self):
+        response = self.client.post("/api/mine/", {"journal_id": str(self.journal.pk)}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["mining_job"]["status"], "queued")
+        # The job ran once the request committed.
+        response = self.client.get(f"/api/mining-job/?id={response.data['mining_job']['id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["status"], response.data["height"], response.data["journal_count"]), ("mined", 0, 1))
+        self.assertEqual(response.data["block_hash"], self.blockchain.get_tip()[1])
+        self.assertFalse(MempoolEntry.objects.exists())
+
+    def test_jobs_with_nothing_to_mine_fail(self):
+        job = MiningJob.objects.create(blockchain=self.blockchain)
+        run_mining_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("No pending journal changes", job.error)
+        self.assertIsNotNone(job.finished_at)
+        # Only queued jobs are picked up.
+        MiningJob.objects.filter(pk=job.pk).update(status="running", error=None)
+        run_mining_job(job.pk)
+        self.assertEqual(MiningJob.objects.get(pk=job.pk).status, "running")
+
+    def test_recovery_fails_interrupted_jobs_and_reruns_queued_ones(self):
+        running = MiningJob.objects.create(blockchain=self.blockchain, status="running", started_at=timezone.now())
+        queued = MiningJob.objects.create(blockchain=self.blockchain)
+        MempoolEntry.objects.create(blockchain=self.blockchain, journal=self.journal)
+        self.assertEqual(recover_mining_jobs(stale_after=0), (1, 1))
+        self.assertEqual(MiningJob.objects.get(pk=running.pk).status, "failed")
+        self.assertEqual(MiningJob.objects.get(pk=queued.pk).status, "mined")
+        self.assertEqual(self.blockchain.get_tip()[0], 0)
+
+@skipUnless(connection.vendor == "postgresql", "only Postgres makes inserts wait on the chain row's lock")
+@mock.patch.object(blockchain_views, "mining_executor")
+class MiningLockTests(TransactionTestCase):
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(target="7" + "f" * 63)
+        self.journals = []
+        for company in "ab":
+            journal = GeneralJournal.objects.create(company=company, period=date(2024, 1, 1), balance=0)
+            Transaction(journal=journal, date=timezone.now(), description=f"{company} tx").save()
+            self.journals.append(journal)
+
+    def test_edits_enqueue_while_a_block_is_mined(self, executor):
+        job = enqueue_mining_job(self.blockchain, self.journals[0])
+        mining, release = threading.Event(), threading.Event()
+
+        def slow_mine(*args):
+            mining.set()
+            release.wait(10)
+            return mine_header(*args)
+
+        with mock.patch.object(blockchain_views, "mine_header", slow_mine):
+            worker = threading.Thread(target=run_mining_job, args=(job.pk,))
+            worker.start()
+            try:
+                self.assertTrue(mining.wait(10))
+                # The chain row is locked by the job now; the edit must not wait for the block.
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL lock_timeout = '2s'")
+                    second = enqueue_mining_job(self.blockchain, self.journals[1])
+            finally:
+                release.set()
+                worker.join(30)
+        self.assertNotEqual(second.pk, job.pk)
+        self.assertEqual(MiningJob.objects.get(pk=second.pk).status, "queued")
+        self.assertEqual(MiningJob.objects.get(pk=job.pk).status, "mined")
+
+class RetargetTests(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(retarget_enabled=True, retarget_window=2, block_interval=60)
+
+    def append(self, bits: str | None = None) -> Block:
+        block = new_block(self.blockchain)
+        if bits is not None:
+            block.header.bits = bits
+        block.set_journal_payloads([{"action": "modify", "journal_id": f"j{block.height}", "transactions": [], "merkle_root": compute_merkle_root([])}], commit=False)
+        return mine_header(self.blockchain, block)
+
+    def test_bits_round_trip_at_byte_boundaries(self):
+        for target in (1, 0x7f, 0x80, 0xff, 0x7fffff, 0x800000, 0xffff00, 0x7fffff << 200, 0x800000 << 200, MAX_TARGET):
+            bits = target_int_to_bits(target)
+            self.assertEqual(bits_to_target_int(bits), target, bits)
+            # A set top bit would read as a sign, so the coefficient moves down a byte.
+            self.assertFalse(int(bits[2:], 16) & 0x800000, bits)
+        self.assertEqual(target_int_to_bits(0x80), "02008000")
+        # Only 23 bits of coefficient fit, so the lowest byte is dropped there.
+        self.assertEqual(bits_to_target_int(target_int_to_bits(0xffffff)), 0xffff00)
+        self.assertEqual(target_int_to_bits(bits_to_target_int("1d00ffff")), "1d00ffff")
+
+    def test_retarget_moves_on_window_boundaries_within_the_clamp(self):
+        chain = Blockchain(retarget_enabled=True, retarget_window=4, block_interval=60, retarget_max_step=4.0)
+        bits = target_int_to_bits(MAX_TARGET >> 8)
+        target = bits_to_target_int(bits)
+        self.assertEqual(chain.retarget_bits(5, bits, [0, 1, 2, 3]), bits)
+        self.assertEqual(chain.retarget_bits(4, bits, [0, 1, 2]), bits)
+        # Three intervals of 60 seconds are expected per window of four blocks.
+        self.assertEqual(chain.retarget_bits(4, bits, [0, 60, 120, 180]), bits)
+        self.assertEqual(chain.retarget_bits(4, bits, [0, 120, 240, 360]), target_int_to_bits(target * 2))
+        self.assertEqual(chain.retarget_bits(4, bits, [0, 0, 0, 0]), target_int_to_bits(target // 4))
+        self.assertEqual(chain.retarget_bits(4, bits, [0, 1000, 2000, 10_000]), target_int_to_bits(target * 4))
+        # Only the last window counts.
+        self.assertEqual(chain.retarget_bits(4, bits, [-9999, 0, 60, 120, 180]), bits)
+        self.assertEqual(chain.retarget_bits(4, target_int_to_bits(MAX_TARGET), [0, 1000, 2000, 10_000]), target_int_to_bits(MAX_TARGET))
+
+    def test_forged_bits_fail_validation(self):
+        for _ in range(3):
+            self.append()
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+        expected = self.blockchain.next_bits()
+        self.append(target_int_to_bits(bits_to_target_int(expected) * 2))
+        with self.assertRaisesMessage(ValueError, "Block 3 does not follow the difficulty retarget rule"):
+            self.blockchain.validate_chain(full=True)
+
+    def test_enabling_retargeting_keeps_earlier_blocks_valid(self):
+        self.blockchain.retarget_enabled = False
+        self.blockchain.save()
+        for _ in range(5):
+            self.append()
+        self.blockchain.retarget_enabled = True
+        self.blockchain.save()
+        self.assertEqual(self.blockchain.retarget_height, 5)
+        self.append()
+        self.append()
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+        # Checking the rule from genesis would reject the blocks mined before it was on.
+        Blockchain.objects.filter(pk=self.blockchain.pk).update(retarget_height=0)
+        self.blockchain.refresh_from_db()
+        with self.assertRaisesMessage(ValueError, "does not follow the difficulty retarget rule"):
+            self.blockchain.validate_chain(full=True)
+
+class ProofOfAuthorityTests(TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain.objects.create(consensus="poa")
+        self.authority = self.chain_user("authority")
+        self.blockchain.authorities.add(self.authority)
+
+    def chain_user(self, name: str) -> ChainUser:
+        chain_user = ChainUser.objects.create(user=User.objects.create_user(name), blockchain=self.blockchain)
+        chain_user.generate_keys()
+        return chain_user
+
+    def append(self, sealer: ChainUser | None = None) -> Block:
+        block = new_block(self.blockchain)
+        block.set_journal_payloads([{"action": "modify", "journal_id": f"j{block.height}", "transactions": [], "merkle_root": compute_merkle_root([])}], commit=False)
+        if sealer is None:
+            return mine_header(self.blockchain, block)
+        block.header.seal(sealer)
+        block.save()
+        return block
+
+    def test_sealed_chain_validates(self):
+        for _ in range(3):
+            block = self.append()
+        self.assertEqual(block.header.signer, self.authority.public_key)
+        self.assertTrue(block.header.has_valid_seal({self.authority.public_key}))
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+
+    def test_block_sealed_by_a_non_authority_is_rejected(self):
+        self.append()
+        self.append(self.chain_user("outsider"))
+        with self.assertRaisesMessage(ValueError, "Block 1 is not sealed by an authority"):
+            self.blockchain.validate_chain(full=True)
+
+    def test_tampered_signature_is_rejected(self):
+        self.append()
+        block = self.append()
+        signature = block.header.signature
+        BlockHeader.objects.filter(pk=block.header_id).update(signature=signature[:-2] + ("00" if signature[-2:] != "00" else "01"))
+        with self.assertRaisesMessage(ValueError, "Block 1 is not sealed by an authority"):
+            self.blockchain.validate_chain(full=True)
+
+    def test_seals_are_checked_in_worker_processes(self):
+        self.addCleanup(verify.shutdown_verify_pool)
+        for _ in range(4):
+            block = self.append()
+        self.assertTrue(self.blockchain.validate_chain(full=True, workers=2, chunk_size=1))
+        pool = verify._pool
+        self.assertEqual(pool._mp_context.get_start_method(), START_METHOD)
+        BlockHeader.objects.filter(pk=block.header_id).update(signature=self.blockchain.blocks.get(height=2).header.signature)
+        with self.assertRaisesMessage(ValueError, "Block 3 is not sealed by an authority"):
+            self.blockchain.validate_chain(full=True, workers=2, chunk_size=1)
+        # The second pass runs on the processes the first one started.
+        self.assertIs(verify._pool, pool)
+
+    def test_mine_header_needs_an_authority_key(self):
+        ChainUser.objects.filter(pk=self.authority.pk).update(private_key=None)
+        with self.assertRaisesMessage(ValueError, "No authority key"):
+            self.append()
+        self.blockchain.authorities.clear()
+        with self.assertRaisesMessage(ValueError, "No authority key"):
+            self.append()
+
+    def test_removing_an_authority_keeps_the_blocks_it_sealed(self):
+        self.append()
+        self.append()
+        successor = self.chain_user("successor")
+        self.blockchain.authorities.add(successor)
+        self.blockchain.authorities.remove(self.authority)
+        self.assertEqual(self.append().header.signer, successor.public_key)
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+        # Added at height 2, the successor could not have sealed the blocks before it.
+        self.assertFalse(self.blockchain.authority_checker()(successor.public_key, 1))
+        self.append(self.authority)
+        with self.assertRaisesMessage(ValueError, "Block 3 is not sealed by an authority"):
+            self.blockchain.validate_chain(full=True)
+
+    def test_chain_file_imports_with_its_authorities(self):
+        for _ in range(2):
+            self.append()
+        imported = import_chain(ChainFileReader(BytesIO(b"".join(iter_chain_export(self.blockchain)))))
+        self.assertEqual(list(imported.authorities.all()), [self.authority])
+        self.assertEqual(imported.validated_height, 1)
+
+    def test_chain_file_with_an_unknown_authority_is_rejected(self):
+        self.append()
+        chain_file = b"".join(iter_chain_export(self.blockchain))
+        ChainUser.objects.filter(pk=self.authority.pk).update(public_key="02" + "ab" * 32)
+        with self.assertRaisesMessage(VerificationError, "authorities unknown to this node"):
+            import_chain(ChainFileReader(BytesIO(chain_file)))
+        self.assertEqual(Blockchain.objects.count(), 1)
+
+class ChainCheckpointTests(ChainMixin, TestCase):
+    def test_checkpoint_advances_with_the_tip(self):
+        self.assertTrue(self.blockchain.validate_chain())
+        self.assertEqual(self.blockchain.validated_height, 3)
+        work = self.blockchain.validated_work
+        self.append()
+        self.assertEqual(self.blockchain.validated_height, 3)
+        self.assertTrue(self.blockchain.validate_chain())
+        self.assertEqual(self.blockchain.validated_height, 4)
+        self.assertEqual(self.blockchain.validated_work, work * 5 / 4)
+
+    def test_write_below_checkpoint_invalidates_it(self):
+        self.blockchain.validate_chain()
+        block = self.blockchain.blocks.get(height=1)
+        block.data = "{}"
+        block.save()
+        self.blockchain.refresh_from_db()
+        self.assertIsNone(self.blockchain.validated_height)
+
+    def test_full_mode_ignores_checkpoint(self):
+        self.blockchain.validate_chain()
+        # A bulk update bypasses the save signals, so only a full pass notices it.
+        BlockHeader.objects.filter(block__blockchain=self.blockchain, block__height=2).update(nonce=123456)
+        self.assertTrue(self.blockchain.validate_chain())
+        with self.assertRaisesMessage(ValueError, "Block 2 failed header validation."):
+            self.blockchain.validate_chain(full=True)
+        self.assertEqual(self.blockchain.validated_height, 1)
+
+    def test_parallel_validation_reports_lowest_bad_height(self):
+        self.addCleanup(verify.shutdown_verify_pool)
+        for _ in range(4):
+            self.append()
+        BlockHeader.objects.filter(block__blockchain=self.blockchain, block__height__in=[3, 6]).update(nonce=123456)
+        with self.assertRaisesMessage(ValueError, "Block 3 failed header validation."):
+            self.blockchain.validate_chain(full=True, workers=2, chunk_size=2)
+        self.assertEqual(self.blockchain.validated_height, 2)
+
+class ChainTraversalTests(ChainMixin, TestCase):
+    def count_queries(self, func) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_chain_length(self):
+        short = (
+            self.count_queries(lambda: self.blockchain.validate_chain(full=True, workers=1)),
+            self.count_queries(lambda: header_chain(self.blockchain, 0)),
+        )
+        for _ in range(6):
+            self.append()
+        long = (
+            self.count_queries(lambda: self.blockchain.validate_chain(full=True, workers=1)),
+            self.count_queries(lambda: header_chain(self.blockchain, 0)),
+        )
+        self.assertEqual(short, long)
+
+    def test_keyset_pages_cover_the_chain(self):
+        heights = [height for height, in self.blockchain.iter_headers(("height",), page_size=3)]
+        self.assertEqual(heights, list(range(4)))
+        rows = list(self.blockchain.iter_headers(("block_hash",), start=1, stop=3, page_size=1))
+        self.assertEqual(rows, [(self.blockchain.blocks.get(height=h).header_id,) for h in (1, 2)])
+
+class ChainTipTests(ChainMixin, TestCase):
+    def test_tip_follows_appends(self):
+        tip = self.blockchain.blocks.get(height=3)
+        self.assertEqual(self.blockchain.get_tip(), (3, tip.header_id))
+        self.blockchain.validate_chain(full=True)
+        self.assertEqual(self.blockchain.get_chain_work(), self.blockchain.validated_work)
+
+    def test_new_block_reads_tip_without_scanning(self):
+        stored = Blockchain.objects.get(pk=self.blockchain.pk)
+        with CaptureQueriesContext(connection) as queries:
+            block = new_block(stored)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(block.height, 4)
+
+    def test_deleting_the_tip_recomputes_it(self):
+        work = self.blockchain.get_chain_work()
+        self.blockchain.blocks.get(height=3).delete()
+        stored = Blockchain.objects.get(pk=self.blockchain.pk)
+        self.assertIsNone(stored.chain_work)
+        self.assertEqual(stored.get_tip(), (2, self.blockchain.blocks.get(height=2).header_id))
+        self.assertEqual(stored.get_chain_work(), work * 3 / 4)
+
+class ChainSyncTests(ChainMixin, TestCase):
+    def test_sync_copies_only_the_missing_suffix(self):
+        peer = Blockchain.objects.create(target=self.blockchain.target)
+        self.assertEqual(sync_from_chain(peer, self.blockchain), 4)
+        self.append()
+        self.append()
+        self.assertEqual(sync_from_chain(peer, self.blockchain), 2)
+        self.assertEqual(peer.get_tip(), self.blockchain.get_tip())
+        self.assertEqual(sync_from_chain(peer, self.blockchain), 0)
+        self.assertTrue(peer.validate_chain(full=True))
+
+    def test_sync_replaces_a_shorter_fork(self):
+        peer = Blockchain.objects.create(target=self.blockchain.target)
+        sync_from_chain(peer, self.blockchain)
+        fork = new_block(peer)
+        fork.set_general_journal(self.journal, commit=False)
+        fork.header.timestamp += 1
+        mine_header(peer, fork)
+        self.append()
+        self.append()
+        self.assertEqual(sync_from_chain(peer, self.blockchain), 2)
+        self.assertEqual(
+            list(peer.blocks.order_by("height").values_list("header_id", flat=True)),
+            list(self.blockchain.blocks.order_by("height").values_list("header_id", flat=True)),
+        )
+
+class ChainFileTests(ChainMixin, TestCase):
+    def export(self) -> bytes:
+        return b"".join(iter_chain_export(self.blockchain, buffer_size=256))
+
+    def test_export_import_roundtrip(self):
+        Transaction(journal=self.journal, date=timezone.now(), description="second").save()
+        self.append()
+        # Batches of two make deltas build on blocks written by an earlier batch.
+        imported = import_chain(ChainFileReader(BytesIO(self.export())), batch_size=2)
+        self.assertEqual(imported.get_tip(), self.blockchain.get_tip())
+        self.assertEqual(imported.get_chain_work(), self.blockchain.get_chain_work())
+        self.assertEqual(imported.validated_height, 4)
+        self.assertTrue(imported.validate_chain(full=True))
+        self.assertEqual(
+            [block.stored_body() for block in imported.blocks.order_by("height")],
+            [block.stored_body() for block in self.blockchain.blocks.order_by("height")],
+        )
+        self.assertEqual(imported.journal_transactions(self.journal.id), self.blockchain.journal_transactions(self.journal.id))
+
+    def test_truncated_file_is_rejected(self):
+        with self.assertRaises(VerificationError):
+            import_chain(ChainFileReader(BytesIO(self.export()[:-20])))
+        self.assertEqual(Blockchain.objects.count(), 1)
+
+    def test_tampered_body_is_rejected(self):
+        Block.objects.filter(blockchain=self.blockchain, height=2).update(data='{"transactions": [], "merkle_root": "00"}', body=None)
+        with self.assertRaises(VerificationError):
+            import_chain(ChainFileReader(BytesIO(self.export())))
+        self.assertEqual(Blockchain.objects.count(), 1)
+
+class ReorgTests(ChainMixin, TestCase):
+    def state(self, blockchain: Blockchain) -> dict:
+        return dict(blockchain.journal_states.values_list("journal_id", "block__height"))
+
+    def test_disconnect_restores_journal_state(self):
+        journal_id = str(self.journal.id)
+        self.assertEqual(self.state(self.blockchain), {journal_id: 3})
+        self.assertEqual(self.blockchain.disconnect_blocks(1), 2)
+        self.assertEqual(self.state(self.blockchain), {journal_id: 1})
+        self.assertEqual(self.blockchain.disconnect_blocks(-1), 2)
+        self.assertEqual(self.state(self.blockchain), {})
+
+    def test_reorg_drops_journals_of_the_losing_branch(self):
+        peer = Blockchain.objects.create(target=self.blockchain.target)
+        sync_from_chain(peer, self.blockchain)
+        other = GeneralJournal.objects.create(company="b", period=date(2024, 1, 1), balance=0)
+        Transaction(journal=other, date=timezone.now(), description="fork").save()
+        fork = new_block(peer)
+        fork.set_general_journal(other, commit=False)
+        mine_header(peer, fork)
+        self.assertIn(str(other.id), self.state(peer))
+        peer.validate_chain()
+        self.append()
+        self.append()
+        self.assertEqual(sync_from_chain(peer, self.blockchain), 2)
+        self.assertEqual(self.state(peer), {str(self.journal.id): 5})
+        # The checkpoint falls back to the fork point instead of being dropped.
+        self.assertEqual(Blockchain.objects.get(pk=peer.pk).validated_height, 3)
+        undo = json.loads(peer.blocks.get(height=5).undo)
+        self.assertEqual(undo, [[str(self.journal.id), peer.blocks.get(height=4).id, self.journal.merkle_root, False]])
+
+    def test_interrupted_reorg_leaves_the_chain_untouched(self):
+        before = list(self.blockchain.blocks.order_by("height").values_list("id", flat=True))
+        tip = self.blockchain.get_tip()
+
+        def branch():
+            yield Block(id="broken", blockchain=self.blockchain, height=2, header_id=tip[1], data="{}")
+            raise RuntimeError("connection lost")
+
+        with self.assertRaises(RuntimeError):
+            self.blockchain.reorganize(1, branch(), 2, tip[1], 0)
+        self.assertEqual(list(self.blockchain.blocks.order_by("height").values_list("id", flat=True)), before)
+        self.assertEqual(Blockchain.objects.get(pk=self.blockchain.pk).get_tip(), tip)
+        self.assertEqual(self.state(self.blockchain), {str(self.journal.id): 3})
+
+    def test_chains_without_undo_records_are_replayed(self):
+        self.blockchain.blocks.update(undo=None)
+        JournalState.objects.all().delete()
+        self.blockchain.disconnect_blocks(2)
+        self.assertEqual(self.state(self.blockchain), {str(self.journal.id): 2})
+        self.assertFalse(self.blockchain.blocks.filter(undo__isnull=True).exists())
+
+class JournalDeltaTests(ChainMixin, TestCase):
+    def txids(self) -> list[str]:
+        return list(self.journal.transactions.order_by("merkle_index").values_list("txid", flat=True))
+
+    def tip_payload(self) -> dict:
+        return self.blockchain.blocks.order_by("-height").first().journal(str(self.journal.id))
+
+    def test_blocks_carry_only_the_changes(self):
+        Transaction(journal=self.journal, date=timezone.now(), description="second").save()
+        self.append()
+        payload = self.tip_payload()
+        self.assertNotIn("transactions", payload)
+        self.assertEqual(payload["base"], self.blockchain.blocks.get(height=3).header_id)
+        self.assertEqual((payload["size"], payload["changes"]), (2, [[1, self.txids()[1]]]))
+        self.assertEqual(self.blockchain.journal_transactions(self.journal.id), self.txids())
+        tip = self.blockchain.blocks.get(height=4)
+        self.assertEqual(tip.data_merkle_root(), tip.header.merkle_root)
+        proof = {
+            "txid": self.txids()[1], "consensus": self.blockchain.consensus, "block_hash": tip.header_id,
+            "branch": tip.merkle_proof(self.txids()[1]), "headers": header_chain(self.blockchain, 4),
+        }
+        self.assertEqual(verify_inclusion(proof).block_hash, tip.header_id)
+
+    def test_removed_transactions_are_replayed(self):
+        for step in range(3):
+            Transaction(journal=self.journal, date=timezone.now(), description=f"more {step}").save()
+        self.append()
+        before = self.txids()
+        self.journal.transactions.order_by("merkle_index").first().delete()
+        self.append()
+        # The last leaf moves into the removed one's place, a single change.
+        self.assertEqual((self.tip_payload()["size"], self.tip_payload()["changes"]), (3, [[0, before[-1]]]))
+        self.assertEqual(self.blockchain.journal_transactions(self.journal.id), self.txids())
+        self.assertEqual(self.blockchain.journal_transactions(self.journal.id, self.blockchain.blocks.get(height=4)), before)
+
+    @override_settings(JOURNAL_SNAPSHOT_INTERVAL=3)
+    def test_full_lists_are_written_periodically(self):
+        for _ in range(4):
+            self.append()
+        depths = [
+            block.journal(str(self.journal.id)).get("depth", 0)
+            for block in self.blockchain.blocks.order_by("height")
+        ]
+        # The first four blocks were written by setUp under the default interval.
+        self.assertEqual(depths, [0, 1, 2, 3, 0, 1, 2, 0])
+        self.assertEqual(self.blockchain.journal_transactions(self.journal.id), self.txids())
+
+@override_settings(HEADER_STORAGE="binary")
+class BinaryHeaderStorageTests(ChainMixin, TestCase):
+    def test_headers_are_stored_raw_and_decoded_on_access(self):
+        block = self.blockchain.blocks.get(height=2)
+        stored = BlockHeader.objects.filter(pk=block.header_id).values("version", "bits", "previous_hash", "merkle_root", "raw").get()
+        self.assertEqual({stored[field] for field in ("version", "bits", "previous_hash", "merkle_root")}, {""})
+        self.assertEqual(len(stored["raw"]), 80)
+
+        header = BlockHeader.objects.get(pk=block.header_id)
+        self.assertEqual(header.previous_hash, self.blockchain.blocks.get(height=1).header_id)
+        self.assertEqual(header.compute_block_hash(), header.block_hash)
+        self.assertEqual(header_chain(self.blockchain, 2, 1), [bytes(stored["raw"]).hex()])
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+
+    def test_tampered_raw_header_fails_validation(self):
+        header = BlockHeader.objects.get(block__blockchain=self.blockchain, block__height=2)
+        BlockHeader.objects.filter(pk=header.pk).update(raw=header.raw[:76] + b"\xff\xff\xff\xff")
+        with self.assertRaisesMessage(ValueError, "Block 2 failed header validation."):
+            self.blockchain.validate_chain(full=True)
+
+    def test_existing_headers_convert_both_ways(self):
+        with override_settings(HEADER_STORAGE="text"):
+            self.append()
+        tip = BlockHeader.objects.get(block__blockchain=self.blockchain, block__height=4)
+        self.assertIsNone(tip.raw)
+        call_command("pack_headers", stdout=StringIO())
+        self.assertFalse(BlockHeader.objects.filter(raw__isnull=True).exists())
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+        call_command("pack_headers", "--to", "text", stdout=StringIO())
+        self.assertFalse(BlockHeader.objects.filter(merkle_root="").exists())
+        self.assertEqual(BlockHeader.objects.get(pk=tip.pk).merkle_root, tip.merkle_root)
+
+class FlatFileStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_segments_rotate_and_read_back(self):
+        store = FlatFileStore(self.path, segment_size=64, fsync_every=2)
+        bodies = [os.urandom(20) for _ in range(5)]
+        locations = [store.append(body) for body in bodies]
+        self.assertEqual([segment for segment, _ in locations], [0, 0, 1, 1, 2])
+        self.assertEqual([bytes(store.read(*location, verify=True)) for location in locations], bodies)
+
+    def test_reopening_cuts_off_a_torn_record(self):
+        store = FlatFileStore(self.path, fsync_every=1)
+        store.append(b"first")
+        with open(store.segment_path(0), "ab") as segment:
+            segment.write(b"\x40\x00\x00\x00\x00\x00")
+        reopened = FlatFileStore(self.path)
+        self.assertEqual(reopened.recovered, 6)
+        location = reopened.append(b"second")
+        self.assertEqual(bytes(reopened.read(*location)), b"second")
+        self.assertEqual([bytes(body) for _, body in reopened.scan(0)], [b"first", b"second"])
+
+class FlatFileBlockTests(ChainMixin, TestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        settings = override_settings(BLOCK_STORE="flatfile", BLOCK_STORE_PATH=path, BLOCK_ENCODING="binary")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+    def test_bodies_live_in_segment_files(self):
+        stored = self.blockchain.blocks.filter(height=2).values("data", "body_segment").get()
+        self.assertEqual(stored, {"data": "", "body_segment": 0})
+        block = self.blockchain.blocks.get(height=2)
+        self.assertEqual(block.get_general_journal()["journal_id"], str(self.journal.id))
+        self.assertEqual(
+            [json.loads(data)["journal_id"] for _, data in self.blockchain.iter_chain(("height", "data"), 1)],
+            [str(self.journal.id)] * 3,
+        )
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+
+    def test_bodies_move_back_to_the_database(self):
+        body = self.blockchain.blocks.get(height=3).data
+        call_command("store_block_bodies", "--to", "database", stdout=StringIO())
+        stored = self.blockchain.blocks.filter(height=3).values_list("body", flat=True).get()
+        self.assertEqual(json.dumps(decode_body(stored), indent=4), body)
+        self.assertEqual(self.blockchain.blocks.get(height=3).data, body)
+        self.assertFalse(self.blockchain.blocks.filter(body_segment__isnull=False).exists())
+
+class PruneTests(ChainMixin, TestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        settings = override_settings(BLOCK_ARCHIVE_PATH=path, BLOCK_ARCHIVE_CHUNK=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+    def test_deep_bodies_are_archived_and_read_back(self):
+        bodies = [data for _, data in self.blockchain.iter_chain(("height", "data"))]
+        self.assertEqual(self.blockchain.prune(2), 2)
+        stored = list(self.blockchain.blocks.order_by("height").values_list("data", "body", "archive_chunk"))
+        self.assertEqual([row[:2] for row in stored[:2]], [("", None)] * 2)
+        self.assertEqual([row[2] for row in stored], [0, 0, None, None])
+        self.assertEqual([data for _, data in self.blockchain.iter_chain(("height", "data"))], bodies)
+        self.assertEqual(self.blockchain.blocks.get(height=1).get_general_journal()["journal_id"], str(self.journal.id))
+        self.assertEqual(self.blockchain.journal_transactions(self.journal.id), [self.journal.transactions.get().txid])
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+        self.assertEqual(self.blockchain.prune(2), 0)
+
+    @override_settings(PRUNE_DEPTH=2)
+    def test_appends_keep_pruning(self):
+        # Pruning waits for the block's transaction to commit.
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.append()
+        self.assertFalse(self.blockchain.blocks.filter(archive_chunk__isnull=False).exists())
+        for callback in callbacks:
+            callback()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.append()
+        self.blockchain.refresh_from_db()
+        self.assertEqual(self.blockchain.archived_height, 4)
+        self.assertEqual(self.blockchain.blocks.filter(archive_chunk__isnull=True).count(), 2)
+
+    def test_rewritten_chunks_keep_the_old_file_until_commit(self):
+        archive = get_block_archive()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blockchain.prune(2)
+        body = self.blockchain.blocks.get(height=0).data
+        # Bringing back one block of the chunk makes the next prune write the chunk again.
+        self.blockchain.rehydrate(1, 2)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.blockchain.prune(2)
+            raise RuntimeError
+        self.assertEqual(sorted(archive.generations(self.blockchain.pk, 0)), [1, 2])
+        self.assertEqual(self.blockchain.blocks.get(height=0).data, body)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.blockchain.prune(2), 2)
+        self.assertEqual(archive.generations(self.blockchain.pk, 0), [3])
+        self.assertEqual(self.blockchain.blocks.get(height=0).data, body)
+
+    def test_bodies_are_rehydrated(self):
+        call_command("prune_blocks", str(self.blockchain.pk), "--depth", "1", stdout=StringIO())
+        self.assertEqual(self.blockchain.blocks.filter(archive_chunk__isnull=False).count(), 2)
+        body = self.blockchain.blocks.get(height=1).data
+        # Archive files are removed once the rehydration commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("prune_blocks", str(self.blockchain.pk), "--rehydrate", stdout=StringIO())
+        self.assertFalse(self.blockchain.blocks.filter(archive_chunk__isnull=False).exists())
+        self.assertEqual(self.blockchain.blocks.get(height=1).data, body)
+        self.assertEqual(get_block_archive().size(self.blockchain.pk), 0)
+        self.blockchain.refresh_from_db()
+        self.assertEqual(self.blockchain.archived_height, 0)
+
+class BlockEncodingTests(SimpleTestCase):
+    def journal(self, journal_id: str, action: str = "modify") -> dict:
+        rng = random.Random(journal_id)
+        return {
+            "action": action,
+            "journal_id": journal_id,
+            "company": "a",
+            "period": "2024-01-01",
+            "balance": "0.00",
+            "transactions": [rng.randbytes(32).hex() for _ in range(3)],
+            "merkle_root": rng.randbytes(32).hex(),
+        }
+
+    def test_bodies_round_trip_with_every_compression(self):
+        payloads = [
+            self.journal("0b6f3a4e-8c1d-4f7a-9b2e-5d6c7e8f9a0b"),
+            self.journal("legacy-7", "delete"),
+            {"journals": [self.journal("legacy-8"), self.journal("6a1f2c3d-4e5f-4a6b-8c7d-9e0f1a2b3c4d")]},
+            {
+                **{key: value for key, value in self.journal("legacy-9").items() if key not in ("transactions", "merkle_root")},
+                "base": "ab" * 32, "depth": 3, "size": 200, "changes": [[0, "cd" * 32], [199, "ef" * 32]], "merkle_root": "01" * 32,
+            },
+            {"message": "Genesis Block"},
+        ]
+        for payload in payloads:
+            for compression in ("none", "zlib", "lzma", "auto"):
+                body = encode_body(payload, compression)
+                self.assertTrue(is_encoded_body(body))
+                self.assertEqual(decode_body(body), payload)
+                self.assertEqual(encode_body(payload, compression), body)
+
+    def test_txids_are_stored_as_raw_bytes(self):
+        payload = self.journal("0b6f3a4e-8c1d-4f7a-9b2e-5d6c7e8f9a0b")
+        self.assertLess(len(encode_body(payload)), len(json.dumps(payload, separators=(",", ":"))) / 2)
+        self.assertFalse(is_encoded_body(json.dumps(payload).encode()))
+
+@override_settings(BLOCK_ENCODING="binary")
+class BinaryBodyTests(ChainMixin, TestCase):
+    def test_bodies_are_encoded_and_sized_in_bytes(self):
+        stored = self.blockchain.blocks.filter(height=2).values("data", "body", "size").get()
+        self.assertEqual(stored["data"], "")
+        self.assertTrue(is_encoded_body(stored["body"]))
+        # Sized before compression, like the mempool's block size limit.
+        self.assertEqual(stored["size"], len(encode_body(decode_body(stored["body"]))))
+        block = self.blockchain.blocks.get(height=2)
+        self.assertEqual(block.get_general_journal()["journal_id"], str(self.journal.id))
+        self.assertEqual(json.loads(block.data), block.get_general_journal())
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+
+    def test_json_blocks_stay_readable(self):
+        with override_settings(BLOCK_ENCODING="json"):
+            self.append()
+        stored = self.blockchain.blocks.filter(height=4).values("data", "body").get()
+        self.assertIsNone(stored["body"])
+        self.assertEqual(json.loads(stored["data"])["journal_id"], str(self.journal.id))
+        self.assertEqual(
+            [json.loads(data)["journal_id"] for _, data in self.blockchain.iter_chain(("height", "data"), 1)],
+            [str(self.journal.id)] * 4,
+        )
+        self.assertTrue(self.blockchain.validate_chain(full=True))
+
+class RemoteSyncTests(ChainMixin, LiveServerTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user("peer", password="secret")
+        ChainUser.objects.create(user=user, blockchain=self.blockchain)
+        self.node = RemoteNode(f"{self.live_server_url}/api/", "peer", "secret")
+
+    def test_header_first_sync_over_http(self):
+        local = Blockchain.objects.create(target=self.blockchain.target)
+        self.assertEqual(sync_from_remote(local, self.node), 4)
+        self.append()
+        self.assertEqual(sync_from_remote(local, self.node), 1)
+        self.assertEqual(local.get_tip(), self.blockchain.get_tip())
+        self.assertTrue(local.validate_chain(full=True))
+
+    def test_tampered_body_is_rejected(self):
+        local = Blockchain.objects.create(target=self.blockchain.target)
+        Block.objects.filter(blockchain=self.blockchain, height=2).update(data='{"transactions": [], "merkle_root": "00"}')
+        with self.assertRaises(VerificationError):
+            sync_from_remote(local, self.node)
+        self.assertFalse(local.blocks.exists())
+
+    def test_headers_breaking_the_retarget_rule_are_rejected(self):
+        local = Blockchain.objects.create(target=self.blockchain.target, retarget_enabled=True, retarget_window=2, block_interval=60)
+        # The peer never retargets, so its bits stay put where the local rule moves them.
+        with self.assertRaisesMessage(VerificationError, "does not follow the difficulty retarget rule"):
+            sync_from_remote(local, self.node)
+        self.assertFalse(local.blocks.exists())
+
+    def test_bootstrap_from_export(self):
+        local = Blockchain.objects.create(target=self.blockchain.target)
+        with self.node.export_stream() as stream:
+            import_chain(ChainFileReader(stream), local)
+        self.assertEqual(local.get_tip(), self.blockchain.get_tip())
+        self.assertTrue(local.validate_chain(full=True))
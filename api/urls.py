@@ -1,7 +1,9 @@
 from django.urls import path
 from .views import (
     UserSignupAPI, UserLoginAPI, UserLogoutAPI,
-    GeneralJournalAPI, TransactionAPI, TransactionLineAPI, AccountAPI,
+    GeneralJournalAPI, TransactionAPI, TransactionLineAPI, TransactionLineBatchAPI, AccountAPI, JournalImportAPI,
+    MineAPI, MiningJobAPI, HeadersAPI, MerkleProofAPI,
+    SyncHeadersAPI, SyncBlocksAPI, ChainExportAPI, ChainImportAPI,
 )
 
 urlpatterns = [
@@ -9,7 +11,17 @@ urlpatterns = [
     path('login/', UserLoginAPI.as_view(), name='login'),
     path('logout/', UserLogoutAPI.as_view(), name='logout'),
     path('journal/', GeneralJournalAPI.as_view(), name='general-journal_api'),
+    path('journal/import/', JournalImportAPI.as_view(), name='journal-import_api'),
     path('transaction/', TransactionAPI.as_view(), name='transaction_api'),
     path('transaction-line/', TransactionLineAPI.as_view(), name='transaction-line_api'),
+    path('transaction-line/batch/', TransactionLineBatchAPI.as_view(), name='transaction-line-batch_api'),
     path('account/', AccountAPI.as_view(), name='account_api'),
+    path('mine/', MineAPI.as_view(), name='mine_api'),
+    path('mining-job/', MiningJobAPI.as_view(), name='mining-job_api'),
+    path('headers/', HeadersAPI.as_view(), name='headers_api'),
+    path('merkle-proof/', MerkleProofAPI.as_view(), name='merkle-proof_api'),
+    path('sync/headers/', SyncHeadersAPI.as_view(), name='sync-headers_api'),
+    path('sync/blocks/', SyncBlocksAPI.as_view(), name='sync-blocks_api'),
+    path('sync/export/', ChainExportAPI.as_view(), name='sync-export_api'),
+    path('sync/import/', ChainImportAPI.as_view(), name='sync-import_api'),
 ]
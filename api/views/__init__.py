@@ -1,16 +1,28 @@
-from .accounting_views import GeneralJournalAPI, TransactionAPI, TransactionLineAPI, AccountAPI
-from .blockchain_views import MineAPI
+from .accounting_views import GeneralJournalAPI, TransactionAPI, TransactionLineAPI, TransactionLineBatchAPI, AccountAPI
+from .blockchain_views import MineAPI, MiningJobAPI, HeadersAPI, MerkleProofAPI
+from .sync_views import SyncHeadersAPI, SyncBlocksAPI, ChainExportAPI, ChainImportAPI
+from .import_views import JournalImportAPI
 from .utils_views import UserLoginAPI, UserLogoutAPI, UserSignupAPI
 
 __all__ = [
     "GeneralJournalAPI",
     "TransactionAPI",
     "TransactionLineAPI",
+    "TransactionLineBatchAPI",
     "AccountAPI",
+    "JournalImportAPI",
     
     "UserSignupAPI",
     "UserLoginAPI",
     "UserLogoutAPI",
     
     "MineAPI",
+    "MiningJobAPI",
+    "HeadersAPI",
+    "MerkleProofAPI",
+    
+    "SyncHeadersAPI",
+    "SyncBlocksAPI",
+    "ChainExportAPI",
+    "ChainImportAPI",
 ]
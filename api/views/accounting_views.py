@@ -2,15 +2,18 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated
 import json
 
+from django.db import transaction as db_transaction
 from django.shortcuts import get_object_or_404
 from ..models import GeneralJournal, Transaction, TransactionLine, Account
 from ..serializers import (
     GeneralJournalSerializer, TransactionSerializer, TransactionLineSerializer, AccountSerializer,
-    GeneralJournalFormSerializer, TransactionFormSerializer, TransactionLineFormSerializer, AccountFormSerializer
+    GeneralJournalFormSerializer, TransactionFormSerializer, TransactionLineFormSerializer, AccountFormSerializer,
+    TransactionLineBatchSerializer, MiningJobSerializer
 )
-from .blockchain_views import mine_block
+from .blockchain_views import enqueue_mining_job
 
 # Create your views here.
 
@@ -69,12 +72,8 @@ class GeneralJournalAPI(APIView):
                 blockchain = request.user.chain_user.blockchain
                 if not blockchain:
                     return Response({"error": "No blockchain associated with this user. Please create a blockchain first."}, status=400)
-                try:
-                    mine_block(blockchain, journal)
-                except ValueError as e:
-                    return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-                
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                job = enqueue_mining_job(blockchain, journal)
+                return Response({**serializer.data, "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -95,12 +94,8 @@ class GeneralJournalAPI(APIView):
                 blockchain = request.user.chain_user.blockchain
                 if not blockchain:
                     return Response({"error": "No blockchain associated with this user. Please create a blockchain first."}, status=400)
-                try:
-                    mine_block(blockchain, journal)
-                except ValueError as e:
-                    return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-                
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                job = enqueue_mining_job(blockchain, journal)
+                return Response({**serializer.data, "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -114,11 +109,8 @@ class GeneralJournalAPI(APIView):
             blockchain = request.user.chain_user.blockchain
             if not blockchain:
                 return Response({"error": "No blockchain associated with this user. Please create a blockchain first."}, status=400)
-            try:
-                mine_block(blockchain, journal)
-            except ValueError as e:
-                return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-            return Response({"message": "General Journal deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
+            job = enqueue_mining_job(blockchain, journal)
+            return Response({"message": "General Journal deleted successfully", "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
 class TransactionAPI(APIView):
@@ -164,12 +156,8 @@ class TransactionAPI(APIView):
                     if not blockchain:
                         return Response({"error": "No blockchain associated with this General Journal."}, status=400)
                     
-                    try:
-                        mine_block(blockchain, journal)
-                    except ValueError as e:
-                        return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-                    
-                    return Response(serializer.data, status=status.HTTP_201_CREATED)
+                    job = enqueue_mining_job(blockchain, journal)
+                    return Response({**serializer.data, "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             return Response({"error": "Transaction not found"}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"error": "Journal id is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -187,12 +175,8 @@ class TransactionAPI(APIView):
                 if not blockchain:
                     return Response({"error": "No blockchain associated with this General Journal."}, status=400)
                 
-                try:
-                    mine_block(blockchain, journal)
-                except ValueError as e:
-                    return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-                    
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                job = enqueue_mining_job(blockchain, journal)
+                return Response({**serializer.data, "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -210,12 +194,8 @@ class TransactionAPI(APIView):
                 if not blockchain:
                         return Response({"error": "No blockchain associated with this General Journal."}, status=400)
                 
-                try:
-                    mine_block(blockchain, journal)
-                except ValueError as e:
-                    return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-                
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                job = enqueue_mining_job(blockchain, journal)
+                return Response({**serializer.data, "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -230,12 +210,8 @@ class TransactionAPI(APIView):
             if not blockchain:
                 return Response({"error": "No blockchain associated with this General Journal."}, status=400)
             
-            try:
-                mine_block(blockchain, journal)
-            except ValueError as e:
-                return Response({"error": f"Failed to mine block: {str(e)}"}, status=400)
-            
-            return Response({"message": "Transaction deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
+            job = enqueue_mining_job(blockchain, journal)
+            return Response({"message": "Transaction deleted successfully", "mining_job": MiningJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
 class TransactionLineAPI(APIView):
@@ -298,6 +274,85 @@ class TransactionLineAPI(APIView):
             return Response({"message": "Transaction Line deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
         return Response({"error": "id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+class TransactionLineBatchAPI(APIView):
+    """
+    Applies a set of line operations to one transaction in a single request.
+
+    The operations run in one database transaction and the balance is
+    checked once, after the last of them, so the entry is never seen
+    unbalanced and a rejected batch leaves nothing behind. With
+    ``journal_id`` and a ``transaction`` object instead of
+    ``transaction_id``, the transaction is created in the same request.
+    """
+    permission_classes = [IsAuthenticated]
+    lookup_url_kwarg_journal = 'journal_id'
+    lookup_url_kwarg_transaction = 'transaction_id'
+
+    def post(self, request, format=None):
+        transaction_id = request.GET.get(self.lookup_url_kwarg_transaction)
+        journal_id = request.GET.get(self.lookup_url_kwarg_journal)
+        if not transaction_id and not journal_id:
+            return Response({"error": "transaction_id or journal_id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = TransactionLineBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user. Please create a blockchain first."}, status=400)
+
+        operations = serializer.validated_data['operations']
+        with db_transaction.atomic():
+            if transaction_id:
+                # Locking the transaction keeps concurrent batches on it from interleaving.
+                transaction = get_object_or_404(Transaction.objects.select_for_update(), id=transaction_id)
+            else:
+                journal = get_object_or_404(GeneralJournal, id=journal_id, is_deleted=False)
+                form = TransactionFormSerializer(data={**serializer.validated_data.get('transaction', {}), 'journal': journal.pk})
+                if not form.is_valid():
+                    return Response({"transaction": form.errors}, status=status.HTTP_400_BAD_REQUEST)
+                transaction = form.save()
+
+            # The lines share the transaction instance, so their saves keep its totals in step in memory.
+            lines = {line.pk: line for line in transaction.lines.filter(pk__in=[op['id'] for op in operations if 'id' in op])}
+            errors = [{} for _ in operations]
+            for operation, error in zip(operations, errors):
+                if operation['op'] == 'create':
+                    line = TransactionLine(transaction=transaction)
+                else:
+                    line = lines.get(operation['id'])
+                    if line is None:
+                        error['id'] = ["No line with this id in the transaction."]
+                        continue
+                if operation['op'] == 'delete':
+                    del lines[line.pk]
+                    line.delete()
+                    continue
+                for field in ('account', 'is_debit', 'value'):
+                    if field in operation:
+                        setattr(line, field, operation[field])
+                try:
+                    line.check_value(transaction.scale)
+                except ValueError as e:
+                    error['value'] = [str(e)]
+                    continue
+                line.save()
+                lines[line.pk] = line
+
+            if any(errors):
+                db_transaction.set_rollback(True)
+                return Response({"operations": errors}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                # The one balance check of the batch, done by Transaction.save on the stored totals.
+                transaction.save()
+            except ValueError as e:
+                db_transaction.set_rollback(True)
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            job = enqueue_mining_job(blockchain, transaction.journal)
+        return Response(
+            {**TransactionSerializer(transaction).data, "mining_job": MiningJobSerializer(job).data},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
 class AccountAPI(APIView):
     serializer_class = AccountSerializer
     lookup_url_kwarg = 'id'
@@ -1,7 +1,12 @@
-from django.db import transaction
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils import timezone
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,50 +14,315 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
 
-from ..models import BlockHeader, Block, Blockchain, ChainUser, GeneralJournal, Transaction, TransactionLine, Account
+from ..models import BlockHeader, Block, Blockchain, ChainUser, MiningJob, MempoolEntry, GeneralJournal, Transaction, TransactionLine, Account
 from ..serializers import *
-import json, time
+from ..mining.verify import header_bytes
+from .sync_views import sync_from_chain
+import json, threading, time
 
 # Create your views here.
-def mine_block(blockchain: Blockchain, journal: GeneralJournal) -> Block:
+def new_block(blockchain: Blockchain) -> Block:
     """
-    Mines a new block for the given blockchain using the provided general journal.
+    Creates an unsaved block on top of the current tip of the blockchain.
 
     Args:
         blockchain (Blockchain): The blockchain to which the block will be added.
-        journal (GeneralJournal): The general journal whose transactions will be included in the block.
 
     Returns:
-        Block: The mined block.
+        Block: A block whose header links to the tip and carries the bits required by the retarget rule.
     """
-    # blockchain.target="0ffff00000000000000000000000000000000000000000000000000000000000"
-    # blockchain.save()
-    t_0 = time.time()
-    if not journal.transactions:
-        raise ValueError("The GeneralJournal must contain at least one transaction.")
-    
-    full_target = int(blockchain.target, 16).to_bytes(32, byteorder="big")
     block_header = BlockHeader()
     
-    previous_block = blockchain.blocks.last()
-    if previous_block:
-        block_header.previous_hash = previous_block.header.block_hash
-    block_header.bits = BlockHeader.target_to_bits(full_target)
-    block_header.save()
+    tip_height, tip_hash = blockchain.get_tip()
+    if tip_hash:
+        block_header.previous_hash = tip_hash
+    block_header.bits = blockchain.next_bits()
 
-    new_block = Block(
+    return Block(
         blockchain=blockchain,
-        height=(previous_block.height + 1 if previous_block else 0),
+        height=(tip_height + 1 if tip_height is not None else 0),
         header=block_header
     )
-    new_block.set_general_journal(journal)
-    new_block.header.mine(blockchain.target)
-    new_block.save()
+
+def mine_header(blockchain: Blockchain, block: Block, backend: str = None) -> Block:
+    """
+    Mines the block's header against the target encoded in its bits and stores the block.
+
+    On a proof-of-authority chain the header is sealed with an authority key
+    instead. When the block retargets the chain, the new target is kept on the
+    blockchain.
+
+    Args:
+        blockchain (Blockchain): The blockchain to which the block will be added.
+        block (Block): The unsaved block, with its data and Merkle Root set.
+        backend (str): Proof-of-work backend, ``MINING_BACKEND`` when omitted.
+
+    Returns:
+        Block: The mined block, with the MiningResult attached as ``mining_result``.
+    """
+    if blockchain.consensus == 'poa':
+        sealer = blockchain.sealer()
+        if sealer is None:
+            raise ValueError("No authority key is available to seal blocks on this blockchain.")
+        block.mining_result = block.header.seal(sealer)
+        block.save()
+        return block
+    
+    target = block.header.bits_to_target(block.header.bits).hex()
+    block.mining_result = block.header.mine(target, backend=backend)
+    block.save()
+    if blockchain.retarget_enabled and blockchain.target != target:
+        blockchain.target = target
+        blockchain.save(update_fields=['target'])
+    return block
+
+def mine_block(blockchain: Blockchain, journal: GeneralJournal, backend: str = None) -> Block:
+    """
+    Mines a new block for the given blockchain using the provided general journal.
+
+    Args:
+        blockchain (Blockchain): The blockchain to which the block will be added.
+        journal (GeneralJournal): The general journal whose transactions will be included in the block.
+        backend (str): Proof-of-work backend, ``MINING_BACKEND`` when omitted.
+
+    Returns:
+        Block: The mined block.
+    """
+    t_0 = time.time()
+    block = new_block(blockchain)
+    # Nothing is written until the header is mined, so no row ever holds an unmined hash.
+    block.set_general_journal(journal, commit=False)
+    mine_header(blockchain, block, backend)
     t_1 = time.time()
     dt = t_1 - t_0
     print(dt)
     
-    return new_block
+    return block
+
+def build_block_template(blockchain: Blockchain, max_journals: int = None, max_size: int = None) -> tuple[Block | None, dict]:
+    """
+    Packs pending journal changes from the mempool into one unmined block.
+
+    Journals are taken oldest first until ``max_journals`` or ``max_size`` bytes of
+    block data is reached, counted before compression like ``Block.size``. The
+    first journal always fits, so one oversized change cannot stall the mempool.
+    Each journal is read in its latest state, so any number of edits since it
+    entered the mempool cost a single entry.
+
+    Args:
+        blockchain (Blockchain): The blockchain to which the block will be added.
+        max_journals (int): Journal limit, ``MEMPOOL_MAX_BLOCK_JOURNALS`` when omitted.
+        max_size (int): Data size limit, ``MEMPOOL_MAX_BLOCK_SIZE`` when omitted.
+
+    Returns:
+        tuple: The block (None when nothing is pending) and the versions of the
+        mempool entries it includes, keyed by entry id.
+    """
+    max_journals = max_journals or getattr(settings, 'MEMPOOL_MAX_BLOCK_JOURNALS', 100)
+    max_size = max_size or getattr(settings, 'MEMPOOL_MAX_BLOCK_SIZE', 1_000_000)
+
+    payloads, included, size = [], {}, 0
+    for entry in blockchain.mempool.select_related('journal').order_by('created_at')[:max_journals]:
+        try:
+            payload = blockchain.delta_payload(Block.journal_payload(entry.journal))
+        except ValueError:
+            # The journal was emptied, there is nothing left to commit for it.
+            entry.delete()
+            continue
+        payload_size = Block.payload_size(payload)
+        if included and size + payload_size > max_size:
+            break
+        payloads.append(payload)
+        included[entry.id] = entry.version
+        size += payload_size
+
+    if not payloads:
+        return None, included
+    block = new_block(blockchain)
+    block.set_journal_payloads(payloads, commit=False)
+    return block, included
+
+def mine_mempool_block(blockchain: Blockchain, backend: str = None) -> Block | None:
+    """
+    Mines one block out of the pending journals of the blockchain.
+
+    Entries are removed from the mempool once committed, unless the journal was
+    edited again while the block was being mined.
+
+    Args:
+        blockchain (Blockchain): The blockchain to which the block will be added.
+        backend (str): Proof-of-work backend, ``MINING_BACKEND`` when omitted.
+
+    Returns:
+        Block: The mined block, or None when the mempool is empty.
+    """
+    block, included = build_block_template(blockchain)
+    if block is None:
+        return None
+    mine_header(blockchain, block, backend)
+    for entry_id, version in included.items():
+        MempoolEntry.objects.filter(id=entry_id, version=version).delete()
+    return block
+
+_mining_executor = None
+_mining_executor_lock = threading.Lock()
+
+def mining_executor() -> ThreadPoolExecutor:
+    """The threads that run mining jobs, started on first use rather than when the module is imported."""
+    global _mining_executor
+    with _mining_executor_lock:
+        if _mining_executor is None:
+            _mining_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MINING_JOB_WORKERS', 2), thread_name_prefix="mining"
+            )
+    return _mining_executor
+
+def shutdown_mining_executor():
+    """Wait for the jobs handed to the worker threads and stop them; a later job starts new ones."""
+    global _mining_executor
+    with _mining_executor_lock:
+        executor, _mining_executor = _mining_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def enqueue_mining_job(blockchain: Blockchain, journal: GeneralJournal) -> MiningJob:
+    """
+    Adds the journal to the mempool and returns the job that will commit it.
+
+    Edits made while a job is still queued join that job, so a burst of edits
+    costs one proof-of-work. The job is handed to the worker pool only once the
+    surrounding transaction commits, so the worker always sees the journal
+    changes of the request.
+
+    Args:
+        blockchain (Blockchain): The blockchain to which the block will be added.
+        journal (GeneralJournal): The general journal whose transactions will be included in the block.
+
+    Returns:
+        MiningJob: The queued job, to be polled through MiningJobAPI.
+    """
+    entry, created = MempoolEntry.objects.get_or_create(blockchain=blockchain, journal=journal)
+    if not created:
+        MempoolEntry.objects.filter(id=entry.id).update(version=F('version') + 1, updated_at=timezone.now())
+
+    job, created = queued_job(blockchain.id)
+    if created:
+        transaction.on_commit(lambda: mining_executor().submit(run_mining_job, job.id))
+    else:
+        # The queued job may have packed its block before this request committed.
+        transaction.on_commit(lambda: schedule_mempool(blockchain.id))
+    return job
+
+def queued_job(blockchain_id) -> tuple[MiningJob, bool]:
+    """
+    The chain's queued mining job, created when there is none.
+
+    At most one job per chain can be queued (see ``MiningJob.Meta``), so of
+    two requests racing to create one, the loser picks up the winner's.
+
+    Returns:
+        tuple: The job and whether it was created.
+    """
+    while True:
+        job = MiningJob.objects.filter(blockchain_id=blockchain_id, status='queued').first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                return MiningJob.objects.create(blockchain_id=blockchain_id), True
+        except IntegrityError:
+            continue
+
+def schedule_mempool(blockchain_id):
+    """Queues a job for pending journals unless a queued or running job will pick them up."""
+    if (
+        MempoolEntry.objects.filter(blockchain_id=blockchain_id).exists()
+        and not MiningJob.objects.filter(blockchain_id=blockchain_id, status='running').exists()
+    ):
+        job, created = queued_job(blockchain_id)
+        if created:
+            mining_executor().submit(run_mining_job, job.id)
+
+def recover_mining_jobs(stale_after: float | None = None) -> tuple[int, int]:
+    """
+    Requeue or fail the mining jobs a stopped process left behind.
+
+    Jobs only live in the worker pool of the process that queued them, so
+    after a restart their rows stay ``queued`` or ``running`` for good, and
+    later edits would keep joining a queued job that never runs. Running
+    jobs started more than ``stale_after`` seconds ago are failed; their
+    journals are still in the mempool and get a new job. Queued jobs created
+    before then are handed to this process's pool again.
+
+    Args:
+        stale_after (float): Age in seconds past which a job counts as abandoned, ``MINING_JOB_STALE_AFTER`` when omitted.
+
+    Returns:
+        tuple: The number of jobs requeued and failed.
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'MINING_JOB_STALE_AFTER', 3600)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    failed = MiningJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='failed', error="Interrupted before the block was mined.", finished_at=timezone.now()
+    )
+    requeued = list(MiningJob.objects.filter(status='queued', created_at__lt=cutoff).values_list('id', flat=True))
+    for job_id in requeued:
+        mining_executor().submit(run_mining_job, job_id)
+    for blockchain_id in MempoolEntry.objects.values_list('blockchain_id', flat=True).distinct():
+        schedule_mempool(blockchain_id)
+    return len(requeued), failed
+
+def run_mining_job(job_id):
+    """Mines the block of a queued job and records the outcome on the job row."""
+    try:
+        if MiningJob.objects.filter(id=job_id, status='queued').update(status='running', started_at=timezone.now()):
+            _mine_job(job_id)
+
+            # Edits that were committed after the job packed its block need a job of their own.
+            job = MiningJob.objects.get(id=job_id)
+            if job.status == 'mined':
+                schedule_mempool(job.blockchain_id)
+    finally:
+        connection.close()
+
+def _mine_job(job_id):
+    job = MiningJob.objects.get(id=job_id)
+    t_0 = time.time()
+    try:
+        with transaction.atomic():
+            # Jobs of the same chain take turns so each one builds on the previous tip. The lock is
+            # FOR NO KEY UPDATE: a plain FOR UPDATE would also hold back every insert referencing the
+            # chain, mempool entries and queued jobs included, until the block is mined.
+            blockchain = Blockchain.objects.select_for_update(no_key=True).get(id=job.blockchain_id)
+            block = mine_mempool_block(blockchain)
+            if block is None:
+                raise ValueError("No pending journal changes to mine.")
+    except Exception as e:
+        MiningJob.objects.filter(id=job_id).update(
+            status='failed', error=str(e), mining_time=time.time() - t_0, finished_at=timezone.now()
+        )
+        return
+    MiningJob.objects.filter(id=job_id).update(
+        status='mined', block=block, block_hash=block.header.block_hash,
+        journal_count=len(block.get_general_journals()), mining_time=time.time() - t_0,
+        attempts=block.mining_result.attempts, hashrate=block.mining_result.hashrate,
+        finished_at=timezone.now()
+    )
+
+class MiningJobAPI(APIView):
+    permission_classes = [IsAuthenticated]
+    lookup_url_kwarg = 'id'
+
+    def get(self, request, format=None):
+        blockchain = request.user.chain_user.blockchain
+        jobs = MiningJob.objects.filter(blockchain=blockchain).select_related('block')
+        job_id = request.GET.get(self.lookup_url_kwarg)
+        if job_id:
+            job = get_object_or_404(jobs, id=job_id)
+            return Response(MiningJobSerializer(job).data, status=status.HTTP_200_OK)
+        serializer = MiningJobSerializer(jobs.order_by('-created_at'), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 class MineAPI(APIView):
     permission_classes = [IsAuthenticated]
@@ -74,28 +344,94 @@ class MineAPI(APIView):
                 status=400
             )
 
+        job = enqueue_mining_job(blockchain, journal)
+        return Response({
+            "message": "Journal queued for mining.",
+            "mining_job": MiningJobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+MAX_HEADERS = 2000
+
+def header_chain(blockchain: Blockchain, start: int, count: int | None = None) -> list[str]:
+    """
+    Serialized 80-byte headers of the chain from ``start`` upward, in height order.
+
+    Args:
+        blockchain (Blockchain): The chain to read.
+        start (int): Height of the first header.
+        count (int): Maximum number of headers, up to the tip when None.
+
+    Returns:
+        list[str]: The headers in hex.
+    """
+    rows = blockchain.iter_headers(
+        ("version", "previous_hash", "merkle_root", "timestamp", "bits", "nonce", "raw"),
+        start, start + count if count is not None else None,
+    )
+    return [(raw or header_bytes(*fields)).hex() for *fields, raw in rows]
+
+class HeadersAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user."}, status=400)
         try:
-            new_block = mine_block(blockchain, journal)
-        except ValueError as e:
-            return Response({"error": str(e)}, status=400)
+            start = int(request.GET.get('from', 0))
+            count = min(int(request.GET.get('count', MAX_HEADERS)), MAX_HEADERS)
+        except ValueError:
+            return Response({"error": "from and count must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "consensus": blockchain.consensus,
+            "start_height": start,
+            "headers": header_chain(blockchain, start, count),
+        }, status=status.HTTP_200_OK)
+
+class MerkleProofAPI(APIView):
+    permission_classes = [IsAuthenticated]
+    lookup_url_kwarg = 'txid'
 
+    def get(self, request, format=None):
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user."}, status=400)
+        txid = request.GET.get(self.lookup_url_kwarg)
+        if not txid:
+            return Response({"error": "txid parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The latest block holds the journal's current state of the transaction.
+        block = (
+            Block.objects.filter(blockchain=blockchain, txids__txid=txid)
+            .select_related('header').order_by('-height').first()
+        )
+        if block is None:
+            return Response({"error": "Transaction is not committed to the chain."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Like headers/, one page at most; the client asks headers/ for the rest from tip_height + 1.
+        headers = header_chain(blockchain, block.height, MAX_HEADERS)
         return Response({
-            "message": "Block mined successfully.",
-            "block": {
-                "height": new_block.height,
-                "hash": new_block.header.block_hash,
-                "nonce": new_block.header.nonce,
-                "merkle_root": new_block.header.merkle_root,
-                "data": json.loads(new_block.data)
-            }
-        }, status=201)
+            "txid": txid,
+            "consensus": blockchain.consensus,
+            "height": block.height,
+            "block_hash": block.header.block_hash,
+            "merkle_root": block.header.merkle_root,
+            "branch": block.merkle_proof(txid),
+            "headers": headers,
+            "tip_height": block.height + len(headers) - 1,
+            "chain_tip_height": blockchain.get_tip()[0],
+        }, status=status.HTTP_200_OK)
 
 class ValidateChainAPI(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, blockchain_id):
         blockchain = get_object_or_404(Blockchain, pk=blockchain_id)
-        is_valid = blockchain.validate_chain()
+        # ?full=1 ignores the validated-tip checkpoint and checks every block again.
+        try:
+            is_valid = blockchain.validate_chain(full=request.GET.get('full') in ('1', 'true'))
+        except ValueError as e:
+            return Response({"message": "Blockchain is invalid.", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         if is_valid:
             return Response({"message": "Blockchain is valid."}, status=status.HTTP_200_OK)
@@ -106,17 +442,25 @@ class ConsensusAPI(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        user_blockchain = get_object_or_404(Blockchain, user=request.user)
-        all_blockchains = Blockchain.objects.all()
-        longest_chain = None
-        max_length = 0
+        user_blockchain = request.user.chain_user.blockchain
+        if not user_blockchain:
+            return Response({"error": "No blockchain associated with this user."}, status=400)
+        # Chains are only comparable within the same consensus mode.
+        all_blockchains = Blockchain.objects.filter(consensus=user_blockchain.consensus)
+        for stale in all_blockchains.filter(chain_work__isnull=True):
+            stale.refresh_tip()
         
-        for blockchain in all_blockchains:
-            if blockchain.validate_chain():
-                chain_length = blockchain.blocks.count()
-                if chain_length > max_length:
-                    max_length = chain_length
-                    longest_chain = blockchain
+        # Fork choice: the valid chain with the most cumulative work, ties going to the user's chain.
+        longest_chain = None
+        for blockchain in all_blockchains.order_by('-chain_work'):
+            if longest_chain and blockchain.chain_work < longest_chain.chain_work:
+                break
+            try:
+                blockchain.validate_chain()
+            except ValueError:
+                continue
+            if longest_chain is None or blockchain == user_blockchain:
+                longest_chain = blockchain
         
         if not longest_chain:
             return Response(
@@ -125,28 +469,20 @@ class ConsensusAPI(APIView):
             )
         
         if user_blockchain != longest_chain:
-            with transaction.atomic():
-                user_blockchain.blocks.all().delete()
-                for block in longest_chain.blocks.all():
-                    Block.objects.create(
-                        blockchain=user_blockchain,
-                        height=block.height,
-                        header=block.header,
-                        data=block.data,
-                        timestamp=block.timestamp,
-                        size=block.size,
-                    )
+            copied = sync_from_chain(user_blockchain, longest_chain)
             
             return Response(
                 {
-                    "message": "Blockchain updated to the longest chain.",
+                    "message": "Blockchain updated to the chain with the most work.",
                     "longest_chain_id": longest_chain.id,
-                    "block_count": max_length,
+                    "block_count": longest_chain.tip_height + 1,
+                    "blocks_copied": copied,
+                    "chain_work": str(longest_chain.chain_work),
                 },
                 status=status.HTTP_200_OK,
             )
         
         return Response(
-            {"message": "Your blockchain is already the longest chain."},
+            {"message": "Your blockchain already has the most work."},
             status=status.HTTP_200_OK,
         )
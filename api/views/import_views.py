@@ -0,0 +1,271 @@
+import csv, json
+from decimal import Decimal
+from io import BytesIO
+
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from rest_framework import serializers, status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+
+from ..models import Account, GeneralJournal, Transaction, TransactionLine
+from ..models.accounting_models import shift_amounts
+from ..serializers import AmountField, MiningJobSerializer
+from .blockchain_views import enqueue_mining_job
+
+# Transactions validated before they are written with bulk_create.
+IMPORT_BATCH_SIZE = 2000
+# An import stops reading once this many rows have been rejected.
+MAX_IMPORT_ERRORS = 100
+CSV_IMPORT_COLUMNS = ("transaction", "date", "description", "account", "is_debit", "value")
+DATE_FIELD = serializers.DateTimeField()
+IS_DEBIT_FIELD = serializers.BooleanField()
+VALUE_FIELD = AmountField()
+
+def read_ndjson(stream):
+    """
+    Entries of an NDJSON import, one transaction object per line with its lines nested under ``lines``.
+
+    Numbers are read as Decimals, so amounts may be sent as JSON numbers or strings.
+    """
+    for row, raw in enumerate(stream, 1):
+        if not raw.strip():
+            continue
+        try:
+            fields = json.loads(raw, parse_float=Decimal)
+        except ValueError as e:
+            yield {"row": row, "lines": [], "errors": {"non_field_errors": [f"Invalid JSON: {e}"]}}
+            continue
+        if not isinstance(fields, dict) or not isinstance(fields.get("lines"), list):
+            yield {"row": row, "lines": [], "errors": {"non_field_errors": ["Expected an object with a list of lines."]}}
+            continue
+        yield {
+            "row": row,
+            "date": fields.get("date"),
+            "description": fields.get("description"),
+            "lines": [({"row": row, "line": index}, line) for index, line in enumerate(fields["lines"])],
+        }
+
+def read_csv(stream):
+    """
+    Entries of a CSV import, one row per transaction line under a ``CSV_IMPORT_COLUMNS`` header.
+
+    Consecutive rows with the same ``transaction`` key form one transaction,
+    its date and description are taken from the first of them.
+    """
+    rows = csv.DictReader(line.decode('utf-8') for line in stream)
+    missing = [column for column in CSV_IMPORT_COLUMNS if column not in (rows.fieldnames or ())]
+    if missing:
+        yield {"row": 1, "lines": [], "errors": {"non_field_errors": [f"Missing columns: {', '.join(missing)}."]}}
+        return
+    entry, seen = None, set()
+    for fields in rows:
+        key = fields["transaction"]
+        if entry is None or key != entry["key"]:
+            if entry is not None:
+                yield entry
+            entry = {"row": rows.line_num, "key": key, "date": fields["date"], "description": fields["description"] or None, "lines": []}
+            if key in seen:
+                entry["errors"] = {"transaction": ["The rows of a transaction must be consecutive."]}
+            seen.add(key)
+        entry["lines"].append(({"row": rows.line_num}, fields))
+    if entry is not None:
+        yield entry
+
+IMPORT_READERS = {
+    "text/csv": read_csv,
+    "application/x-ndjson": read_ndjson,
+}
+
+def clean(field: serializers.Field, value, errors: dict, name: str):
+    """Run a serializer field's validation, recording its messages under ``name`` instead of raising."""
+    try:
+        return field.run_validation(value)
+    except serializers.ValidationError as e:
+        errors[name] = e.detail
+
+def build_transaction(journal: GeneralJournal, entry: dict, accounts: dict) -> tuple[Transaction | None, list, list]:
+    """
+    Check one imported transaction in a single pass and make its unsaved rows.
+
+    Args:
+        journal (GeneralJournal): The journal being imported into.
+        entry (dict): A transaction from ``read_csv`` or ``read_ndjson``.
+        accounts (dict): Account primary keys by id string and by ref.
+
+    Returns:
+        tuple: ``(transaction, lines, errors)``. ``errors`` holds one
+        ``{"row", "errors"}`` item per rejected row and is empty when the
+        transaction can be written.
+    """
+    if "errors" in entry:
+        return None, [], [{"row": entry["row"], "errors": entry["errors"]}]
+    scale = journal.scale
+    transaction_errors, errors = {}, []
+    date = clean(DATE_FIELD, entry["date"], transaction_errors, "date")
+    description = entry["description"]
+    tx = Transaction(
+        journal=journal, date=date, description=str(description) if description is not None else None, amount_scale=scale,
+    )
+
+    lines, totals = [], {True: Decimal(0), False: Decimal(0)}
+    for location, fields in entry["lines"]:
+        line_errors = {}
+        if not isinstance(fields, dict):
+            errors.append({**location, "errors": {"non_field_errors": ["Expected an object."]}})
+            continue
+        account = accounts.get(str(fields.get("account")))
+        if account is None:
+            line_errors["account"] = [f"Unknown account {fields.get('account')!r}."]
+        is_debit = clean(IS_DEBIT_FIELD, fields.get("is_debit"), line_errors, "is_debit")
+        value = clean(VALUE_FIELD, fields.get("value"), line_errors, "value")
+        line = TransactionLine(transaction_id=tx.pk, account_id=account, is_debit=is_debit, value=value, amount_scale=scale)
+        if "value" not in line_errors:
+            if value <= 0:
+                line_errors["value"] = ["Ensure this value is greater than 0."]
+            else:
+                try:
+                    line.check_value(scale)
+                except ValueError as e:
+                    line_errors["value"] = [str(e)]
+        if line_errors:
+            errors.append({**location, "errors": line_errors})
+            continue
+        totals[is_debit] += value
+        lines.append(line)
+
+    if not errors and not transaction_errors:
+        if not lines:
+            transaction_errors["lines"] = ["A transaction needs at least one line."]
+        elif totals[True] != totals[False]:
+            transaction_errors["non_field_errors"] = [
+                f"Transaction is not balanced: debits {totals[True]} and credits {totals[False]} do not match."
+            ]
+    if transaction_errors:
+        errors.insert(0, {"row": entry["row"], "errors": transaction_errors})
+    if errors:
+        return None, [], errors
+
+    tx.debit_total = tx.total = totals[True]
+    tx.credit_total = totals[False]
+    tx.txid = tx.default_txid()
+    return tx, lines, []
+
+def write_batch(journal: GeneralJournal, batch: list) -> list:
+    """
+    Append a batch of checked transactions to the journal's Merkle tree and bulk insert them with their lines.
+
+    Returns:
+        list: Errors for transactions whose txid is already taken, nothing is written then.
+    """
+    existing = set(Transaction.objects.filter(txid__in=[tx.txid for _, tx, _ in batch]).values_list("txid", flat=True))
+    if existing:
+        return [
+            {"row": row, "errors": {"txid": ["A transaction with the same date, description and journal already exists."]}}
+            for row, tx, _ in batch if tx.txid in existing
+        ]
+    first = journal.merkle_tree.extend([tx.txid for _, tx, _ in batch])
+    for offset, (_, tx, _) in enumerate(batch):
+        tx.merkle_index = first + offset
+    Transaction.objects.bulk_create([tx for _, tx, _ in batch])
+    TransactionLine.objects.bulk_create([line for _, _, lines in batch for line in lines])
+    return []
+
+def import_journal(journal: GeneralJournal, entries, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Add the transactions read from an import to a journal, all of them or none.
+
+    Every transaction is checked as it is read, including its balance, and
+    the checked ones are written ``batch_size`` at a time with bulk_create.
+    The journal's totals are moved once at the end. After the first rejected
+    row nothing more is written, but reading goes on so the client gets every
+    error, up to ``MAX_IMPORT_ERRORS``, in one response; then the whole import
+    is rolled back.
+
+    Args:
+        journal (GeneralJournal): The journal to import into.
+        entries: Transactions from ``read_csv`` or ``read_ndjson``.
+        batch_size (int): Transactions per bulk insert.
+
+    Returns:
+        dict: ``transactions`` and ``lines`` written, and the ``errors`` per row.
+    """
+    accounts = {}
+    for pk, ref in Account.objects.values_list("pk", "ref"):
+        accounts[str(pk)] = pk
+        if ref:
+            accounts[ref] = pk
+    errors, batch, txids = [], [], set()
+    counts = {"transactions": 0, "lines": 0}
+    totals = {True: Decimal(0), False: Decimal(0)}
+
+    with transaction.atomic():
+        for entry in entries:
+            tx, lines, entry_errors = build_transaction(journal, entry, accounts)
+            if tx is not None and tx.txid in txids:
+                entry_errors = [{"row": entry["row"], "errors": {"txid": ["The import has another transaction with the same date and description."]}}]
+            if entry_errors:
+                errors.extend(entry_errors)
+                if len(errors) >= MAX_IMPORT_ERRORS:
+                    break
+                continue
+            txids.add(tx.txid)
+            if errors:
+                continue
+            batch.append((entry["row"], tx, lines))
+            counts["transactions"] += 1
+            counts["lines"] += len(lines)
+            totals[True] += tx.debit_total
+            totals[False] += tx.credit_total
+            if len(batch) >= batch_size:
+                errors.extend(write_batch(journal, batch))
+                batch = []
+        if batch and not errors:
+            errors.extend(write_batch(journal, batch))
+
+        if errors:
+            transaction.set_rollback(True)
+            return {"transactions": 0, "lines": 0, "errors": errors[:MAX_IMPORT_ERRORS]}
+        GeneralJournal.objects.filter(pk=journal.pk).update(
+            **shift_amounts(("debit_total", "balance"), totals[True], journal.scale),
+            **shift_amounts(("credit_total",), totals[False], journal.scale),
+        )
+    return {**counts, "errors": []}
+
+class JournalImportAPI(APIView):
+    permission_classes = [IsAuthenticated]
+    lookup_url_kwarg_journal = 'journal_id'
+
+    def post(self, request, format=None):
+        journal_id = request.GET.get(self.lookup_url_kwarg_journal)
+        if not journal_id:
+            return Response({"error": "Journal id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        journal = get_object_or_404(GeneralJournal, id=journal_id, is_deleted=False)
+        reader = IMPORT_READERS.get(request.content_type.split(';')[0].strip())
+        if reader is None:
+            return Response(
+                {"error": f"Send the journal as one of: {', '.join(IMPORT_READERS)}."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user. Please create a blockchain first."}, status=400)
+
+        # The rows are read straight from the request body, so large imports are never held in memory whole.
+        with transaction.atomic():
+            try:
+                imported = import_journal(journal, reader(request.stream or BytesIO()))
+            except (UnicodeDecodeError, csv.Error) as e:
+                return Response({"error": f"The import could not be read: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+            if imported["errors"]:
+                return Response({"errors": imported["errors"]}, status=status.HTTP_400_BAD_REQUEST)
+            # The whole import joins one mining job, so it is committed by a single block.
+            job = enqueue_mining_job(blockchain, journal)
+        return Response({
+            "journal": str(journal.pk),
+            "transactions": imported["transactions"],
+            "lines": imported["lines"],
+            "mining_job": MiningJobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
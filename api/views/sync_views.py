@@ -0,0 +1,399 @@
+import base64, json
+from collections import deque
+from itertools import islice
+from urllib.parse import urlencode, urljoin
+from urllib.request import Request, urlopen
+
+from django.db import transaction
+from django.http import StreamingHttpResponse
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+
+from ..blockstore import ChainFileError, ChainFileReader, block_record, chain_preamble, chain_trailer, is_encoded_body
+from ..light_client import Header, VerificationError, verify_header_chain
+from ..mining.verify import header_bytes
+from ..models import Block, BlockHeader, Blockchain, ChainUser
+from ..models.utils import natural_byte_order_to_str, verify_signature, str_to_natural_byte_order
+
+MAX_SYNC_HEADERS = 2000
+MAX_SYNC_BLOCKS = 500
+SYNC_HEADER_FIELDS = ("height", "version", "previous_hash", "merkle_root", "timestamp", "bits", "nonce", "raw", "signer", "signature")
+GENESIS_PREVIOUS_HASH = natural_byte_order_to_str(b'\x00' * 32)
+# Bytes of block records gathered before the export stream yields them.
+EXPORT_BUFFER_SIZE = 64 * 1024
+EXPORT_FIELDS = (
+    "header_id", "header__version", "header__previous_hash", "header__merkle_root", "header__timestamp",
+    "header__bits", "header__nonce", "header__raw", "header__signer", "header__signature",
+)
+CHAIN_PARAM_FIELDS = ("target", "consensus", "retarget_enabled", "retarget_height", "block_interval", "retarget_window", "retarget_max_step")
+
+def shared_height(blockchain: Blockchain, fork_height: int, incoming) -> int:
+    """
+    Move a locator fork point up past the blocks both chains already share.
+
+    Locators thin out exponentially, so the fork they find can sit a little
+    below the real one; comparing hashes upward closes that gap.
+
+    Args:
+        blockchain (Blockchain): The local chain.
+        fork_height (int): Fork point found from the locator.
+        incoming: ``(height, hash)`` pairs of the peer above ``fork_height``.
+    """
+    for (height, local_hash), (_, peer_hash) in zip(blockchain.iter_headers(("height", "block_hash"), fork_height + 1), incoming):
+        if local_hash != peer_hash:
+            break
+        fork_height = height
+    return fork_height
+
+def sync_from_chain(blockchain: Blockchain, source: Blockchain) -> int:
+    """
+    Bring ``blockchain`` onto ``source`` when the source has more work, copying only the missing suffix.
+
+    Both chains live in this database, so header rows are shared rather than
+    copied and only Block rows above the common ancestor are written.
+
+    Returns:
+        int: Number of blocks copied.
+    """
+    if source.get_chain_work() <= blockchain.get_chain_work():
+        return 0
+    fork = source.find_fork(blockchain.block_locator())
+    fork_height = fork[0] if fork else -1
+    fork_height = shared_height(blockchain, fork_height, source.iter_headers(("height", "block_hash"), fork_height + 1))
+
+    blocks = (
+        Block(id=f"{blockchain.id}-{header_id}", blockchain=blockchain, height=height, header_id=header_id, data=data, size=size)
+        for height, header_id, data, size in source.iter_chain(("height", "header_id", "data", "size"), fork_height + 1)
+    )
+    tip_height, tip_hash = source.get_tip()
+    return blockchain.reorganize(fork_height, blocks, tip_height, tip_hash, source.get_chain_work())
+
+class RemoteNode:
+    """A peer node's sync endpoints, reached over HTTP with basic authentication."""
+
+    def __init__(self, base_url: str, username: str | None = None, password: str | None = None, timeout: int = 30):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        if username is not None:
+            token = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+            self.headers["Authorization"] = f"Basic {token}"
+
+    def _request(self, path: str, params: dict | None = None, payload: dict | None = None) -> dict:
+        url = urljoin(self.base_url, path)
+        if params:
+            url += "?" + urlencode(params)
+        data = json.dumps(payload).encode() if payload is not None else None
+        with urlopen(Request(url, data=data, headers=self.headers), timeout=self.timeout) as response:
+            return json.load(response)
+
+    def get_headers(self, locator: list[str], count: int = MAX_SYNC_HEADERS) -> dict:
+        return self._request("sync/headers/", payload={"locator": locator, "count": count})
+
+    def get_blocks(self, start: int, count: int = MAX_SYNC_BLOCKS) -> list[dict]:
+        return self._request("sync/blocks/", params={"from": start, "count": count})["blocks"]
+
+    def export_stream(self):
+        """The peer's whole chain as a chain file, an open response to read from and close."""
+        # Errors still come back as JSON.
+        headers = {**self.headers, "Accept": "application/octet-stream, application/json"}
+        return urlopen(Request(urljoin(self.base_url, "sync/export/"), headers=headers), timeout=self.timeout)
+
+def sync_from_remote(blockchain: Blockchain, node: RemoteNode) -> int:
+    """
+    Header-first sync of ``blockchain`` from a peer node.
+
+    The locator finds the common ancestor, then only the headers above it are
+    downloaded and checked for linkage, proof-of-work and the retarget rule
+    or authority seals, and total work. Bodies are fetched only if the peer's branch has more work,
+    and each one must match its header's Merkle Root before the suffix is
+    swapped in one transaction.
+
+    Returns:
+        int: Number of blocks written.
+
+    Raises:
+        VerificationError: When the peer's headers or bodies do not check out.
+    """
+    response = node.get_headers(blockchain.block_locator())
+    fork_height = response["fork_height"]
+    rows = response["headers"]
+    while rows and rows[-1]["height"] < response["tip_height"]:
+        page = node.get_headers([Header.parse(rows[-1]["header"]).block_hash])["headers"]
+        if not page:
+            break
+        rows.extend(page)
+
+    headers = [Header.parse(row["header"]) for row in rows]
+    shared = shared_height(blockchain, fork_height, ((row["height"], header.block_hash) for row, header in zip(rows, headers)))
+    rows, headers = rows[shared - fork_height:], headers[shared - fork_height:]
+    fork_height = shared
+    if not headers:
+        return 0
+
+    fork_hash = blockchain.blocks.filter(height=fork_height).values_list('header_id', flat=True).first() if fork_height >= 0 else GENESIS_PREVIOUS_HASH
+    if headers[0].previous_hash != fork_hash:
+        raise VerificationError(f"Header {rows[0]['height']} does not link to the common ancestor.")
+    verify_header_chain([row["header"] for row in rows], check_work=blockchain.consensus == 'pow')
+    if blockchain.consensus == 'poa':
+        is_authority = blockchain.authority_checker()
+        for row, header in zip(rows, headers):
+            if not is_authority(row["signer"], row["height"]) or not verify_signature(row["signer"], str_to_natural_byte_order(header.block_hash), row["signature"] or ''):
+                raise VerificationError(f"Header {row['height']} is not sealed by an authority of the chain.")
+    elif blockchain.retarget_enabled:
+        # The retarget window reaches below the fork, into blocks both chains share.
+        previous_bits, timestamps = None, deque(maxlen=blockchain.retarget_window)
+        for bits, timestamp in blockchain.iter_headers(("bits", "timestamp"), max(fork_height + 1 - blockchain.retarget_window, 0), fork_height + 1):
+            previous_bits = bits
+            timestamps.append(timestamp)
+        for row, header in zip(rows, headers):
+            if blockchain.retargets_at(row["height"]) and previous_bits is not None and header.bits != blockchain.retarget_bits(row["height"], previous_bits, list(timestamps)):
+                raise VerificationError(f"Header {row['height']} does not follow the difficulty retarget rule.")
+            previous_bits = header.bits
+            timestamps.append(header.timestamp)
+
+    local_work = blockchain.get_chain_work()
+    chain_work = local_work - blockchain.work_above(fork_height) + sum(blockchain.block_work(header.bits) for header in headers)
+    if chain_work <= local_work:
+        return 0
+
+    blocks, pending = [], {}
+    for start in range(0, len(rows), MAX_SYNC_BLOCKS):
+        bodies = node.get_blocks(rows[start]["height"], min(MAX_SYNC_BLOCKS, len(rows) - start))
+        for row, header, body in zip(rows[start:], headers[start:], bodies):
+            if body["height"] != row["height"] or body["block_hash"] != header.block_hash:
+                raise VerificationError(f"Block {row['height']} does not match its header.")
+            block = Block(
+                id=f"{blockchain.id}-{header.block_hash}", blockchain=blockchain,
+                height=row["height"], header_id=header.block_hash, data=body["data"], size=len(body["data"]),
+            )
+            try:
+                # Deltas may build on blocks earlier in this batch, which are not stored yet.
+                root = block.data_merkle_root(pending)
+            except ValueError as e:
+                raise VerificationError(f"Block {row['height']}: {e}") from e
+            if root is not None and root != header.merkle_root:
+                raise VerificationError(f"Block {row['height']} data does not match its Merkle Root.")
+            blocks.append(block)
+            pending[header.block_hash] = block
+    if len(blocks) != len(headers):
+        raise VerificationError("The peer returned fewer blocks than headers.")
+
+    with transaction.atomic():
+        # Existing header rows are reused, only unknown ones are inserted.
+        BlockHeader.objects.bulk_create([
+            BlockHeader(
+                block_hash=header.block_hash, version=header.version, previous_hash=header.previous_hash,
+                merkle_root=header.merkle_root, timestamp=header.timestamp, bits=header.bits, nonce=header.nonce,
+                signer=row["signer"], signature=row["signature"],
+            )
+            for row, header in zip(rows, headers)
+        ], batch_size=1000, ignore_conflicts=True)
+        return blockchain.reorganize(fork_height, blocks, rows[-1]["height"], headers[-1].block_hash, chain_work)
+
+def chain_params(blockchain: Blockchain) -> dict:
+    """The consensus settings a chain file carries, with the authorities as public keys."""
+    params = {field: getattr(blockchain, field) for field in CHAIN_PARAM_FIELDS}
+    params["authorities"] = sorted(key for key in blockchain.authorities.values_list('public_key', flat=True) if key)
+    return params
+
+def iter_chain_export(blockchain: Blockchain, buffer_size: int = EXPORT_BUFFER_SIZE):
+    """
+    Stream ``blockchain`` as a chain file, see ``api.blockstore.chainfile``.
+
+    Headers go out raw and bodies exactly as stored, so nothing is decoded
+    or re-encoded, and blocks are read by keyset pages, so memory stays
+    bounded whatever the length of the chain. Blocks are exported up to the
+    tip at the time of the call.
+
+    Yields:
+        bytes: Pieces of the file of roughly ``buffer_size`` bytes.
+    """
+    tip_height, _ = blockchain.get_tip()
+    yield chain_preamble(chain_params(blockchain))
+    buffer, buffered, count, tip_hash = [], 0, 0, None
+    stop = tip_height + 1 if tip_height is not None else 0
+    for block_hash, *fields, raw, signer, signature, body in blockchain.iter_stored_bodies(EXPORT_FIELDS, 0, stop):
+        record = block_record(bytes(raw) if raw is not None else header_bytes(*fields), body, signer, signature)
+        buffer.append(record)
+        buffered += len(record)
+        count, tip_hash = count + 1, block_hash
+        if buffered >= buffer_size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    buffer.append(chain_trailer(count, tip_hash))
+    yield b"".join(buffer)
+
+def import_chain(reader: ChainFileReader, blockchain: Blockchain | None = None, batch_size: int = 1000) -> Blockchain:
+    """
+    Load a chain file into a new chain, or into the empty ``blockchain``, checking every block as it streams in.
+
+    Each batch of records is checked the way ``validate_chain`` checks a
+    chain (linkage, proof-of-work or authority seals, the retarget rule)
+    and every body against its header's Merkle Root, then written with
+    ``bulk_create``, so memory is bounded by ``batch_size``. The whole import
+    is one transaction: a file that fails part way leaves nothing behind,
+    and one that loads is left validated up to its tip.
+
+    Args:
+        reader (ChainFileReader): The open chain file.
+        blockchain (Blockchain): Chain without blocks to load into; a new chain with the file's parameters when None.
+        batch_size (int): Blocks checked and written at a time.
+
+    Returns:
+        Blockchain: The loaded chain.
+
+    Raises:
+        VerificationError: When the file is incomplete or a block does not check out.
+    """
+    params = reader.params
+    with transaction.atomic():
+        if blockchain is None:
+            # Files written before retarget_height was recorded leave it out.
+            blockchain = Blockchain.objects.create(**{field: params[field] for field in CHAIN_PARAM_FIELDS if field in params})
+            users = list(ChainUser.objects.filter(public_key__in=params["authorities"]))
+            # Seals are only trusted from keys the chain really gets as authorities.
+            unknown = set(params["authorities"]) - {user.public_key for user in users}
+            if unknown:
+                raise VerificationError(f"The chain file names authorities unknown to this node: {', '.join(sorted(unknown))}.")
+            blockchain.authorities.set(users)
+        else:
+            if blockchain.blocks.exists():
+                raise VerificationError("Chain files can only be imported into a chain without blocks.")
+            if blockchain.consensus != params["consensus"]:
+                raise VerificationError(f"The chain file is a {params['consensus']} chain, not {blockchain.consensus}.")
+        is_authority = blockchain.authority_checker()
+
+        height, previous_hash, work = -1, GENESIS_PREVIOUS_HASH, 0
+        previous_bits, timestamps = None, deque(maxlen=blockchain.retarget_window)
+        records = iter(reader)
+        try:
+            while batch := list(islice(records, batch_size)):
+                headers, blocks, pending = [], [], {}
+                for raw, signer, signature, body in batch:
+                    header = Header.parse(raw)
+                    height += 1
+                    if header.previous_hash != previous_hash:
+                        raise VerificationError(f"Block {height} does not link to the block before it.")
+                    if blockchain.consensus == 'poa':
+                        if not is_authority(signer, height) or not verify_signature(signer, str_to_natural_byte_order(header.block_hash), signature or ''):
+                            raise VerificationError(f"Block {height} is not sealed by an authority of the chain.")
+                    elif not header.meets_target():
+                        raise VerificationError(f"Block {height} does not meet its proof-of-work target.")
+                    elif blockchain.retargets_at(height) and previous_bits is not None and (
+                        header.bits != blockchain.retarget_bits(height, previous_bits, list(timestamps))
+                    ):
+                        raise VerificationError(f"Block {height} does not follow the difficulty retarget rule.")
+                    previous_bits, previous_hash = header.bits, header.block_hash
+                    timestamps.append(header.timestamp)
+                    work += blockchain.block_work(header.bits)
+
+                    block = Block(id=f"{blockchain.id}-{header.block_hash}", blockchain=blockchain, height=height, header_id=header.block_hash)
+                    if is_encoded_body(body):
+                        block.body = body
+                    else:
+                        block.data = body.decode('utf-8')
+                    try:
+                        root = block.data_merkle_root(pending)
+                    except ValueError as e:
+                        raise VerificationError(f"Block {height}: {e}") from e
+                    if root is not None and root != header.merkle_root:
+                        raise VerificationError(f"Block {height} data does not match its Merkle Root.")
+                    pending[header.block_hash] = block
+                    blocks.append(block)
+                    headers.append(BlockHeader(
+                        block_hash=header.block_hash, version=header.version, previous_hash=header.previous_hash,
+                        merkle_root=header.merkle_root, timestamp=header.timestamp, bits=header.bits, nonce=header.nonce,
+                        signer=signer, signature=signature,
+                    ))
+                BlockHeader.objects.bulk_create(headers, batch_size=batch_size, ignore_conflicts=True)
+                blockchain.connect_blocks(blocks)
+        except (ChainFileError, UnicodeDecodeError) as e:
+            raise VerificationError(f"Chain file after block {height}: {e}") from e
+        if reader.tip_hash != (previous_hash if height >= 0 else None):
+            raise VerificationError("The chain file does not end at the tip it declares.")
+
+        tip_height, tip_hash = (height, previous_hash) if height >= 0 else (None, None)
+        Blockchain.objects.filter(pk=blockchain.pk).update(tip_height=tip_height, tip_hash=tip_hash, chain_work=work)
+        blockchain.tip_height, blockchain.tip_hash, blockchain.chain_work = tip_height, tip_hash, work
+        if height >= 0:
+            blockchain._save_checkpoint(height, previous_hash, work)
+        blockchain.prune_after_commit()
+    return blockchain
+
+class SyncHeadersAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user."}, status=400)
+        locator = request.data.get("locator", [])
+        try:
+            count = min(int(request.data.get("count", MAX_SYNC_HEADERS)), MAX_SYNC_HEADERS)
+        except (TypeError, ValueError):
+            return Response({"error": "count must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fork = blockchain.find_fork(locator)
+        start = fork[0] + 1 if fork else 0
+        headers = [
+            {"height": height, "header": (raw or header_bytes(*fields)).hex(), "signer": signer, "signature": signature}
+            for height, *fields, raw, signer, signature in blockchain.iter_headers(SYNC_HEADER_FIELDS, start, start + count)
+        ]
+        tip_height, tip_hash = blockchain.get_tip()
+        return Response({
+            "consensus": blockchain.consensus,
+            "fork_height": start - 1,
+            "tip_height": tip_height if tip_height is not None else -1,
+            "tip_hash": tip_hash,
+            "chain_work": str(blockchain.get_chain_work()),
+            "headers": headers,
+        }, status=status.HTTP_200_OK)
+
+class SyncBlocksAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user."}, status=400)
+        try:
+            start = int(request.GET.get('from', 0))
+            count = min(int(request.GET.get('count', MAX_SYNC_BLOCKS)), MAX_SYNC_BLOCKS)
+        except ValueError:
+            return Response({"error": "from and count must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        blocks = [
+            {"height": height, "block_hash": header_id, "data": data}
+            for height, header_id, data in blockchain.iter_chain(("height", "header_id", "data"), start, start + count)
+        ]
+        return Response({"blocks": blocks}, status=status.HTTP_200_OK)
+
+class ChainExportAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        blockchain = request.user.chain_user.blockchain
+        if not blockchain:
+            return Response({"error": "No blockchain associated with this user."}, status=400)
+        response = StreamingHttpResponse(iter_chain_export(blockchain), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="{blockchain.pk}.chain"'
+        return response
+
+class ChainImportAPI(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, format=None):
+        try:
+            blockchain = import_chain(ChainFileReader(request.stream))
+        except (ChainFileError, VerificationError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        tip_height, tip_hash = blockchain.get_tip()
+        return Response({
+            "blockchain": str(blockchain.pk),
+            "tip_height": tip_height if tip_height is not None else -1,
+            "tip_hash": tip_hash,
+            "chain_work": str(blockchain.get_chain_work()),
+        }, status=status.HTTP_201_CREATED)
@@ -39,6 +39,7 @@ class UserSignupAPI(APIView):
             blockchain = Blockchain.objects.create()
             chain_user = ChainUser.objects.create(user=user, blockchain=blockchain)
             private_key, public_key = chain_user.generate_keys()
+            blockchain.authorities.add(chain_user)
             login(request, user)
 
             return Response({
@@ -127,6 +127,50 @@ USE_TZ = True
 
 LOGIN_URL = '/api/login/'
 
+# Mining
+# Number of processes used for the nonce search, 1 keeps mining in-process.
+MINING_WORKERS = int(env('MINING_WORKERS', default=os.cpu_count() or 1))
+# Proof-of-work hashing engine: "hashlib", or "numpy" when numpy is installed.
+MINING_BACKEND = env('MINING_BACKEND', default='hashlib')
+# Threads that run queued mining jobs in the background.
+MINING_JOB_WORKERS = int(env('MINING_JOB_WORKERS', default=2))
+# Seconds after which recover_mining_jobs treats a queued or running job as abandoned.
+MINING_JOB_STALE_AFTER = int(env('MINING_JOB_STALE_AFTER', default=3600))
+# Limits on how many pending journals, and how many bytes of block data, go into one block.
+MEMPOOL_MAX_BLOCK_JOURNALS = int(env('MEMPOOL_MAX_BLOCK_JOURNALS', default=100))
+MEMPOOL_MAX_BLOCK_SIZE = int(env('MEMPOOL_MAX_BLOCK_SIZE', default=1_000_000))
+# Processes that recompute header hashes during chain validation, 1 keeps it in-process.
+VALIDATION_WORKERS = int(env('VALIDATION_WORKERS', default=os.cpu_count() or 1))
+# How block headers are stored: "text" hex columns, or "binary" 80-byte headers and 32-byte hashes.
+HEADER_STORAGE = env('HEADER_STORAGE', default='text')
+
+# Block bodies
+# How new bodies are encoded: "json" or "binary" (canonical, raw 32-byte txids). Both stay readable.
+BLOCK_ENCODING = env('BLOCK_ENCODING', default='json')
+# Compression of binary bodies: "none", "zlib", "lzma", or "auto" for whichever is smallest per block.
+BLOCK_COMPRESSION = env('BLOCK_COMPRESSION', default='auto')
+# A block lists only a journal's txid changes since its previous block, with the full list every this many blocks. 1 disables deltas.
+JOURNAL_SNAPSHOT_INTERVAL = int(env('JOURNAL_SNAPSHOT_INTERVAL', default=32))
+# Where new block bodies go: "database" keeps them in Block.data, "flatfile" appends them to segment files.
+BLOCK_STORE = env('BLOCK_STORE', default='database')
+BLOCK_STORE_PATH = env('BLOCK_STORE_PATH', default=os.path.join(BASE_DIR, 'blocks'))
+# Segment files are rotated once they would grow past this many bytes.
+BLOCK_STORE_SEGMENT_SIZE = int(env('BLOCK_STORE_SEGMENT_SIZE', default=128 * 1024 * 1024))
+# Bodies a bulk write appends between fsyncs. Every write is synced before its transaction commits.
+BLOCK_STORE_FSYNC_EVERY = int(env('BLOCK_STORE_FSYNC_EVERY', default=64))
+# Bodies of blocks at least this deep below the tip move to compressed archive files. 0 keeps every body live.
+PRUNE_DEPTH = int(env('PRUNE_DEPTH', default=0))
+BLOCK_ARCHIVE_PATH = env('BLOCK_ARCHIVE_PATH', default=os.path.join(BASE_DIR, 'archive'))
+# Consecutive heights per archive file, which is decompressed as a whole on read.
+BLOCK_ARCHIVE_CHUNK = int(env('BLOCK_ARCHIVE_CHUNK', default=1000))
+
+# Ledger amounts
+# How new amounts are stored: "decimal" columns, or "minor" for 64-bit integer minor units summed as integers in SQL. Both stay readable.
+AMOUNT_STORAGE = env('AMOUNT_STORAGE', default='decimal')
+# Decimal places of each company's currency as JSON, e.g. {"Acme KK": 0, "Acme BH": 3}; a journal keeps the scale it was created with.
+CURRENCY_SCALES = env.json('CURRENCY_SCALES', default={})
+DEFAULT_CURRENCY_SCALE = int(env('DEFAULT_CURRENCY_SCALE', default=2))
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 